@@ -0,0 +1,285 @@
+import os
+import argparse
+import asyncio
+import time
+import uuid
+import utils
+import rate_limiter
+import client_registry
+import response_cache
+import fake_llm
+import cassette
+import compaction
+import bert_scorer
+import bert_pool
+import checkpoint
+import rubric_coverage
+
+from dataclasses import asdict
+from dotenv import load_dotenv, find_dotenv
+from physics_student import AsyncPhysicsStudentSimulator, StudentProfile, simp_profile_gen
+from gpt_evaluator import AsyncGPTEvaluator, add_scoring_steps, async_bert_scores_batch, async_rubric_coverage, graph_log_row
+from physics_tutor import AsyncPhysicsTutorSimulator
+from instrumentation import CallTracer
+from checkpoint import RunProgress
+from eval_graph import EvalGraph
+from sweep_planner import read_jobs
+from results_store import ResultsStore
+from stop_policy import ConversationState, StopPolicy, build_stop_policy, add_stop_policy_args, stop_policy_from_args
+
+# Profiles used for the sweeps recorded in data/data.csv
+default_profiles = [
+    ("1", "highMotivation"),
+    ("1", "lowMotivation"),
+    ("5", "highMotivation"),
+    ("5", "lowMotivation"),
+    ("5", "dontCare"),
+]
+
+def create_async_LLM_agents(profile, prompt_cache=False, tracer=None, if_simplified=True):
+    claude_student_simulator = AsyncPhysicsStudentSimulator(os.environ.get("ANTHROPIC_API_KEY"), profile, utils.physics_problem, if_simplified=if_simplified, prompt_cache=prompt_cache, tracer=tracer)
+    gpt_tutor_simulator = AsyncPhysicsTutorSimulator(os.environ.get("OPENAI_API_KEY"), prompt_cache=prompt_cache, tracer=tracer)
+    gpt_evaluator = AsyncGPTEvaluator(os.environ.get("OPENAI_API_KEY"), prompt_cache=prompt_cache, tracer=tracer)
+    return claude_student_simulator, gpt_tutor_simulator, gpt_evaluator
+
+async def run_session(progress: RunProgress, stop_policy: StopPolicy, prompt_cache: bool = False, usage: dict = None, trace_path: str = None, store: ResultsStore = None,
+                      evaluate: bool = True, until_turn: int = None):
+    """
+    Run one tutor-student conversation end to end, or from its last checkpoint, and record its log row.
+
+    With evaluate=False the session stops once both summaries are checkpointed and returns None;
+    the run stays queued for a later --evaluate-pending. With until_turn the session is a fork trunk:
+    it stops after that many turns (or earlier, if the stop policy says so), is checkpointed as
+    forked and returns None.
+    """
+    store = store or ResultsStore()
+    profile = progress.student_profile()
+    tracer = CallTracer(session_id=progress.run_id, trace_path=trace_path)
+    claude_student_simulator, gpt_tutor_simulator, gpt_evaluator = create_async_LLM_agents(profile, prompt_cache=prompt_cache, tracer=tracer,
+                                                                                            if_simplified=progress.space == "simplified")
+    progress.restore(gpt_tutor_simulator, claude_student_simulator, tracer)
+    # SQLite writes block, so checkpoints are saved off the event loop
+    save = lambda: asyncio.to_thread(progress.save, store, gpt_tutor_simulator, claude_student_simulator, tracer)
+
+    student_response = progress.student_response
+    state = progress.conversation_state()
+    tutor_response_len = progress.tutor_response_len
+    student_response_len = progress.student_response_len
+    stop_reason = progress.stop_reason
+    while not stop_reason and (until_turn is None or state.turns < until_turn):
+        tutor_response = await gpt_tutor_simulator.generate_response(student_response=student_response)
+        student_response = await claude_student_simulator.generate_response(tutor_question=tutor_response)
+
+        state.turns += 1
+        state.total_tokens = gpt_tutor_simulator.total_tokens + claude_student_simulator.total_tokens
+        state.tutor_response = tutor_response
+        state.student_response = student_response
+        tutor_response_len += len(tutor_response)
+        student_response_len += len(student_response)
+        stop_reason = stop_policy.should_stop(state)
+        progress.record_turn(state, tutor_response_len, student_response_len)
+        progress.stop_reason = stop_reason
+        await save()
+    if until_turn is not None:
+        progress.stage = checkpoint.FORKED
+        await save()
+        if usage is not None:
+            usage["tutor"].extend(gpt_tutor_simulator.call_usage)
+            usage["student"].extend(claude_student_simulator.call_usage)
+        print(f"[{progress.run_id}] {profile} shared prefix of {state.turns} turns" + (f" (stopped early: {stop_reason})" if stop_reason else ""))
+        return None
+    print(f"[{progress.run_id}] {profile} stopped after {state.turns} turns ({stop_reason})")
+
+    # Summaries and scores as one dependency graph, see main.py
+    async def summarize_tutor():
+        if progress.tutor_summary is not None:
+            return progress.tutor_summary
+        return await gpt_tutor_simulator.generate_response(student_response="Can you provide a concise summary of the key steps you've given to solve the question?")
+
+    async def summarize_student():
+        if progress.student_summary is not None:
+            return progress.student_summary
+        return await claude_student_simulator.generate_response(tutor_question="Can you provide a concise summary of the key steps you've learned to solve the question?")
+
+    async def checkpoint_summaries(tutor_summary, student_summary):
+        if progress.stage == checkpoint.CONVERSATION:
+            progress.tutor_summary, progress.student_summary = tutor_summary, student_summary
+            progress.stage = checkpoint.SUMMARIZED
+            await save()
+
+    graph = EvalGraph()
+    graph.add("tutor_summary", summarize_tutor)
+    graph.add("student_summary", summarize_student)
+    graph.add("checkpoint", checkpoint_summaries, "tutor_summary", "student_summary")
+    if evaluate:
+        transcript = rubric_coverage.transcript_from_history(checkpoint.opening_message, claude_student_simulator.conversation_history, state.turns)
+        add_scoring_steps(graph, gpt_evaluator, bert_scores=async_bert_scores_batch, transcript=transcript, coverage=async_rubric_coverage)
+    await graph.arun()
+    if not evaluate:
+        if usage is not None:
+            usage["tutor"].extend(gpt_tutor_simulator.call_usage)
+            usage["student"].extend(claude_student_simulator.call_usage)
+        return None
+    row = graph_log_row(profile, gpt_evaluator, gpt_tutor_simulator.get_conversation_history(), graph, state.turns, tutor_response_len, student_response_len, stop_reason)
+    await asyncio.to_thread(utils.write_data, row, progress.run_id)
+    await asyncio.to_thread(store.write_coverage, progress.run_id, graph.results["coverage"][0])
+    progress.stage = checkpoint.DONE
+    await save()
+    if usage is not None:
+        usage["tutor"].extend(gpt_tutor_simulator.call_usage)
+        usage["student"].extend(claude_student_simulator.call_usage)
+        usage["evaluator"].extend(gpt_evaluator.call_usage)
+    return row
+
+async def run_batch(profiles, repeats: int = 1, max_concurrency: int = 4, stop_policy: StopPolicy = None, prompt_cache: bool = False, usage: dict = None, trace_path: str = None,
+                    resume: list = (), evaluate: bool = True, trunk: RunProgress = None, fork_at: int = None, jobs: list = ()):
+    """
+    Simulate every profile `repeats` times with at most `max_concurrency` sessions in flight.
+
+    `resume` lists run_ids of interrupted sessions to continue from their checkpoints alongside the new ones.
+    `jobs` are sweep_planner Jobs, one session each, whose student prompt matches the job's profile space.
+    With `trunk`, the new sessions branch off that run instead of starting from the opening message: its
+    first `fork_at` turns are generated once (when not given, it is forked where its checkpoint stands),
+    then every branch continues a copy of that conversation with its own profile. Branch lineage is
+    recorded in the results store.
+    Returns a list with one entry per session: the log row (None when not evaluating), or the exception that ended it.
+    Per-call usage is appended to `usage["tutor" | "student" | "evaluator"]` when given.
+    """
+    # Unattended runs always need a hard limit
+    stop_policy = stop_policy or build_stop_policy(max_turns=20)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    store = ResultsStore()
+
+    async def bounded_session(progress):
+        async with semaphore:
+            return await run_session(progress, stop_policy, prompt_cache=prompt_cache, usage=usage, trace_path=trace_path, store=store, evaluate=evaluate)
+
+    runs = [RunProgress.load(store, run_id) for run_id in resume]
+    runs = [progress for progress in runs if progress.stage != checkpoint.DONE]
+    for progress in runs:
+        if progress.stage == checkpoint.FORKED:
+            raise ValueError(f"Run {progress.run_id} is a fork trunk; branch it with fork_from instead of resuming it")
+    if trunk is not None:
+        if jobs:
+            raise ValueError("Jobs can't be forked; pass their profiles to a batch without a trunk")
+        if trunk.stage not in (checkpoint.CONVERSATION, checkpoint.FORKED):
+            raise ValueError(f"Run {trunk.run_id} is already {trunk.stage}; only conversations that haven't been summarized can be forked")
+        if fork_at is not None and trunk.turns < fork_at and not trunk.stop_reason:
+            # The shared prefix is generated once, so every branch's first call can hit the prompt cache it warmed
+            await run_session(trunk, stop_policy, prompt_cache=prompt_cache, usage=usage, trace_path=trace_path, store=store, until_turn=fork_at)
+        elif trunk.stage != checkpoint.FORKED:
+            trunk.stage = checkpoint.FORKED
+            await asyncio.to_thread(store.save_checkpoint, trunk.run_id, trunk.stage, asdict(trunk))
+        branches = [trunk.fork(uuid.uuid4().hex, profile) for profile in profiles for repeat in range(repeats)]
+        for branch in branches:
+            await asyncio.to_thread(store.record_fork, branch.run_id, trunk.run_id, branch.fork_turn)
+        runs += branches
+    else:
+        runs += [
+            RunProgress.start(uuid.uuid4().hex, profile)
+            for profile in profiles
+            for repeat in range(repeats)
+        ]
+        runs += [RunProgress.start(uuid.uuid4().hex, job.profile(), space=job.space) for job in jobs]
+    results = await asyncio.gather(*[bounded_session(progress) for progress in runs], return_exceptions=True)
+    # The shared pools belong to this event loop
+    await client_registry.aclose()
+    return results
+
+def parse_profile(spec: str) -> StudentProfile:
+    # "<knowledge_level>:<engagement_style>", e.g. "1:lowMotivation"
+    knowledge_level, engagement_style = spec.split(":")
+    return simp_profile_gen(knowledge_level=knowledge_level, engagement_style=engagement_style)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many tutor-student simulations concurrently.")
+    parser.add_argument("--profile", action="append", dest="profiles", help="knowledge_level:engagement_style, may be repeated")
+    parser.add_argument("--jobs", default=None, help="Job list written by sweep_planner.py; one conversation per line")
+    parser.add_argument("--repeats", type=int, default=1, help="Conversations per profile")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Maximum sessions in flight")
+    parser.add_argument("--resume", action="append", default=[], metavar="RUN_ID", help="Continue an interrupted session, may be repeated")
+    parser.add_argument("--generate-only", action="store_true", help="Stop sessions after their summaries and queue them for evaluation")
+    parser.add_argument("--evaluate-pending", action="store_true", help="Evaluate every run queued by --generate-only")
+    parser.add_argument("--fork-at", type=int, default=None, metavar="K",
+                        help="Generate the first K turns once and branch them into a session per profile and repeat")
+    parser.add_argument("--trunk-profile", default=None, help="knowledge_level:engagement_style of the student in the shared turns (default: the first profile)")
+    parser.add_argument("--fork-from", default=None, metavar="RUN_ID", help="Branch the sessions off this run's checkpointed conversation")
+    add_stop_policy_args(parser, interactive=False)
+    parser.add_argument("--prompt-cache", action="store_true", help="Enable provider-side prompt caching")
+    response_cache.add_response_cache_args(parser)
+    rate_limiter.add_rate_limit_args(parser)
+    client_registry.add_client_args(parser)
+    fake_llm.add_fake_llm_args(parser)
+    cassette.add_cassette_args(parser)
+    compaction.add_compaction_args(parser)
+    bert_scorer.add_scoring_args(parser)
+    rubric_coverage.add_coverage_args(parser)
+    bert_pool.add_bert_pool_args(parser)
+    parser.add_argument("--trace", default=None, help="Append one JSON line per LLM call to this file")
+    args = parser.parse_args()
+    cache = response_cache.configure_from_args(args)
+    rate_limiter.configure_from_args(args)
+    client_registry.configure_from_args(args)
+    fake_backend = fake_llm.configure_from_args(args)
+    recording = cassette.configure_from_args(args)
+    compaction.configure_from_args(args)
+    bert_scorer.configure_from_args(args)
+    rubric_coverage.configure_from_args(args)
+    # Workers load the model while the first conversations are generated
+    scoring_pool = bert_pool.configure_from_args(args)
+
+    # Load enviornment for LLM APIs
+    _ = load_dotenv(find_dotenv())
+    if args.evaluate_pending:
+        args.resume += [run_id for run_id, _, _ in ResultsStore().unfinished_runs(checkpoint.SUMMARIZED)]
+    # Resuming only finishes the given runs unless new profiles are asked for too
+    specs = args.profiles or ([] if args.resume or args.jobs or args.evaluate_pending else [f"{k}:{e}" for k, e in default_profiles])
+    profiles = [parse_profile(spec) for spec in specs]
+    jobs = read_jobs(args.jobs) if args.jobs else []
+
+    forking = args.fork_from or args.fork_at is not None
+    if forking and jobs:
+        parser.error("--jobs can't be forked: branches take their profiles from --profile, and job profiles may need the full student prompt")
+    if forking and not profiles:
+        parser.error("forking needs at least one --profile for the branches")
+    for run_id in args.resume:
+        if RunProgress.load(ResultsStore(), run_id).stage == checkpoint.FORKED:
+            parser.error(f"run {run_id} is a fork trunk; branch it with --fork-from {run_id} --profile ... instead of resuming it")
+
+    trunk = None
+    if args.fork_from:
+        trunk = RunProgress.load(ResultsStore(), args.fork_from)
+    elif args.fork_at is not None:
+        trunk_profile = parse_profile(args.trunk_profile) if args.trunk_profile else profiles[0]
+        trunk = RunProgress.start(uuid.uuid4().hex, trunk_profile)
+    if trunk:
+        print(f"Forking {len(profiles) * args.repeats} sessions from run {trunk.run_id}")
+
+    usage = {"tutor": [], "student": [], "evaluator": []}
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(profiles, repeats=args.repeats, max_concurrency=args.max_concurrency, stop_policy=stop_policy_from_args(args),
+                                    prompt_cache=args.prompt_cache, usage=usage, trace_path=args.trace, resume=args.resume,
+                                    evaluate=not args.generate_only, trunk=trunk, fork_at=args.fork_at, jobs=jobs))
+    failures = [r for r in results if isinstance(r, BaseException)]
+    for failure in failures:
+        print(f"Session failed: {failure!r}")
+    print(f"Finished {len(results) - len(failures)}/{len(results)} sessions in {time.perf_counter() - start:.1f}s")
+    evaluation_times = sorted(row[utils.headers.index('evaluation_time')] for row in results if isinstance(row, list))
+    if evaluation_times:
+        print(f"Evaluation latency per conversation: p50 {evaluation_times[len(evaluation_times) // 2]:.2f}s, "
+              f"p95 {evaluation_times[min(len(evaluation_times) - 1, int(0.95 * len(evaluation_times)))]:.2f}s, max {evaluation_times[-1]:.2f}s")
+    utils.print_usage_report(usage)
+    if cache:
+        print(cache.stats())
+    rate_limiter.print_stats()
+    client_registry.print_stats()
+    if fake_backend:
+        print(fake_backend.stats())
+    if recording:
+        recording.print_report()
+    if scoring_pool:
+        print(scoring_pool.stats())
+        bert_pool.shutdown()
+
+if __name__ == "__main__":
+    main()
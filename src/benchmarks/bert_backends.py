@@ -0,0 +1,102 @@
+"""
+BERTScore backend comparison: throughput, peak RSS and agreement with the reference F1 scores
+stored in data/cleaned_df.csv (torch microsoft/deberta-xlarge-mnli) for each runtime:model spec.
+Every spec runs in a fresh process so its peak RSS is its own.
+
+Run from src/: python -m benchmarks.bert_backends [--specs torch:roberta-large int8:microsoft/deberta-xlarge-mnli ...] [--threads 4]
+"""
+import argparse
+import csv
+import multiprocessing
+import resource
+import time
+import utils
+
+from concurrent.futures import ProcessPoolExecutor
+
+data_path = '../data/cleaned_df.csv'
+default_specs = [
+    "torch:microsoft/deberta-xlarge-mnli",
+    "int8:microsoft/deberta-xlarge-mnli",
+    "onnx:microsoft/deberta-xlarge-mnli",
+    "torch:microsoft/deberta-base-mnli",
+    "torch:roberta-large",
+    "torch:distilbert-base-uncased",
+]
+
+def load_reference_scores(path=data_path):
+    # (summary, stored BERT F1) for every tutor and student summary
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    pairs = [(row['tutor_summary'], row['BERT_score_Tutor']) for row in rows]
+    pairs += [(row['student_summary'], row['BERT_score_Student']) for row in rows]
+    return [(summary, float(score)) for summary, score in pairs if summary and score]
+
+def ranks(values):
+    # Average ranks, so ties don't bias the correlation
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    result = [0.0] * len(values)
+    start = 0
+    while start < len(order):
+        end = start
+        while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+            end += 1
+        for position in range(start, end + 1):
+            result[order[position]] = (start + end) / 2
+        start = end + 1
+    return result
+
+def spearman(a, b):
+    ra, rb = ranks(a), ranks(b)
+    mean_a, mean_b = sum(ra) / len(ra), sum(rb) / len(rb)
+    covariance = sum((x - mean_a) * (y - mean_b) for x, y in zip(ra, rb))
+    spread = (sum((x - mean_a) ** 2 for x in ra) * sum((y - mean_b) ** 2 for y in rb)) ** 0.5
+    return covariance / spread if spread else float("nan")
+
+def measure(spec, summaries, threads, batch_size):
+    # Runs in its own process
+    import torch
+    import bert_scorer
+    torch.set_num_threads(threads)
+    runtime, model_type = spec.split(":", 1)
+    start = time.perf_counter()
+    scorer = bert_scorer.BERTScorer(model_type=model_type, runtime=runtime, batch_size=batch_size, device="cpu")
+    scorer.reference_stats(utils.question_summary_prompt)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = [f for _, _, f in scorer.score(summaries, utils.question_summary_prompt)]
+    elapsed = time.perf_counter() - start
+    return {
+        "load_time": load_time,
+        "throughput": len(summaries) / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scores": scores,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--specs", nargs="+", default=default_specs, help="runtime:model, runtime one of torch, int8, onnx")
+    parser.add_argument("--threads", type=int, default=4, help="Torch / ONNX Runtime threads")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=None, help="Only score the first N summaries")
+    args = parser.parse_args()
+
+    pairs = load_reference_scores()[:args.limit]
+    summaries = [summary for summary, _ in pairs]
+    stored = [score for _, score in pairs]
+    print(f"{len(summaries)} summaries from {data_path}, {args.threads} threads\n")
+    print(f"{'spec':<42}{'load s':>8}{'summ/s':>9}{'RSS MiB':>9}{'spearman':>10}{'mean |dF1|':>12}")
+    for spec in args.specs:
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(measure, spec, summaries, args.threads, args.batch_size).result()
+        except Exception as error:
+            print(f"{spec:<42}  failed: {error!r}")
+            continue
+        # Absolute differences are only meaningful for the reference model; rank agreement is comparable across models
+        mean_diff = sum(abs(a - b) for a, b in zip(result["scores"], stored)) / len(stored)
+        print(f"{spec:<42}{result['load_time']:>8.1f}{result['throughput']:>9.2f}{result['peak_rss_mb']:>9.0f}"
+              f"{spearman(result['scores'], stored):>10.3f}{mean_diff:>12.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Per-summary BERTScore latency: one bert_score.score() call per summary (the old path) versus the
+long-lived batched scorer in bert_scorer.py, over the summaries stored in data/cleaned_df.csv.
+
+Run from src/: python -m benchmarks.bert_score_latency [--before N] [--after N] [--device cpu]
+"""
+import argparse
+import csv
+import time
+import utils
+
+from bert_score import score
+from bert_scorer import BERTScorer, default_model_type
+
+data_path = '../data/cleaned_df.csv'
+
+def load_summaries(path=data_path):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    return [row['tutor_summary'] for row in rows] + [row['student_summary'] for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--before", type=int, default=4, help="Summaries scored with per-call bert_score.score()")
+    parser.add_argument("--after", type=int, default=100, help="Summaries scored with the batched scorer")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    summaries = load_summaries()
+    reference = utils.question_summary_prompt
+
+    # Before: every call rebuilds the model for a single pair
+    before_scores = []
+    start = time.perf_counter()
+    for summary in summaries[:args.before]:
+        p, r, f = score([summary], [reference], lang='en', model_type=default_model_type, device=args.device)
+        before_scores.append(f.item())
+    before = (time.perf_counter() - start) / max(args.before, 1)
+
+    # After: load once, embed the reference once, score in batches
+    start = time.perf_counter()
+    scorer = BERTScorer(batch_size=args.batch_size, device=args.device)
+    scorer.reference_stats(reference)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    after_scores = [f for _, _, f in scorer.score(summaries[:args.after], reference)]
+    after = (time.perf_counter() - start) / max(args.after, 1)
+
+    max_diff = max((abs(a - b) for a, b in zip(before_scores, after_scores)), default=0.0)
+    print(f"Model: {default_model_type} on {args.device}")
+    print(f"Before: {before:.2f}s per summary ({args.before} summaries)")
+    print(f"After:  {after:.2f}s per summary ({args.after} summaries, batch size {args.batch_size}) + {load_time:.1f}s one-time load")
+    print(f"Speedup: {before / after:.1f}x, max |F1 difference| on shared summaries: {max_diff:.2e}")
+
+if __name__ == "__main__":
+    main()
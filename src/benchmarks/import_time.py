@@ -0,0 +1,86 @@
+"""
+Startup cost of the entry points, from `python -X importtime`: total import time, the slowest
+packages, and whether torch was pulled in. The "eager" scenario imports the entry point as it was
+at --baseline-rev, the last revision whose bert_scorer imported torch and bert_score at module
+level, extracted from git into a temporary directory; the "deferred" scenario imports the working tree's.
+
+Run from src/: python -m benchmarks.import_time [--modules main batch_runner] [--repeats 5] [--top 8]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from collections import defaultdict
+
+# Parent of the commit that deferred the scoring imports
+baseline_rev = "0e14301"
+
+def extract_src(rev: str, directory: str) -> str:
+    # src/ as it was at `rev`, so the old entry points are measured rather than approximated
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(["git", "-C", root, "archive", "--format=tar", rev, "src"], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return os.path.join(directory, "src")
+
+def import_times(statement, cwd=None):
+    # {module: cumulative microseconds} for one fresh interpreter
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, cwd=cwd)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown by two extra spaces per level; only top-level imports add up to the total
+        top_level = not name.startswith("  ")
+        times[name.strip()] = (int(cumulative), top_level)
+    return times
+
+def summarize(statement, entry_point, repeats, cwd=None):
+    totals = []
+    packages = defaultdict(list)
+    loaded_torch = False
+    for _ in range(repeats):
+        times = import_times(statement, cwd)
+        totals.append(sum(us for us, top_level in times.values() if top_level))
+        loaded_torch = loaded_torch or "torch" in times
+        # A package's cost is its root module's cumulative time, wherever in the tree it was first imported
+        for name, (us, _) in times.items():
+            if "." not in name and name != entry_point:
+                packages[name].append(us)
+    return statistics.median(totals), {name: statistics.median(values) for name, values in packages.items()}, loaded_torch
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["main", "batch_runner"])
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per scenario; medians are reported")
+    parser.add_argument("--top", type=int, default=8, help="Slowest packages to list")
+    parser.add_argument("--baseline-rev", default=baseline_rev, help="Git revision of the eager entry points")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_src = extract_src(args.baseline_rev, directory)
+        for module in args.modules:
+            for scenario, cwd in (("eager", baseline_src), ("deferred", None)):
+                if not os.path.exists(os.path.join(cwd or ".", f"{module}.py")):
+                    print(f"{module} ({scenario}): not in {args.baseline_rev if cwd else 'the working tree'}\n")
+                    continue
+                try:
+                    total, packages, loaded_torch = summarize(f"import {module}", module, args.repeats, cwd)
+                except RuntimeError as error:
+                    print(f"{module} ({scenario}): failed: {error}\n")
+                    continue
+                print(f"{module} ({scenario}): {total / 1000:.0f} ms, torch {'loaded' if loaded_torch else 'not loaded'}")
+                for name, us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+                    print(f"  {name:<28}{us / 1000:>8.1f} ms")
+                print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+End-to-end pipeline throughput on the offline fake LLM backend: full batch_runner sessions (turns,
+summaries, BERTScore, LLM scoring, results store) at several concurrency levels, reporting
+conversations/min, per-stage latency (including the end-of-run evaluation graph) and peak memory.
+Costs nothing and needs no network once the BERTScore model is cached.
+
+Run from src/: python -m benchmarks.pipeline_throughput [--conversations 20] [--concurrency 1 4 16] [--bert-workers 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+import bert_pool
+import fake_llm
+import rate_limiter
+import results_store
+import utils
+
+from collections import defaultdict
+from batch_runner import default_profiles, parse_profile, run_batch
+from instrumentation import percentile
+
+def stage_latencies(trace_path, results):
+    # Splits every session's trace into conversation (turns + summaries) and the scoring that outlasts it;
+    # evaluation is the summaries-and-scores graph's own wall time from the log rows
+    calls = defaultdict(list)
+    with open(trace_path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record["error"] is None:
+                calls[record["session_id"]].append(record)
+    stages = defaultdict(list)
+    for records in calls.values():
+        dialogue = [r for r in records if r["agent"] in ("tutor", "student")]
+        scoring = [r for r in records if r["agent"] == "evaluator"]
+        if not dialogue or not scoring:
+            continue
+        start = min(r["started_at"] for r in dialogue)
+        dialogue_end = max(r["started_at"] + r["wall_time"] for r in dialogue)
+        end = max(r["started_at"] + r["wall_time"] for r in scoring)
+        stages["conversation"].append(dialogue_end - start)
+        stages["scoring_tail"].append(end - dialogue_end)
+        stages["session"].append(end - start)
+        for r in dialogue:
+            stages[f"{r['agent']}_call"].append(r["wall_time"])
+    stages["evaluation"] = [row[utils.headers.index('evaluation_time')] for row in results if isinstance(row, list)]
+    return stages
+
+def run_level(concurrency, args, workdir):
+    results_store.db_path = os.path.join(workdir, f"results_{concurrency}.sqlite")
+    trace_path = os.path.join(workdir, f"trace_{concurrency}.jsonl")
+    backend = fake_llm.configure(fake_llm.FakeLLMConfig(
+        latency_ms=args.latency_ms, error_rate=args.error_rate, wrap_up_after=args.wrap_up_after, seed=args.seed))
+    for provider in ("openai", "anthropic"):
+        rate_limiter.configure(provider, max_concurrency=max(16, 2 * concurrency), base_delay=0.05)
+    profiles = [parse_profile(f"{k}:{e}") for k, e in default_profiles]
+    profiles = [profiles[i % len(profiles)] for i in range(args.conversations)]
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(profiles, max_concurrency=concurrency, trace_path=trace_path))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+
+    failures = [r for r in results if isinstance(r, BaseException)]
+    print(f"\nconcurrency {concurrency}: {len(results) - len(failures)}/{len(results)} conversations in {elapsed:.1f}s "
+          f"= {(len(results) - len(failures)) / elapsed * 60:.1f} conversations/min")
+    for failure in failures[:3]:
+        print(f"  failed: {failure!r}")
+    print(f"  {backend.stats()}; {rate_limiter.get_limiter('openai').stats()}")
+    print(f"  peak Python heap {peak / 2**20:.1f} MiB, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    print(f"  {'stage':<14}{'p50 s':>9}{'p95 s':>9}{'mean s':>9}")
+    for stage, values in stage_latencies(trace_path, results).items():
+        print(f"  {stage:<14}{percentile(values, 50):>9.2f}{percentile(values, 95):>9.2f}{statistics.mean(values):>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency-ms", type=float, default=fake_llm.FakeLLMConfig.latency_ms)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Share of calls answered with a 429")
+    parser.add_argument("--wrap-up-after", type=int, default=fake_llm.FakeLLMConfig.wrap_up_after)
+    parser.add_argument("--seed", type=int, default=0)
+    bert_pool.add_bert_pool_args(parser)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    scoring_pool = bert_pool.configure_from_args(args)
+    if scoring_pool:
+        # Keep model loading out of the first level's numbers
+        scoring_pool.wait_ready()
+    with tempfile.TemporaryDirectory() as workdir:
+        for concurrency in args.concurrency:
+            run_level(concurrency, args, workdir)
+    if scoring_pool:
+        print(scoring_pool.stats())
+        bert_pool.shutdown()
+
+if __name__ == "__main__":
+    main()
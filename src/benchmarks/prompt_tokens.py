@@ -0,0 +1,99 @@
+"""
+Before/after input-token report for PhysicsStudentSimulator over the transcripts in data/data.csv.
+
+"Before" replays the old single-prompt layout, which re-rendered the profile, the problem and the
+repr of the whole history (including Anthropic Message objects) into every call. "After" replays the
+current system prompt plus native multi-turn messages. Counts use utils.estimate_tokens.
+
+Run from src/: python -m benchmarks.prompt_tokens [--history-token-budget N]
+"""
+import argparse
+import csv
+import itertools
+import utils
+
+from physics_student import PhysicsStudentSimulator, simp_profile_gen
+
+data_path = '../data/data.csv'
+
+def load_conversations(path=data_path):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    conversations = []
+    for obs_id, group in itertools.groupby(rows, key=lambda row: row['obs_id']):
+        group = sorted(group, key=lambda row: int(row['turn']))
+        student = next(row['speaker'] for row in group if row['speaker'] != 'gpt-tutor')
+        conversations.append((obs_id, student, group))
+    return conversations
+
+def profile_from_speaker(speaker):
+    # e.g. "student-Novice-highMotivation"
+    _, level, engagement_style = speaker.split('-')
+    return simp_profile_gen(knowledge_level="1" if level == "Novice" else "5", engagement_style=engagement_style)
+
+def legacy_message_repr(text, turn):
+    # Shape of the anthropic.types.Message repr the old code embedded in its prompt
+    return (f"Message(id='msg_{turn:024d}', content=[TextBlock(citations=None, text={text!r}, type='text')], "
+            f"model='claude-3-5-haiku-20241022', role='assistant', stop_reason='end_turn', stop_sequence=None, "
+            f"type='message', usage=Usage(cache_creation_input_tokens=0, cache_read_input_tokens=0, input_tokens=0, output_tokens=0))")
+
+def legacy_prompt_tokens(student, history, tutor_question):
+    prompt = f"""
+        Student:
+        {student.create_profile_xml(student.profile)}
+
+        Physics Problem:
+        {student.physics_problem}
+
+        {history}
+
+        Tutor's Question:
+        {tutor_question}
+
+        Generate a student response that matches the profile configuration defined above.
+        """
+    return utils.estimate_tokens(student.base_prompt) + utils.estimate_tokens(prompt)
+
+def request_tokens(request):
+    return utils.estimate_tokens(request["system"]) + sum(utils.estimate_tokens(m["content"]) for m in request["messages"])
+
+def replay(speaker, rows, history_token_budget=None):
+    student = PhysicsStudentSimulator("offline-report", profile_from_speaker(speaker), utils.physics_problem,
+                                      if_simplified=True, history_token_budget=history_token_budget)
+    legacy_history = [{"role": "system", "content": student.base_prompt}]
+    before, after = [], []
+    # Each tutor message is answered by the next student message in the transcript
+    for tutor_row, student_row in zip(rows, rows[1:]):
+        if tutor_row['speaker'] != 'gpt-tutor' or student_row['speaker'] == 'gpt-tutor':
+            continue
+        legacy_history.append({"role": "user", "content": tutor_row['message']})
+        before.append(legacy_prompt_tokens(student, legacy_history, tutor_row['message']))
+        legacy_history.append({"role": "assistant", "content": legacy_message_repr(student_row['message'], len(legacy_history))})
+
+        after.append(request_tokens(student.build_request(tutor_row['message'])))
+        student.add_response(student_row['message'])
+    return before, after
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--history-token-budget", type=int, default=None)
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    last_before, last_after = [], []
+    print(f"{'obs_id':>6} {'student':<32} {'calls':>5} {'before':>9} {'after':>9} {'saved':>6}")
+    for obs_id, speaker, rows in load_conversations():
+        before, after = replay(speaker, rows, args.history_token_budget)
+        if not before:
+            continue
+        total_before += sum(before)
+        total_after += sum(after)
+        last_before.append(before[-1])
+        last_after.append(after[-1])
+        print(f"{obs_id:>6} {speaker:<32} {len(before):>5} {sum(before):>9} {sum(after):>9} {1 - sum(after) / sum(before):>6.1%}")
+
+    print(f"\nTotal student input tokens: before {total_before}, after {total_after} ({1 - total_after / total_before:.1%} saved)")
+    print(f"Mean input tokens of the last call: before {sum(last_before) / len(last_before):.0f}, after {sum(last_after) / len(last_after):.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Tutor history compaction over the transcripts in data/data.csv: input tokens per tutor call with the
+full history versus the compacted one (summary calls included), and, with --check-progression,
+whether the compacted tutor stays on the same question of the Q1/Q2/Q3 plan as the recorded tutor.
+
+The recorded tutor replies are replayed, so every conversation follows its transcript. The progression
+check regenerates each reply that was made from a compacted history and has a classifier label it and
+the recorded reply with the question they work on. Summaries and checks make real API calls unless
+--fake-llm or --cassette is given; token counts use utils.estimate_tokens.
+
+Run from src/: python -m benchmarks.tutor_compaction [--compact-after 1500] [--compact-keep-turns 2] [--check-progression] [--limit N]
+"""
+import argparse
+import os
+import re
+import utils
+import llm_backend
+import cassette
+import compaction
+import fake_llm
+
+from collections import Counter
+from dotenv import load_dotenv, find_dotenv
+from physics_tutor import PhysicsTutorSimulator
+from benchmarks.prompt_tokens import load_conversations
+
+stages = ["Q1", "Q2", "Q3", "WRAP_UP"]
+
+classifier_prompt = """
+    A physics tutor guides a student through three questions, in order:
+    Q1: What physics knowledge would help solve the problem and how is it connected to the key features of the problem?
+    Q2: What information is needed for solving the problem?
+    Q3: How can all required information be obtained?
+    After Q3 the tutor summarizes and wraps up the session.
+
+    Which step is the tutor message below working on? Answer with exactly one of: Q1, Q2, Q3, WRAP_UP.
+    """
+
+def classify(client, message, model):
+    request = dict(
+        model=model,
+        messages=[{"role": "system", "content": classifier_prompt}, {"role": "user", "content": message}],
+        temperature=0,
+        max_tokens=5
+    )
+    match = re.search(r"\b(Q1|Q2|Q3|WRAP_UP)\b", llm_backend.call_llm(client, "openai", request, agent="classifier").text)
+    return match.group(1) if match else None
+
+def replay(rows, policy, check_progression=False, classifier_model="gpt-4o-mini"):
+    tutor = PhysicsTutorSimulator(os.environ.get("OPENAI_API_KEY"), compaction_policy=policy)
+    full, compacted, checks = [], [], []
+    # Each student message is answered by the next tutor message in the transcript
+    for student_row, tutor_row in zip(rows, rows[1:]):
+        if student_row['speaker'] == 'gpt-tutor' or tutor_row['speaker'] != 'gpt-tutor':
+            continue
+        tutor.compact()
+        tutor.conversation_history.append({"role": "user", "content": student_row['message']})
+        full.append(compaction.message_tokens(tutor.conversation_history))
+        compacted.append(compaction.message_tokens(tutor.request_messages()))
+        if check_progression and tutor.summary is not None:
+            request = dict(model=tutor.model, messages=tutor.request_messages(), temperature=tutor.temperature, max_tokens=tutor.max_tokens)
+            reply = llm_backend.call_llm(tutor.client, "openai", request, agent="tutor").text
+            checks.append((int(tutor_row['turn']), classify(tutor.client, tutor_row['message'], classifier_model),
+                           classify(tutor.client, reply, classifier_model)))
+        tutor.conversation_history.append({"role": "assistant", "content": tutor_row['message']})
+    summary_tokens = sum(usage["input_tokens"] + usage["output_tokens"] for usage in tutor.call_usage)
+    return full, compacted, summary_tokens, tutor.compactions, checks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    compaction.add_compaction_args(parser)
+    parser.set_defaults(compact_after=1500, compact_keep_turns=2)
+    parser.add_argument("--check-progression", action="store_true", help="Regenerate compacted replies and compare their Q1/Q2/Q3 step with the recording")
+    parser.add_argument("--classifier-model", default="gpt-4o-mini")
+    parser.add_argument("--limit", type=int, default=None, help="Only replay the first N conversations")
+    fake_llm.add_fake_llm_args(parser)
+    cassette.add_cassette_args(parser)
+    args = parser.parse_args()
+    fake_llm.configure_from_args(args)
+    cassette.configure_from_args(args)
+    _ = load_dotenv(find_dotenv())
+    policy = compaction.CompactionPolicy(threshold_tokens=args.compact_after, keep_turns=args.compact_keep_turns, model=args.compact_model)
+
+    total_full = total_compacted = total_summaries = 0
+    outcomes = Counter()
+    mismatches = []
+    print(f"{'obs_id':>6} {'student':<32} {'calls':>5} {'full':>8} {'compact':>8} {'summary':>8} {'saved':>6} {'folds':>5}")
+    for obs_id, speaker, rows in load_conversations()[:args.limit]:
+        full, compacted, summary_tokens, compactions, checks = replay(rows, policy, args.check_progression, args.classifier_model)
+        if not full:
+            continue
+        total_full += sum(full)
+        total_compacted += sum(compacted)
+        total_summaries += summary_tokens
+        saved = 1 - (sum(compacted) + summary_tokens) / sum(full)
+        print(f"{obs_id:>6} {speaker:<32} {len(full):>5} {sum(full):>8} {sum(compacted):>8} {summary_tokens:>8} {saved:>6.1%} {compactions:>5}")
+        for turn, recorded, regenerated in checks:
+            if recorded is None or regenerated is None:
+                outcomes["unclassified"] += 1
+            elif recorded == regenerated:
+                outcomes["same step"] += 1
+            else:
+                # Going back means the summary lost progress; going ahead means it skipped a step
+                outcomes["went back" if stages.index(regenerated) < stages.index(recorded) else "skipped ahead"] += 1
+                mismatches.append(f"obs {obs_id} turn {turn}: recorded {recorded}, compacted {regenerated}")
+
+    print(f"\nTutor input tokens: full history {total_full}, compacted {total_compacted} + {total_summaries} for summaries "
+          f"({1 - (total_compacted + total_summaries) / total_full:.1%} saved)")
+    if args.check_progression:
+        checked = sum(outcomes.values())
+        print(f"Q1/Q2/Q3 progression on {checked} compacted replies: " + ", ".join(f"{name} {count}" for name, count in outcomes.most_common()))
+        for mismatch in mismatches:
+            print(f"  {mismatch}")
+
+if __name__ == "__main__":
+    main()
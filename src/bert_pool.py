@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+import os
+import utils
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Set in each worker process by _init_worker
+_worker_scorer = None
+_warm_barrier = None
+
+def _init_worker(model_type: str, runtime: str, torch_threads: int, warm_barrier):
+    global _worker_scorer, _warm_barrier
+    _warm_barrier = warm_barrier
+    import torch
+    import bert_scorer
+    # Workers share the machine's cores, so each one gets a slice instead of torch's default of all of them
+    torch.set_num_threads(torch_threads)
+    bert_scorer.configure(model_type, runtime)
+    _worker_scorer = bert_scorer.get_scorer()
+
+def _score(candidates, reference):
+    return _worker_scorer.score(list(candidates), reference)
+
+def _coverage(transcript, threshold):
+    import rubric_coverage
+    return rubric_coverage.score_transcript(_worker_scorer, transcript, threshold)
+
+def _ready():
+    # Blocks until every worker holds one _ready task, so no worker can take two and leave another unstarted
+    _warm_barrier.wait()
+    return os.getpid()
+
+class BERTScorePool:
+    """
+    BERTScore in worker processes, each holding the model once.
+
+    Finished summaries are queued with submit() and scored while the event loop keeps generating
+    other conversations; callers await the result and join it into the log row before writing it.
+    """
+    def __init__(self, workers: int = 2, torch_threads: int = None, model_type: str = None, runtime: str = None):
+        import bert_scorer
+        self.workers = workers
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+        # Workers score with the parent's --bert-model / --bert-runtime unless told otherwise
+        self.model_type = model_type or bert_scorer.active_model_type
+        self.runtime = runtime or bert_scorer.active_runtime
+        # spawn: forking a process that already started torch/tokenizer threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model_type, self.runtime, self.torch_threads, context.Barrier(workers))
+        )
+        self.submitted = 0
+        self.warming = []
+
+    def warm(self):
+        # Start every worker and load its model now (in _init_worker), so the first finished conversation doesn't wait for it.
+        # Workers are spawned on demand; the barrier in _ready makes all of them busy at once, so all of them get spawned
+        self.warming = [self.executor.submit(_ready) for _ in range(self.workers)]
+
+    def wait_ready(self):
+        for ready in self.warming:
+            ready.result()
+
+    def submit(self, candidates, reference: str = utils.question_summary_prompt):
+        self.submitted += 1
+        return self.executor.submit(_score, list(candidates), reference)
+
+    async def score(self, candidates, reference: str = utils.question_summary_prompt):
+        """One (precision, recall, f1) tuple per candidate, like bert_scorer.BERTScorer.score."""
+        return await asyncio.wrap_future(self.submit(candidates, reference))
+
+    async def coverage(self, transcript, threshold: float):
+        """Rubric coverage points and summary of one conversation, like rubric_coverage.score_transcript."""
+        self.submitted += 1
+        # Passed along: workers don't see the parent's --coverage-threshold
+        return await asyncio.wrap_future(self.executor.submit(_coverage, list(transcript), threshold))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> str:
+        return (f"BERTScore pool: {self.workers} workers x {self.torch_threads} torch threads, "
+                f"{self.submitted} scoring jobs ({self.runtime}:{self.model_type})")
+
+# Used by gpt_evaluator.async_generate_log_row when set; otherwise scoring runs in a thread of this process
+active_pool = None
+
+def configure(workers: int, torch_threads: int = None, model_type: str = None, runtime: str = None) -> BERTScorePool:
+    global active_pool
+    active_pool = BERTScorePool(workers, torch_threads=torch_threads, model_type=model_type, runtime=runtime)
+    active_pool.warm()
+    return active_pool
+
+def add_bert_pool_args(parser):
+    parser.add_argument("--bert-workers", type=int, default=0, help="Score BERTScore in this many worker processes (0 = in-process)")
+    parser.add_argument("--bert-threads", type=int, default=None, help="Torch threads per BERTScore worker (default: cores / workers)")
+
+def configure_from_args(args):
+    if not args.bert_workers:
+        return None
+    return configure(args.bert_workers, torch_threads=args.bert_threads)
+
+def shutdown():
+    global active_pool
+    if active_pool:
+        active_pool.shutdown()
+        active_pool = None
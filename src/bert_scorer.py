@@ -0,0 +1,170 @@
+import os
+import threading
+import utils
+
+from collections import defaultdict
+
+# torch, transformers and bert_score take seconds to import, so they are only imported once a scorer is
+# built; importing this module (and gpt_evaluator) stays cheap for generation-only runs
+
+default_model_type = 'microsoft/deberta-xlarge-mnli'
+# torch: the model as bert_score runs it; int8: dynamically quantized Linear layers (CPU); onnx: ONNX Runtime export (CPU)
+runtimes = ["torch", "int8", "onnx"]
+onnx_dir = '../data/onnx'
+
+def export_onnx(model_type: str, path: str):
+    import torch
+    from bert_score.utils import get_model, get_tokenizer, model2layers
+
+    class ExportWrapper(torch.nn.Module):
+        # Exposes only the last hidden state, which is all bert_score reads
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids, attention_mask=attention_mask)[0]
+
+    model = get_model(model_type, model2layers[model_type], all_layers=False)
+    tokenizer = get_tokenizer(model_type)
+    sample = tokenizer(["A sample sentence to trace the encoder with."], return_tensors="pt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    axes = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        ExportWrapper(model).eval(), (sample["input_ids"], sample["attention_mask"]), path,
+        input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+        opset_version=14
+    )
+
+class ONNXEncoder:
+    """Stands in for the torch model inside bert_score.utils.bert_encode."""
+    def __init__(self, path: str, threads: int = None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask=None, output_hidden_states=False):
+        import torch
+        hidden = self.session.run(["last_hidden_state"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy()
+        })[0]
+        return (torch.from_numpy(hidden),)
+
+def load_encoder(model_type: str, runtime: str, device: str):
+    import torch
+    from bert_score.utils import get_model, model2layers
+    if runtime not in runtimes:
+        raise ValueError(f"Unknown scoring runtime {runtime!r}, expected one of {runtimes}")
+    if runtime == "onnx":
+        path = os.path.join(onnx_dir, model_type.replace("/", "--") + ".onnx")
+        if not os.path.exists(path):
+            export_onnx(model_type, path)
+        return ONNXEncoder(path, threads=torch.get_num_threads())
+    # Layers past the one bert_score reads are dropped, as bert_score.BERTScorer does
+    model = get_model(model_type, model2layers[model_type], all_layers=False)
+    if runtime == "int8":
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.to(device)
+
+class BERTScorer:
+    """
+    Long-lived BERTScore scorer.
+
+    The model is loaded once, reference embeddings are computed once per reference text, and
+    candidates are embedded in batched forward passes. Scores match bert_score.score() with its
+    defaults (no idf weighting, no baseline rescaling) for the torch runtime; int8 and onnx trade
+    some agreement for CPU speed, see benchmarks/bert_backends.py.
+    """
+    def __init__(self, model_type: str = default_model_type, runtime: str = "torch", batch_size: int = 16, device: str = None):
+        import torch
+        from bert_score.utils import get_tokenizer
+        self.model_type = model_type
+        self.runtime = runtime
+        self.batch_size = batch_size
+        # Quantized and ONNX models only run on the CPU
+        if runtime != "torch":
+            device = "cpu"
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = get_tokenizer(model_type)
+        self.model = load_encoder(model_type, runtime, self.device)
+        # Uniform token weights with [CLS]/[SEP] masked out, as bert_score does when idf=False
+        self.idf_dict = defaultdict(lambda: 1.0)
+        self.idf_dict[self.tokenizer.sep_token_id] = 0
+        self.idf_dict[self.tokenizer.cls_token_id] = 0
+        self.reference_cache = {}
+
+    @property
+    def name(self) -> str:
+        return f"{self.runtime}:{self.model_type}"
+
+    def embed(self, sentences):
+        from bert_score.utils import get_bert_embedding
+        # Returns (embeddings, attention masks, idf weights), padded to the longest sentence
+        return get_bert_embedding(sentences, self.model, self.tokenizer, self.idf_dict, batch_size=self.batch_size, device=self.device)
+
+    def reference_stats(self, reference: str):
+        if reference not in self.reference_cache:
+            self.reference_cache[reference] = self.embed([reference])
+        return self.reference_cache[reference]
+
+    def score(self, candidates, reference: str = utils.question_summary_prompt):
+        """
+        Scores every candidate against one reference.
+
+        Returns:
+        list: One (precision, recall, f1) tuple per candidate.
+        """
+        import torch
+        from bert_score.utils import greedy_cos_idf
+        ref_embedding, ref_mask, ref_idf = self.reference_stats(reference)
+        results = []
+        for start in range(0, len(candidates), self.batch_size):
+            batch = candidates[start:start + self.batch_size]
+            hyp_embedding, hyp_mask, hyp_idf = self.embed(batch)
+            size = len(batch)
+            # greedy_cos_idf normalizes its inputs in place, so hand it copies of the cached reference
+            with torch.no_grad():
+                p, r, f = greedy_cos_idf(
+                    ref_embedding.expand(size, -1, -1).clone(), ref_mask.expand(size, -1).clone(), ref_idf.expand(size, -1).clone(),
+                    hyp_embedding, hyp_mask, hyp_idf
+                )
+            results.extend(zip(p.tolist(), r.tolist(), f.tolist()))
+        return results
+
+# Model and runtime used when get_scorer() is called without arguments; set from --bert-model / --bert-runtime
+active_model_type = default_model_type
+active_runtime = "torch"
+
+_scorers = {}
+_scorers_lock = threading.Lock()
+
+def configure(model_type: str = default_model_type, runtime: str = "torch"):
+    global active_model_type, active_runtime
+    if runtime not in runtimes:
+        raise ValueError(f"Unknown scoring runtime {runtime!r}, expected one of {runtimes}")
+    active_model_type, active_runtime = model_type, runtime
+
+def scorer_name() -> str:
+    return f"{active_runtime}:{active_model_type}"
+
+def get_scorer(model_type: str = None, runtime: str = None) -> BERTScorer:
+    # One scorer per model and runtime per process
+    key = (model_type or active_model_type, runtime or active_runtime)
+    with _scorers_lock:
+        if key not in _scorers:
+            _scorers[key] = BERTScorer(model_type=key[0], runtime=key[1])
+        return _scorers[key]
+
+def add_scoring_args(parser):
+    parser.add_argument("--bert-model", default=default_model_type, help="BERTScore model (any bert_score-supported model cached locally)")
+    parser.add_argument("--bert-runtime", choices=runtimes, default="torch", help="Run the BERTScore model with torch, int8 dynamic quantization or ONNX Runtime")
+
+def configure_from_args(args):
+    configure(args.bert_model, args.bert_runtime)
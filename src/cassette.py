@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import llm_backend
+import response_cache
+
+from collections import defaultdict
+
+RECORD = "record"
+REPLAY = "replay"
+
+class CassetteMiss(Exception):
+    """A replayed request that was never recorded; not retryable, so it surfaces immediately."""
+
+class Cassette:
+    """
+    Records every request/response pair sent by the tutor, student and evaluator to a JSONL file, or
+    serves them back at local speed.
+
+    Requests are matched on response_cache.request_key, so the prompt-cache hints don't matter. Identical
+    requests (e.g. repeated sessions of one profile) replay their recordings in order. A request with
+    no recording raises CassetteMiss, naming the closest recording and the first message that differs.
+    """
+    def __init__(self, path: str, mode: str = REPLAY):
+        self.path = path
+        self.mode = mode
+        # What the cassette wraps while recording: the previously active backend (e.g. fake_llm) or the SDKs
+        self.inner = llm_backend.active_backend
+        self.lock = threading.Lock()
+        self.entries = defaultdict(list)
+        self.positions = defaultdict(int)
+        self.replayed = 0
+        self.recorded = 0
+        self.unmatched = []
+        if mode == REPLAY:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]].append(entry)
+
+    # Replay
+
+    def play(self, provider: str, request: dict) -> dict:
+        key = response_cache.request_key(provider, request)
+        with self.lock:
+            recordings = self.entries.get(key)
+            if not recordings:
+                description = self.describe_miss(provider, request)
+                self.unmatched.append(description)
+                raise CassetteMiss(description)
+            # Once the recordings of a request are used up, the last one is served again
+            entry = recordings[min(self.positions[key], len(recordings) - 1)]
+            self.positions[key] += 1
+            self.replayed += 1
+            return entry
+
+    def describe_miss(self, provider: str, request: dict) -> str:
+        system = response_cache.normalize_content(request.get("system"))
+        messages = [response_cache.normalize_content(m["content"]) for m in request["messages"]]
+        last = messages[-1] if messages else ""
+        description = (f"No recording in {self.path} for a {provider} {request['model']} request with {len(messages)} messages "
+                       f"(last: {last[:80]!r})")
+        candidates = [e for recordings in self.entries.values() for e in recordings
+                      if e["provider"] == provider and e["model"] == request["model"]]
+        if not candidates:
+            return description + f"; nothing was recorded for {provider} {request['model']}"
+
+        def shared_prefix(entry):
+            if entry["system"] != system:
+                return -1
+            count = 0
+            for recorded, sent in zip(entry["messages"], messages):
+                if recorded != sent:
+                    break
+                count += 1
+            return count
+
+        closest = max(candidates, key=shared_prefix)
+        matched = shared_prefix(closest)
+        if matched < 0:
+            return description + "; the system prompt differs from every recording"
+        recorded = closest["messages"][matched] if matched < len(closest["messages"]) else None
+        sent = messages[matched] if matched < len(messages) else None
+        return (description + f"; the closest recording shares the first {matched} messages, then has "
+                f"{(recorded or '<end>')[:80]!r} where this request has {(sent or '<end>')[:80]!r}")
+
+    # Record
+
+    def write(self, provider: str, request: dict, result):
+        entry = {
+            "key": response_cache.request_key(provider, request),
+            "provider": provider,
+            "model": request["model"],
+            "system": response_cache.normalize_content(request.get("system")),
+            "messages": [response_cache.normalize_content(m["content"]) for m in request["messages"]],
+            "text": result.text,
+            "usage": result.usage,
+        }
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            self.recorded += 1
+
+    def record_stream(self, provider, request, events):
+        assembler = llm_backend.StreamAssembler(provider)
+        for event in events:
+            assembler.feed(event)
+            yield event
+        self.write(provider, request, assembler.result())
+
+    async def arecord_stream(self, provider, request, events):
+        assembler = llm_backend.StreamAssembler(provider)
+        async for event in events:
+            assembler.feed(event)
+            yield event
+        self.write(provider, request, assembler.result())
+
+    async def replay_stream(self, events):
+        for event in events:
+            yield event
+
+    # llm_backend.active_backend interface
+
+    def send(self, client, provider: str, request: dict, stream: bool = False):
+        if self.mode == REPLAY:
+            entry = self.play(provider, request)
+            if stream:
+                return iter(llm_backend.build_stream_events(provider, entry["text"], entry["usage"]))
+            return llm_backend.build_response(provider, entry["text"], entry["usage"])
+        if self.inner is not None:
+            response = self.inner.send(client, provider, request, stream)
+        else:
+            response = llm_backend.sdk_send(client, provider, request, stream)
+        if stream:
+            return self.record_stream(provider, request, response)
+        self.write(provider, request, llm_backend.parse_response(provider, response))
+        return response
+
+    async def asend(self, client, provider: str, request: dict, stream: bool = False):
+        if self.mode == REPLAY:
+            entry = self.play(provider, request)
+            if stream:
+                return self.replay_stream(llm_backend.build_stream_events(provider, entry["text"], entry["usage"]))
+            return llm_backend.build_response(provider, entry["text"], entry["usage"])
+        if self.inner is not None:
+            response = await self.inner.asend(client, provider, request, stream)
+        else:
+            response = await llm_backend.sdk_send(client, provider, request, stream)
+        if stream:
+            return self.arecord_stream(provider, request, response)
+        self.write(provider, request, llm_backend.parse_response(provider, response))
+        return response
+
+    def stats(self) -> str:
+        if self.mode == RECORD:
+            return f"Cassette {self.path}: recorded {self.recorded} calls"
+        return f"Cassette {self.path}: replayed {self.replayed} calls, {len(self.unmatched)} unmatched requests"
+
+    def print_report(self):
+        print(self.stats())
+        for description in self.unmatched:
+            print(f"  unmatched: {description}")
+
+def configure(path: str, mode: str = REPLAY) -> Cassette:
+    llm_backend.active_backend = Cassette(path, mode)
+    if mode == REPLAY:
+        # The SDK clients are still constructed and refuse to start without a key
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        os.environ.setdefault("ANTHROPIC_API_KEY", "replay")
+    return llm_backend.active_backend
+
+def add_cassette_args(parser):
+    parser.add_argument("--cassette", default=None, help="JSONL file of recorded LLM calls")
+    parser.add_argument("--cassette-mode", choices=[RECORD, REPLAY], default=REPLAY,
+                        help="record: append every call to the cassette; replay: serve calls from it without the network")
+
+def configure_from_args(args):
+    # Call after fake_llm.configure_from_args so recording can wrap the fake backend
+    if not args.cassette:
+        return None
+    if args.cassette_mode == RECORD and getattr(args, "response_cache", None) and args.response_cache_mode == response_cache.READ_THROUGH:
+        # Cache hits never reach the backend and would be missing from the cassette
+        raise SystemExit("--cassette-mode record needs --response-cache-mode write_only or bypass")
+    return configure(args.cassette, args.cassette_mode)
@@ -0,0 +1,110 @@
+import copy
+import time
+
+from dataclasses import dataclass, asdict, field
+from instrumentation import CallRecord
+from physics_student import StudentProfile
+from stop_policy import ConversationState
+
+opening_message = "Can you help me with this question?"
+
+# Stages of a run, in order
+CONVERSATION = "conversation" # Turns still being generated
+SUMMARIZED = "summarized"     # Both summaries exist, evaluation pending
+DONE = "done"                 # Row written to the results store
+FORKED = "forked"             # Shared prefix that branches were forked from; never continued itself
+
+@dataclass
+class RunProgress:
+    """Everything needed to pick a run up again after a crash, persisted after every turn."""
+    run_id: str
+    profile: dict
+    stage: str = CONVERSATION
+    turns: int = 0
+    total_tokens: int = 0
+    elapsed: float = 0.0
+    tutor_response_len: int = 0
+    student_response_len: int = 0
+    # Next message for the tutor and the last tutor turn
+    student_response: str = opening_message
+    tutor_response: str = ""
+    stop_reason: str = None
+    tutor_summary: str = None
+    student_summary: str = None
+    tutor_state: dict = field(default_factory=dict)
+    student_state: dict = field(default_factory=dict)
+    # CallRecords of earlier attempts, so the row's API metrics cover the whole run
+    call_records: list = field(default_factory=list)
+    # Set on branches: the run they were forked from and how many turns they share with it
+    parent_run_id: str = None
+    fork_turn: int = None
+    # sweep_planner space of the profile: "full" profiles need the full student prompt to reach the model
+    space: str = "simplified"
+
+    @classmethod
+    def start(cls, run_id: str, profile: StudentProfile, space: str = "simplified"):
+        return cls(run_id=run_id, profile=asdict(profile), space=space)
+
+    def fork(self, run_id: str, profile: StudentProfile = None):
+        """
+        A new run that continues this one's conversation, optionally with another student profile.
+
+        The student's system prompt is rebuilt from the branch's profile; the histories are copied. The
+        shared turns were paid for once, by this run, so the branch starts with no calls or usage of its own.
+        """
+        branch = RunProgress(**copy.deepcopy(asdict(self)))
+        branch.run_id = run_id
+        branch.stage = CONVERSATION
+        if profile is not None:
+            branch.profile = asdict(profile)
+        branch.parent_run_id = self.run_id
+        branch.fork_turn = self.turns
+        branch.call_records = []
+        for state in (branch.tutor_state, branch.student_state):
+            if state:
+                state["call_usage"] = []
+        return branch
+
+    def student_profile(self) -> StudentProfile:
+        return StudentProfile(**self.profile)
+
+    def conversation_state(self) -> ConversationState:
+        # Wall-clock timeouts keep counting from where the interrupted run stopped
+        return ConversationState(
+            turns=self.turns,
+            total_tokens=self.total_tokens,
+            started_at=time.monotonic() - self.elapsed,
+            tutor_response=self.tutor_response,
+            student_response=self.student_response
+        )
+
+    def record_turn(self, state: ConversationState, tutor_response_len: int, student_response_len: int):
+        self.turns = state.turns
+        self.total_tokens = state.total_tokens
+        self.elapsed = state.elapsed()
+        self.tutor_response = state.tutor_response
+        self.student_response = state.student_response
+        self.tutor_response_len = tutor_response_len
+        self.student_response_len = student_response_len
+
+    def save(self, store, tutor, student, tracer=None):
+        self.tutor_state = tutor.to_state()
+        self.student_state = student.to_state()
+        if tracer is not None:
+            self.call_records = [asdict(record) for record in tracer.records]
+        store.save_checkpoint(self.run_id, self.stage, asdict(self))
+
+    @classmethod
+    def load(cls, store, run_id: str):
+        data = store.load_checkpoint(run_id)
+        if data is None:
+            raise KeyError(f"No checkpoint for run {run_id}")
+        return cls(**data)
+
+    def restore(self, tutor, student, tracer=None):
+        if self.tutor_state:
+            tutor.load_state(self.tutor_state)
+        if self.student_state:
+            student.load_state(self.student_state)
+        if tracer is not None:
+            tracer.records = [CallRecord(**record) for record in self.call_records]
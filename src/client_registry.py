@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from dataclasses import dataclass
+
+@dataclass
+class PoolSettings:
+    max_connections: int = 32         # Connections open at once per provider, shared by every agent
+    max_keepalive: int = 32           # Idle connections kept open for reuse
+    keepalive_expiry: float = 30.0    # Seconds an idle connection is kept
+    timeout: float = 600.0            # Read/write timeout; long completions can take minutes
+    connect_timeout: float = 5.0
+
+    def httpx_timeout(self):
+        import httpx
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def httpx_limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive,
+                            keepalive_expiry=self.keepalive_expiry)
+
+class ConnectionStats:
+    """
+    Connection reuse of one provider's pools, from httpcore's trace events.
+
+    A request that opens a connection reports connect_tcp (and start_tls) events; one served from the
+    keep-alive pool reports none, so reused = requests - connections.
+    """
+    connect_steps = ("connection.connect_tcp", "connection.start_tls")
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.lock = threading.Lock()
+        self.pools = 0
+        self.requests = 0
+        self.connections = 0
+        self.connect_time = 0.0
+        self.tls_time = 0.0
+
+    def record(self, step: str, seconds: float):
+        with self.lock:
+            if step == "connection.connect_tcp":
+                self.connections += 1
+                self.connect_time += seconds
+            else:
+                self.tls_time += seconds
+
+    def tracer(self):
+        # One callback per request: httpcore calls it with "<step>.started" / "<step>.complete" / "<step>.failed"
+        started = {}
+
+        def trace(name, info):
+            step, _, phase = name.rpartition(".")
+            if step not in self.connect_steps:
+                return
+            if phase == "started":
+                started[step] = time.perf_counter()
+            elif phase == "complete":
+                self.record(step, time.perf_counter() - started.pop(step))
+        return trace
+
+    def on_request(self, request):
+        with self.lock:
+            self.requests += 1
+        request.extensions["trace"] = self.tracer()
+
+    async def aon_request(self, request):
+        with self.lock:
+            self.requests += 1
+        trace = self.tracer()
+
+        async def atrace(name, info):
+            trace(name, info)
+        request.extensions["trace"] = atrace
+
+    def stats(self) -> str:
+        reused = self.requests - self.connections
+        reuse = reused / self.requests if self.requests else 0.0
+        return (f"{self.provider} HTTP pool: {self.requests} requests over {self.connections} connections "
+                f"({self.pools} pools, {reuse:.0%} reused), {self.connect_time:.2f}s connecting + {self.tls_time:.2f}s TLS")
+
+settings = PoolSettings()
+connection_stats = {provider: ConnectionStats(provider) for provider in ("openai", "anthropic")}
+# (provider, api_key, base_url, is_async) -> SDK client; async clients live in one table per event loop, since their pools can't cross loops
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def _build(provider: str, api_key: str, is_async: bool, base_url: str = None):
+    import httpx
+    stats = connection_stats[provider]
+    stats.pools += 1
+    hook = stats.aon_request if is_async else stats.on_request
+    http_client = (httpx.AsyncClient if is_async else httpx.Client)(
+        limits=settings.httpx_limits(), timeout=settings.httpx_timeout(), follow_redirects=True, event_hooks={"request": [hook]}
+    )
+    # Retries are handled by rate_limiter, see llm_backend
+    if provider == "openai":
+        from openai import OpenAI, AsyncOpenAI
+        sdk = AsyncOpenAI if is_async else OpenAI
+    else:
+        import anthropic
+        sdk = anthropic.AsyncClient if is_async else anthropic.Client
+    return sdk(api_key=api_key, base_url=base_url, max_retries=0, timeout=settings.httpx_timeout(), http_client=http_client)
+
+def get_client(provider: str, api_key: str, is_async: bool = False, base_url: str = None):
+    """
+    The process-wide SDK client of a provider, created on first use.
+
+    Every tutor, student and evaluator built with the same key shares the client and its keep-alive pool,
+    so a conversation reuses the connections of the ones before it instead of opening its own.
+    base_url points the client at another endpoint speaking the provider's API (None is the SDK default).
+    """
+    with _lock:
+        clients = _clients
+        if is_async:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # Built outside a loop: the pool binds to whichever loop first uses it, so don't share it
+                return _build(provider, api_key, is_async, base_url)
+            clients = _async_clients.setdefault(loop, {})
+        key = (provider, api_key, base_url, is_async)
+        if key not in clients:
+            clients[key] = _build(provider, api_key, is_async, base_url)
+        return clients[key]
+
+async def aclose():
+    # Closes the pools of the running loop; call before the loop ends
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+def close():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+def configure(**overrides) -> PoolSettings:
+    # Applies to clients created afterwards
+    global settings
+    settings = PoolSettings(**{**settings.__dict__, **overrides})
+    return settings
+
+def print_stats():
+    for stats in connection_stats.values():
+        if stats.requests:
+            print(stats.stats())
+
+def add_client_args(parser):
+    parser.add_argument("--http-pool-size", type=int, default=PoolSettings.max_connections,
+                        help="Connections kept per provider, shared by every agent in the process")
+    parser.add_argument("--http-timeout", type=float, default=PoolSettings.timeout, help="Seconds to wait for a response")
+    parser.add_argument("--http-connect-timeout", type=float, default=PoolSettings.connect_timeout, help="Seconds to wait for a connection")
+
+def configure_from_args(args):
+    return configure(max_connections=args.http_pool_size, max_keepalive=args.http_pool_size,
+                     timeout=args.http_timeout, connect_timeout=args.http_connect_timeout)
@@ -0,0 +1,61 @@
+import utils
+
+from dataclasses import dataclass
+
+@dataclass
+class CompactionPolicy:
+    """
+    When and how the tutor's history is compacted.
+
+    Once the messages sent with a tutor call pass threshold_tokens, every turn except the last keep_turns
+    exchanges is folded into a rolling summary (written by `model`, at least keep_turns exchanges at a
+    time), which is sent right after the system prompt in place of those turns. The summary stays fixed
+    until the history outgrows the threshold again, so the prompt-cache prefix only changes when it is
+    rewritten.
+    """
+    threshold_tokens: int = 4000
+    keep_turns: int = 4
+    model: str = "gpt-4o-mini"
+    max_tokens: int = 400
+
+    def cut(self, history: list, compacted_through: int, view_tokens: int):
+        # Index up to which the history is folded into the summary, or None while it doesn't need to be
+        if view_tokens <= self.threshold_tokens:
+            return None
+        # history is [system, student, tutor, student, tutor, ...] before the next student turn is added
+        cut = len(history) - 2 * self.keep_turns
+        # Fold at least keep_turns exchanges at a time, so a threshold close to the compacted size doesn't mean a summary call every turn
+        return cut if cut - compacted_through >= 2 * self.keep_turns else None
+
+    def build_request(self, previous_summary: str, messages: list) -> dict:
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": utils.tutor_compaction_prompt},
+                {"role": "user", "content": utils.generate_tutor_compaction_prompt(previous_summary, messages)}
+            ],
+            temperature=0,
+            max_tokens=self.max_tokens
+        )
+
+def message_tokens(messages) -> int:
+    return sum(utils.estimate_tokens(m["content"]) for m in messages)
+
+# Used by tutors created without an explicit policy; set from --compact-after
+active_policy = None
+
+def configure(threshold_tokens: int, keep_turns: int = CompactionPolicy.keep_turns, model: str = CompactionPolicy.model) -> CompactionPolicy:
+    global active_policy
+    active_policy = CompactionPolicy(threshold_tokens=threshold_tokens, keep_turns=keep_turns, model=model)
+    return active_policy
+
+def add_compaction_args(parser):
+    parser.add_argument("--compact-after", type=int, default=None, metavar="TOKENS",
+                        help="Replace the tutor's older turns with a rolling summary once its history passes this many tokens")
+    parser.add_argument("--compact-keep-turns", type=int, default=CompactionPolicy.keep_turns, help="Recent exchanges kept verbatim")
+    parser.add_argument("--compact-model", default=CompactionPolicy.model, help="Model that writes the rolling summary")
+
+def configure_from_args(args):
+    if args.compact_after is None:
+        return None
+    return configure(args.compact_after, keep_turns=args.compact_keep_turns, model=args.compact_model)
@@ -0,0 +1,98 @@
+import asyncio
+import inspect
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class EvalGraph:
+    """
+    The end-of-run evaluation as a small dependency graph.
+
+    Each step is a function of the results of the steps it depends on and starts as soon as they are
+    done, so independent steps (the two summaries, BERTScore and the two LLM judgments) overlap. run()
+    executes steps in threads; arun() awaits them on the event loop. Steps must be added after their
+    dependencies.
+    """
+    def __init__(self):
+        self.steps = {}
+        self.results = {}
+        # name -> (start, end) in seconds since the graph started
+        self.timings = {}
+        self.wall_time = None
+
+    def add(self, name: str, fn, *deps):
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"Step {name!r} depends on unknown step {dep!r}")
+        self.steps[name] = (fn, deps)
+        return self
+
+    def run(self, max_workers: int = None) -> dict:
+        """Runs every step in a thread pool and returns {step: result}; the first failing step's exception is raised."""
+        start = time.perf_counter()
+        pending = dict(self.steps)
+        running = {}
+
+        def timed(name, fn, args):
+            began = time.perf_counter() - start
+            result = fn(*args)
+            self.timings[name] = (began, time.perf_counter() - start)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(self.steps)) as executor:
+            while pending or running:
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in self.results for dep in deps):
+                        del pending[name]
+                        running[executor.submit(timed, name, fn, [self.results[dep] for dep in deps])] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception():
+                        for other in running:
+                            other.cancel()
+                        raise future.exception()
+                    self.results[name] = future.result()
+        self.wall_time = time.perf_counter() - start
+        return self.results
+
+    async def arun(self) -> dict:
+        """Runs every step as a task on the running event loop; steps may return awaitables."""
+        start = time.perf_counter()
+        tasks = {}
+
+        async def timed(name, fn, deps):
+            args = [await tasks[dep] for dep in deps]
+            began = time.perf_counter() - start
+            result = fn(*args)
+            if inspect.isawaitable(result):
+                result = await result
+            self.timings[name] = (began, time.perf_counter() - start)
+            self.results[name] = result
+            return result
+
+        for name, (fn, deps) in self.steps.items():
+            tasks[name] = asyncio.ensure_future(timed(name, fn, deps))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        self.wall_time = time.perf_counter() - start
+        return self.results
+
+    def critical_path(self) -> list:
+        # Walks back from the last step to finish through whichever dependency finished last
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda step: self.timings[step][1])
+        path = [name]
+        while self.steps[name][1]:
+            name = max(self.steps[name][1], key=lambda dep: self.timings[dep][1])
+            path.append(name)
+        return path[::-1]
+
+    def report(self) -> str:
+        steps = ", ".join(f"{name} {began:.2f}-{end:.2f}s" for name, (began, end) in sorted(self.timings.items(), key=lambda item: item[1]))
+        return f"Evaluation took {self.wall_time:.2f}s ({steps}); critical path: {' -> '.join(self.critical_path())}"
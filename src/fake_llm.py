@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+import utils
+import llm_backend
+import response_cache
+
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+# Scripted tutor ending, matched by stop_policy.TutorWrapUp
+wrap_up_reply = ("You've now worked through all three questions. Use these answers to create your own problem-solving plan "
+                 "for similar problems. Good luck!")
+summary_marker = "concise summary"
+
+class FakeRateLimitError(Exception):
+    """Looks like an SDK RateLimitError to rate_limiter.retryable / retry_after."""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("Injected 429 from the fake LLM backend")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+@dataclass
+class FakeLLMConfig:
+    latency_ms: float = 800.0     # Median response time
+    latency_sigma: float = 0.4    # Log-normal spread of the response time
+    ttft_fraction: float = 0.25   # Share of the response time spent before the first token
+    output_tokens: tuple = (30, 120)
+    error_rate: float = 0.0       # Probability that an attempt fails with a 429
+    retry_after: float = 0.05     # Seconds advertised in the injected 429s
+    wrap_up_after: int = 6        # Tutor turns before the scripted wrap-up
+    stream_chunks: int = 8
+    seed: int = 0
+
+class FakeLLMBackend:
+    """
+    Deterministic offline stand-in for chat.completions.create and messages.create.
+
+    Installed through llm_backend.active_backend, so the agents, the cache, the rate limiter and the
+    tracer run exactly as they do against the real APIs. Replies are derived from the request content,
+    latencies and injected errors also from its attempt number, so reruns behave the same at any concurrency.
+    """
+    def __init__(self, config: FakeLLMConfig = None):
+        self.config = config or FakeLLMConfig()
+        self.words = utils.question_summary_prompt.split()
+        self.attempts = defaultdict(int)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+
+    def rngs(self, provider: str, request: dict):
+        # Like temperature 0, the same request always gets the same reply; only failures depend on the attempt
+        key = response_cache.request_key(provider, request)
+        with self.lock:
+            self.attempts[key] += 1
+            self.calls += 1
+            attempt = self.attempts[key]
+        return random.Random(f"{self.config.seed}:{key}"), random.Random(f"{self.config.seed}:{key}:{attempt}")
+
+    def filler(self, rng: random.Random, tokens: int) -> str:
+        # ~4 characters per token, see utils.estimate_tokens
+        words = []
+        while utils.estimate_tokens(" ".join(words)) < tokens:
+            start = rng.randrange(len(self.words))
+            words.extend(self.words[start:start + 12])
+        return " ".join(words)
+
+    def covered_turns(self, text: str) -> int:
+        match = re.search(r"Tutor turns: (\d+)", text)
+        return int(match.group(1)) if match else 0
+
+    def reply_text(self, provider: str, request: dict, rng: random.Random) -> str:
+        messages = request["messages"]
+        last = response_cache.normalize_content(messages[-1]["content"])
+        body = self.filler(rng, rng.randint(*self.config.output_tokens))
+        if provider == "openai" and messages[0]["content"].startswith(utils.LLM_evaluator_base_prompt):
+            recall, precision = round(rng.uniform(0.3, 1.0), 2), round(rng.uniform(0.3, 1.0), 2)
+            f1 = round(2 * recall * precision / (recall + precision), 2)
+            return f"{body}\nRecall: {recall}\nPrecision: {precision}\nF1 Score: {f1}"
+        if summary_marker in last:
+            return f"Summary: {body}"
+        if provider == "openai" and messages[0]["content"] == utils.tutor_compaction_prompt:
+            # Rolling notes carry the tutor turn count forward, so compacted tutors still wrap up on schedule
+            covered = self.covered_turns(last) + sum(1 for line in last.splitlines() if line.lstrip().startswith("Tutor: "))
+            return f"Progress: {body}\nTutor turns: {covered}"
+        if provider == "openai":
+            tutor_turns = sum(1 for m in messages if m["role"] == "assistant")
+            tutor_turns += sum(self.covered_turns(m["content"]) for m in messages[1:] if m["role"] == "system")
+            if tutor_turns + 1 >= self.config.wrap_up_after:
+                return wrap_up_reply
+            return f"{body}?"
+        return body
+
+    def plan(self, provider: str, request: dict):
+        # (reply text, usage, latency in seconds, error or None)
+        rng, attempt_rng = self.rngs(provider, request)
+        latency = self.config.latency_ms / 1000 * attempt_rng.lognormvariate(0, self.config.latency_sigma)
+        if attempt_rng.random() < self.config.error_rate:
+            with self.lock:
+                self.injected_errors += 1
+            return None, None, latency * self.config.ttft_fraction, FakeRateLimitError(self.config.retry_after)
+        text = self.reply_text(provider, request, rng)
+        usage = {
+            "input_tokens": llm_backend.estimate_request_tokens(request) - request.get("max_tokens", 0),
+            "output_tokens": utils.estimate_tokens(text),
+            "cached_tokens": 0,
+            "cache_write_tokens": 0
+        }
+        return text, usage, latency, None
+
+    def send(self, client, provider: str, request: dict, stream: bool = False):
+        text, usage, latency, error = self.plan(provider, request)
+        if error is not None:
+            time.sleep(latency)
+            raise error
+        if not stream:
+            time.sleep(latency)
+            return llm_backend.build_response(provider, text, usage)
+        time.sleep(latency * self.config.ttft_fraction)
+        return self.sync_stream(llm_backend.build_stream_events(provider, text, usage, self.config.stream_chunks),
+                                latency * (1 - self.config.ttft_fraction))
+
+    def sync_stream(self, events, duration):
+        for event in events:
+            time.sleep(duration / len(events))
+            yield event
+
+    async def asend(self, client, provider: str, request: dict, stream: bool = False):
+        text, usage, latency, error = self.plan(provider, request)
+        if error is not None:
+            await asyncio.sleep(latency)
+            raise error
+        if not stream:
+            await asyncio.sleep(latency)
+            return llm_backend.build_response(provider, text, usage)
+        await asyncio.sleep(latency * self.config.ttft_fraction)
+        return self.async_stream(llm_backend.build_stream_events(provider, text, usage, self.config.stream_chunks),
+                                 latency * (1 - self.config.ttft_fraction))
+
+    async def async_stream(self, events, duration):
+        for event in events:
+            await asyncio.sleep(duration / len(events))
+            yield event
+
+    def stats(self) -> str:
+        return f"Fake LLM backend: {self.calls} calls, {self.injected_errors} injected 429s"
+
+def configure(config: FakeLLMConfig = None) -> FakeLLMBackend:
+    llm_backend.active_backend = FakeLLMBackend(config)
+    # The SDK clients are still constructed and refuse to start without a key
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+    return llm_backend.active_backend
+
+def add_fake_llm_args(parser):
+    parser.add_argument("--fake-llm", action="store_true", help="Serve every LLM call from the offline fake backend")
+    parser.add_argument("--fake-latency-ms", type=float, default=FakeLLMConfig.latency_ms, help="Median fake response time")
+    parser.add_argument("--fake-error-rate", type=float, default=FakeLLMConfig.error_rate, help="Share of fake calls that fail with a 429")
+    parser.add_argument("--fake-wrap-up-after", type=int, default=FakeLLMConfig.wrap_up_after, help="Tutor turns before the fake tutor wraps up")
+    parser.add_argument("--fake-seed", type=int, default=FakeLLMConfig.seed)
+
+def configure_from_args(args):
+    if not args.fake_llm:
+        return None
+    return configure(FakeLLMConfig(
+        latency_ms=args.fake_latency_ms,
+        error_rate=args.fake_error_rate,
+        wrap_up_after=args.fake_wrap_up_after,
+        seed=args.fake_seed
+    ))
@@ -1,45 +1,164 @@
+import asyncio
+import json
+import threading
 import utils
-from openai import OpenAI
-from bert_score import score
+import llm_backend
+import client_registry
+from concurrent.futures import ThreadPoolExecutor
+import bert_scorer
+import bert_pool
+import instrumentation
+import rubric_coverage
+
+from eval_graph import EvalGraph
 
 class GPTEvaluator:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, prompt_cache: bool = False, tracer=None):
         self.model = "gpt-4-turbo"
         self.temperature = 0
         self.max_tokens = 1000
-        self.client = OpenAI(api_key=api_key)
+        self.client = self.create_client(api_key)
+        # Only adds a routing hint: the static prefix (system prompt and problem statement, ~570 tokens) is below
+        # OpenAI's 1024-token caching minimum, and the judge prompt stays the same so scores remain comparable
+        self.prompt_cache = prompt_cache
         self.base_prompt = utils.LLM_evaluator_base_prompt
-        self.conversation_history = [{"role": "system", "content": self.base_prompt}]
-    
-    def generate_response(self, tutor_summary):
-        self.conversation_history.append({"role": "user", "content": utils.generate_LLM_evaluator_prompt(tutor_summary)})
-        completion = self.client.chat.completions.create(
+        # Every judgment is stateless: the system prompt plus one summary, so earlier evaluations can't leak into later scores
+        self.system_message = {"role": "system", "content": self.base_prompt}
+        self.call_usage = []
+        # Optional instrumentation.CallTracer shared by the agents of one conversation
+        self.tracer = tracer
+
+    def create_client(self, api_key: str):
+        return client_registry.get_client("openai", api_key)
+
+    def build_request(self, tutor_summary):
+        request = dict(
             model=self.model,
-            messages=self.conversation_history,
+            messages=[self.system_message, {"role": "user", "content": utils.generate_LLM_evaluator_prompt(tutor_summary)}],
             temperature=self.temperature,
             max_tokens=self.max_tokens
         )
-        
-        # Create a history
-        assistant_response = completion.choices[0].message.content
-        return assistant_response
+        if self.prompt_cache:
+            request["prompt_cache_key"] = "gpt-evaluator"
+        return request
+
+    def record_response(self, result):
+        if not result.from_cache:
+            self.call_usage.append(result.usage)
+        return result.text
+    
+    def generate_response(self, tutor_summary):
+        result = llm_backend.call_llm(self.client, "openai", self.build_request(tutor_summary), tracer=self.tracer, agent="evaluator")
+        return self.record_response(result)
     
     def compute_llm_scores(self, response):
         llm_response = self.generate_response(response)
         return utils.extract_scores(llm_response)
+
+    def compute_llm_scores_many(self, responses, max_concurrency: int = 8):
+        # Judgments are independent, so they can run side by side; results keep the input order, and a
+        # judgment that still fails after the limiter's retries is returned as its exception instead of sinking the rest
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [executor.submit(self.compute_llm_scores, response) for response in responses]
+            return [future.exception() or future.result() for future in futures]
+
+    def write_batch_requests(self, items, path):
+        """
+        Writes an OpenAI Batch API request file.
+
+        Parameters:
+        items: (custom_id, summary) pairs; custom_id is how results are mapped back to their rows.
+        path (str): Output JSONL path.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for custom_id, summary in items:
+                body = self.build_request(summary)
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n")
+
+class AsyncGPTEvaluator(GPTEvaluator):
+    def create_client(self, api_key: str):
+        return client_registry.get_client("openai", api_key, is_async=True)
+
+    async def generate_response(self, tutor_summary):
+        result = await llm_backend.acall_llm(self.client, "openai", self.build_request(tutor_summary), tracer=self.tracer, agent="evaluator")
+        return self.record_response(result)
+
+    async def compute_llm_scores(self, response):
+        llm_response = await self.generate_response(response)
+        return utils.extract_scores(llm_response)
+
+    async def compute_llm_scores_many(self, responses, max_concurrency: int = 8):
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(response):
+            async with semaphore:
+                return await self.compute_llm_scores(response)
+
+        return await asyncio.gather(*(bounded(response) for response in responses), return_exceptions=True)
+
+def read_batch_results(path):
+    """
+    Parses an OpenAI Batch API output file.
+
+    Returns:
+    dict: custom_id -> [recall, precision, f1], or None for requests that failed.
+    """
+    scores = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                scores[record["custom_id"]] = None
+                continue
+            scores[record["custom_id"]] = utils.extract_scores(response["body"]["choices"][0]["message"]["content"])
+    return scores
     
+# Serializes BERT scoring when it runs off the event loop so concurrent sessions share one forward pass at a time
+_bert_lock = threading.Lock()
+
 def compute_bert_scores(response, prompt):
-    p, r, fscore = score([response], [prompt], lang='en', verbose=True, model_type='microsoft/deberta-xlarge-mnli')
-    return p.item(), r.item(), fscore.item()
+    return bert_scorer.get_scorer().score([response], prompt)[0]
+
+def compute_bert_scores_batch(responses, prompt=utils.question_summary_prompt):
+    # One batched forward pass for all candidates; the reference embedding is reused across calls
+    return bert_scorer.get_scorer().score(list(responses), prompt)
+
+def _locked_bert_scores_batch(responses, prompt):
+    with _bert_lock:
+        return compute_bert_scores_batch(responses, prompt)
+
+async def async_bert_scores_batch(responses, prompt=utils.question_summary_prompt):
+    # In the worker pool when one is configured, otherwise in a thread of this process; either way other sessions keep talking to the APIs
+    if bert_pool.active_pool:
+        return await bert_pool.active_pool.score(responses, prompt)
+    return await asyncio.to_thread(_locked_bert_scores_batch, responses, prompt)
 
-def generate_log_row(profile, gpt_evaluator, chat_history, tutor_response, student_response, conversation_counter, tutor_response_len, student_response_len):
-    # BERT scores
-    bert_p, bert_r, bert_score = compute_bert_scores(tutor_response, utils.question_summary_prompt)
-    student_bert_p, student_bert_r, student_bert_score = compute_bert_scores(student_response, utils.question_summary_prompt)
+def compute_rubric_coverage(transcript):
+    return rubric_coverage.score_transcript(bert_scorer.get_scorer(), transcript)
 
-    # LLM scores
-    llm_p, llm_r, llm_score = gpt_evaluator.compute_llm_scores(tutor_response)
-    student_llm_p, student_llm_r, student_llm_score = gpt_evaluator.compute_llm_scores(student_response)
+def _locked_rubric_coverage(transcript):
+    with _bert_lock:
+        return compute_rubric_coverage(transcript)
+
+async def async_rubric_coverage(transcript):
+    # Placed like async_bert_scores_batch: the worker pool when configured, otherwise a thread of this process
+    if bert_pool.active_pool:
+        return await bert_pool.active_pool.coverage(transcript, rubric_coverage.active_threshold)
+    return await asyncio.to_thread(_locked_rubric_coverage, transcript)
+
+def conversation_metrics(gpt_evaluator):
+    # The evaluator shares the conversation's tracer, so by now it has seen every call of the run
+    return gpt_evaluator.tracer.summary() if gpt_evaluator.tracer else None
+
+def build_log_row(profile, chat_history, tutor_response, student_response, conversation_counter, tutor_response_len, student_response_len, stop_reason,
+                  tutor_bert, student_bert, tutor_llm, student_llm, call_metrics=None, evaluation_time=None, coverage_summary=None):
+    bert_p, bert_r, bert_score = tutor_bert
+    student_bert_p, student_bert_r, student_bert_score = student_bert
+    llm_p, llm_r, llm_score = tutor_llm
+    student_llm_p, student_llm_r, student_llm_score = student_llm
 
     # Prepare the row data
     return [
@@ -58,5 +177,48 @@ def generate_log_row(profile, gpt_evaluator, chat_history, tutor_response, stude
         llm_p, llm_r, llm_score,
         bert_p, bert_r, bert_score,
         student_llm_p, student_llm_r, student_llm_score,
-        student_bert_p, student_bert_r, student_bert_score
-    ]
\ No newline at end of file
+        student_bert_p, student_bert_r, student_bert_score,
+        stop_reason,
+        bert_scorer.scorer_name(),
+        *(call_metrics or [None] * len(instrumentation.metric_columns)),
+        round(evaluation_time, 3) if evaluation_time is not None else None,
+        *(coverage_summary or [None] * len(rubric_coverage.coverage_columns))
+    ]
+
+def add_scoring_steps(graph, gpt_evaluator, bert_scores=None, transcript=None, coverage=None):
+    """
+    Adds the four scores to an EvalGraph that already has "tutor_summary" and "student_summary" steps.
+    Each LLM judgment starts as soon as its summary exists; BERTScore waits for both so they share one batch.
+    With a transcript (rubric_coverage.transcript_from_history), its rubric coverage curve is computed
+    alongside, as it doesn't depend on the summaries.
+    The default BERTScore and coverage steps share one scorer, whose model and tokenizer aren't
+    thread-safe, so they take _bert_lock like the async helpers do.
+    """
+    bert_scores = bert_scores or _locked_bert_scores_batch
+    if transcript is not None:
+        coverage = coverage or _locked_rubric_coverage
+        graph.add("coverage", lambda: coverage(transcript))
+    graph.add("bert", lambda tutor_summary, student_summary: bert_scores([tutor_summary, student_summary], utils.question_summary_prompt),
+              "tutor_summary", "student_summary")
+    graph.add("tutor_llm", gpt_evaluator.compute_llm_scores, "tutor_summary")
+    graph.add("student_llm", gpt_evaluator.compute_llm_scores, "student_summary")
+    return graph
+
+def graph_log_row(profile, gpt_evaluator, chat_history, graph, conversation_counter, tutor_response_len, student_response_len, stop_reason=""):
+    # Builds the log row from a finished EvalGraph with the summary and scoring steps
+    results = graph.results
+    tutor_bert, student_bert = results["bert"]
+    coverage_summary = results["coverage"][1] if "coverage" in results else None
+    return build_log_row(profile, chat_history, results["tutor_summary"], results["student_summary"], conversation_counter, tutor_response_len, student_response_len, stop_reason,
+                         tutor_bert, student_bert, results["tutor_llm"], results["student_llm"], conversation_metrics(gpt_evaluator), graph.wall_time,
+                         coverage_summary)
+
+def generate_log_row(profile, gpt_evaluator, chat_history, tutor_response, student_response, conversation_counter, tutor_response_len, student_response_len, stop_reason=""):
+    graph = EvalGraph().add("tutor_summary", lambda: tutor_response).add("student_summary", lambda: student_response)
+    add_scoring_steps(graph, gpt_evaluator).run()
+    return graph_log_row(profile, gpt_evaluator, chat_history, graph, conversation_counter, tutor_response_len, student_response_len, stop_reason)
+
+async def async_generate_log_row(profile, gpt_evaluator, chat_history, tutor_response, student_response, conversation_counter, tutor_response_len, student_response_len, stop_reason=""):
+    graph = EvalGraph().add("tutor_summary", lambda: tutor_response).add("student_summary", lambda: student_response)
+    await add_scoring_steps(graph, gpt_evaluator, bert_scores=async_bert_scores_batch).arun()
+    return graph_log_row(profile, gpt_evaluator, chat_history, graph, conversation_counter, tutor_response_len, student_response_len, stop_reason)
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+
+from dataclasses import dataclass, asdict
+
+# USD per million tokens: (input, cached input, cache write, output). Update when provider pricing changes.
+model_prices = {
+    "gpt-4-turbo": (10.00, 10.00, 10.00, 30.00),
+    "gpt-4o": (2.50, 1.25, 2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.15, 0.60),
+    "claude-3-5-haiku-20241022": (0.80, 0.08, 1.00, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 0.30, 3.75, 15.00),
+}
+
+def estimate_cost(model: str, usage: dict) -> float:
+    if model not in model_prices:
+        return 0.0
+    input_price, cached_price, write_price, output_price = model_prices[model]
+    uncached = usage["input_tokens"] - usage["cached_tokens"] - usage["cache_write_tokens"]
+    return (uncached * input_price + usage["cached_tokens"] * cached_price
+            + usage["cache_write_tokens"] * write_price + usage["output_tokens"] * output_price) / 1_000_000
+
+@dataclass
+class CallRecord:
+    session_id: str
+    agent: str
+    provider: str
+    model: str
+    started_at: float
+    wall_time: float
+    time_to_first_token: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+    cost: float = 0.0
+    from_cache: bool = False
+    error: str = None
+
+def percentile(values, q):
+    # Nearest-rank percentile, q in 0-100
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+# Columns appended to utils.headers, in this order
+metric_columns = [
+    'api_calls', 'api_wall_time', 'api_ttft_avg', 'input_tokens', 'output_tokens', 'cached_tokens', 'estimated_cost_usd'
+]
+
+_trace_lock = threading.Lock()
+
+class CallTracer:
+    """Collects one CallRecord per LLM call of a conversation, optionally mirroring them to a JSONL trace."""
+    def __init__(self, session_id: str = "", trace_path: str = None):
+        self.session_id = session_id
+        self.trace_path = trace_path
+        self.records = []
+
+    def record(self, agent: str, provider: str, model: str, started: tuple, first_token_at: float = None, usage: dict = None,
+               from_cache: bool = False, error: str = None) -> CallRecord:
+        # started is (time.time(), time.perf_counter()) taken when the call began
+        started_at, started_perf = started
+        now = time.perf_counter()
+        usage = usage or {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0}
+        record = CallRecord(
+            session_id=self.session_id,
+            agent=agent,
+            provider=provider,
+            model=model,
+            started_at=started_at,
+            wall_time=now - started_perf,
+            # Without streaming the first token arrives with the whole response
+            time_to_first_token=(first_token_at or now) - started_perf,
+            from_cache=from_cache,
+            error=error,
+            cost=0.0 if from_cache else estimate_cost(model, usage),
+            **usage
+        )
+        self.records.append(record)
+        if self.trace_path:
+            with _trace_lock, open(self.trace_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(asdict(record)) + "\n")
+        return record
+
+    def summary(self) -> list:
+        # Values for metric_columns; cache hits and failed calls aren't billed API calls
+        billed = [r for r in self.records if not r.from_cache and r.error is None]
+        return [
+            len(billed),
+            round(sum(r.wall_time for r in billed), 3),
+            round(sum(r.time_to_first_token for r in billed) / len(billed), 3) if billed else None,
+            sum(r.input_tokens for r in billed),
+            sum(r.output_tokens for r in billed),
+            sum(r.cached_tokens for r in billed),
+            round(sum(r.cost for r in billed), 6),
+        ]
@@ -0,0 +1,230 @@
+import time
+import utils
+import rate_limiter
+import response_cache
+
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+# Every chat.completions.create / messages.create call made by the agents goes through this module,
+# so cross-cutting layers (response cache, rate limiting and retries, per-call tracing, ...) live here instead of in each simulator.
+
+@dataclass
+class LLMResult:
+    text: str
+    usage: dict = field(default_factory=dict)
+    from_cache: bool = False
+
+def parse_response(provider: str, response) -> LLMResult:
+    if provider == "openai":
+        text = response.choices[0].message.content
+    else:
+        text = response.content[0].text
+    return LLMResult(text=text, usage=utils.extract_usage(response))
+
+def sdk_send(client, provider: str, request: dict, stream: bool = False):
+    if provider == "openai":
+        if stream:
+            return client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+        return client.chat.completions.create(**request)
+    if stream:
+        return client.messages.create(**request, stream=True)
+    return client.messages.create(**request)
+
+# Serves requests in place of the SDK clients when set (see fake_llm, cassette); needs send(client, provider, request, stream) and async asend
+active_backend = None
+
+def send(client, provider: str, request: dict, stream: bool = False):
+    if active_backend is not None:
+        return active_backend.send(client, provider, request, stream)
+    return sdk_send(client, provider, request, stream)
+
+async def asend(client, provider: str, request: dict, stream: bool = False):
+    if active_backend is not None:
+        return await active_backend.asend(client, provider, request, stream)
+    return await sdk_send(client, provider, request, stream)
+
+def build_response(provider: str, text: str, usage: dict):
+    # An SDK-shaped response that parse_response turns back into exactly this text and usage
+    if provider == "openai":
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(prompt_tokens=usage["input_tokens"], completion_tokens=usage["output_tokens"],
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=usage["cached_tokens"]))
+        )
+    return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=anthropic_usage(usage))
+
+def anthropic_usage(usage: dict):
+    return SimpleNamespace(
+        input_tokens=usage["input_tokens"] - usage["cached_tokens"] - usage["cache_write_tokens"],
+        output_tokens=usage["output_tokens"],
+        cache_read_input_tokens=usage["cached_tokens"],
+        cache_creation_input_tokens=usage["cache_write_tokens"]
+    )
+
+def build_stream_events(provider: str, text: str, usage: dict, chunks: int = 1) -> list:
+    # The stream events StreamAssembler reads from the SDKs, splitting the text into `chunks` deltas
+    size = max(1, -(-len(text) // chunks))
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+    if provider == "openai":
+        events = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=p))], usage=None) for p in pieces]
+        events.append(SimpleNamespace(choices=[], usage=build_response(provider, text, usage).usage))
+        return events
+    start = SimpleNamespace(type="message_start", message=SimpleNamespace(usage=anthropic_usage(usage)))
+    deltas = [SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=p)) for p in pieces]
+    end = SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=usage["output_tokens"]))
+    return [start] + deltas + [end]
+
+class StreamAssembler:
+    """Turns provider stream events into text deltas and keeps what is needed for the final LLMResult."""
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.pieces = []
+        self.usage = None
+        self.anthropic_usage = {}
+        self.first_token_at = None
+
+    def feed(self, event) -> str:
+        delta = ""
+        if self.provider == "openai":
+            if event.choices:
+                delta = event.choices[0].delta.content or ""
+            if getattr(event, "usage", None) is not None:
+                # The last chunk carries usage for the whole completion (stream_options.include_usage)
+                self.usage = utils.extract_usage(event)
+        elif event.type == "message_start":
+            usage = event.message.usage
+            for key in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+                self.anthropic_usage[key] = getattr(usage, key, 0) or 0
+        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+            delta = event.delta.text
+        elif event.type == "message_delta":
+            self.anthropic_usage["output_tokens"] = event.usage.output_tokens or 0
+        if delta:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.pieces.append(delta)
+        return delta
+
+    def result(self) -> LLMResult:
+        if self.provider == "anthropic":
+            self.usage = utils.extract_usage(SimpleNamespace(usage=SimpleNamespace(**self.anthropic_usage)))
+        usage = self.usage or utils.extract_usage(None)
+        return LLMResult(text="".join(self.pieces), usage=usage)
+
+def estimate_request_tokens(request: dict) -> int:
+    # Providers count max_tokens against the tokens-per-minute budget up front
+    text = response_cache.normalize_content(request.get("system")) or ""
+    for message in request["messages"]:
+        text += response_cache.normalize_content(message["content"])
+    return utils.estimate_tokens(text) + request.get("max_tokens", 0)
+
+def cache_lookup(provider: str, request: dict):
+    cache = response_cache.active_cache
+    cached = cache.lookup(provider, request) if cache else None
+    if cached is None:
+        return None
+    text, usage = cached
+    return LLMResult(text=text, usage=usage, from_cache=True)
+
+def cache_store(provider: str, request: dict, result: LLMResult):
+    if response_cache.active_cache:
+        response_cache.active_cache.store(provider, request, result.text, result.usage)
+
+def trace(tracer, agent, provider, request, started, result=None, error=None, first_token_at=None):
+    if tracer is None:
+        return
+    if error is not None:
+        tracer.record(agent, provider, request["model"], started, error=repr(error))
+    else:
+        tracer.record(agent, provider, request["model"], started, first_token_at=first_token_at, usage=result.usage, from_cache=result.from_cache)
+
+def call_llm(client, provider: str, request: dict, tracer=None, agent: str = "") -> LLMResult:
+    started = (time.time(), time.perf_counter())
+    result = cache_lookup(provider, request)
+    if result is None:
+        limiter = rate_limiter.get_limiter(provider)
+        estimated = estimate_request_tokens(request)
+        try:
+            result = parse_response(provider, limiter.call(lambda: send(client, provider, request), estimated))
+        except Exception as error:
+            trace(tracer, agent, provider, request, started, error=error)
+            raise
+        limiter.record_usage(estimated, result.usage["input_tokens"] + result.usage["output_tokens"])
+        cache_store(provider, request, result)
+    trace(tracer, agent, provider, request, started, result=result)
+    return result
+
+async def acall_llm(client, provider: str, request: dict, tracer=None, agent: str = "") -> LLMResult:
+    started = (time.time(), time.perf_counter())
+    result = cache_lookup(provider, request)
+    if result is None:
+        limiter = rate_limiter.get_limiter(provider)
+        estimated = estimate_request_tokens(request)
+        try:
+            result = parse_response(provider, await limiter.acall(lambda: asend(client, provider, request), estimated))
+        except Exception as error:
+            trace(tracer, agent, provider, request, started, error=error)
+            raise
+        limiter.record_usage(estimated, result.usage["input_tokens"] + result.usage["output_tokens"])
+        cache_store(provider, request, result)
+    trace(tracer, agent, provider, request, started, result=result)
+    return result
+
+def stream_llm(client, provider: str, request: dict, on_result, tracer=None, agent: str = ""):
+    """
+    Yields text deltas as they arrive, then calls on_result with the assembled LLMResult.
+
+    A response-cache hit is yielded as a single delta.
+    """
+    started = (time.time(), time.perf_counter())
+    result = cache_lookup(provider, request)
+    if result is not None:
+        yield result.text
+        trace(tracer, agent, provider, request, started, result=result)
+        on_result(result)
+        return
+    limiter = rate_limiter.get_limiter(provider)
+    estimated = estimate_request_tokens(request)
+    assembler = StreamAssembler(provider)
+    try:
+        # Opening the stream is retried; one that already produced text can't be. The permit is held until it ends or is closed
+        with limiter.held_call(lambda: send(client, provider, request, stream=True), estimated) as events:
+            for event in events:
+                delta = assembler.feed(event)
+                if delta:
+                    yield delta
+    except Exception as error:
+        trace(tracer, agent, provider, request, started, error=error)
+        raise
+    result = assembler.result()
+    limiter.record_usage(estimated, result.usage["input_tokens"] + result.usage["output_tokens"])
+    cache_store(provider, request, result)
+    trace(tracer, agent, provider, request, started, result=result, first_token_at=assembler.first_token_at)
+    on_result(result)
+
+async def astream_llm(client, provider: str, request: dict, on_result, tracer=None, agent: str = ""):
+    started = (time.time(), time.perf_counter())
+    result = cache_lookup(provider, request)
+    if result is not None:
+        yield result.text
+        trace(tracer, agent, provider, request, started, result=result)
+        on_result(result)
+        return
+    limiter = rate_limiter.get_limiter(provider)
+    estimated = estimate_request_tokens(request)
+    assembler = StreamAssembler(provider)
+    try:
+        async with limiter.aheld_call(lambda: asend(client, provider, request, stream=True), estimated) as events:
+            async for event in events:
+                delta = assembler.feed(event)
+                if delta:
+                    yield delta
+    except Exception as error:
+        trace(tracer, agent, provider, request, started, error=error)
+        raise
+    result = assembler.result()
+    limiter.record_usage(estimated, result.usage["input_tokens"] + result.usage["output_tokens"])
+    cache_store(provider, request, result)
+    trace(tracer, agent, provider, request, started, result=result, first_token_at=assembler.first_token_at)
+    on_result(result)
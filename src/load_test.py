@@ -0,0 +1,279 @@
+"""
+Load test of an OpenAI-compatible tutor endpoint, driven by simulated students.
+
+Tutor turns are offered open-loop: arrivals follow a Poisson process at --qps whatever the endpoint
+does. Each arrival is taken by a student whose next message is ready; when none is, a new student
+joins with a profile drawn from the --profile mix. Students write their replies with
+AsyncPhysicsStudentSimulator (served by the fake backend with --fake-llm, so only the tutor endpoint
+sees real traffic) and leave when the stop policy ends their conversation. Latency is measured from
+the scheduled send time, so a saturated endpoint shows up as latency instead of as a lower offered load.
+
+Run from src/: python load_test.py --base-url http://127.0.0.1:8000/v1 --qps 5 --duration 120 [--profile 1:lowMotivation=3 --profile 5:highMotivation=1] [--stream] [--fake-llm]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import utils
+import llm_backend
+import rate_limiter
+import client_registry
+import fake_llm
+import checkpoint
+
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, asdict
+from dotenv import load_dotenv, find_dotenv
+from physics_student import AsyncPhysicsStudentSimulator
+from instrumentation import percentile
+from stop_policy import ConversationState, add_stop_policy_args, stop_policy_from_args
+from batch_runner import default_profiles, parse_profile
+
+@dataclass
+class TurnRecord:
+    scheduled: float            # Seconds after the start of the test
+    finished: float
+    student: int
+    profile: str
+    turn: int
+    latency: float              # From the scheduled send time to the full reply
+    first_token: float = None   # Streaming only
+    output_tokens: int = 0
+    error: str = None           # "<status code>" or the exception type
+
+class SimulatedStudent:
+    def __init__(self, student_id: int, spec: str, api_key: str):
+        self.student_id = student_id
+        self.spec = spec
+        self.simulator = AsyncPhysicsStudentSimulator(api_key, parse_profile(spec), utils.physics_problem, if_simplified=True)
+        # The conversation as the tutor endpoint sees it: student turns are "user", tutor turns "assistant"
+        self.messages = []
+        self.next_message = checkpoint.opening_message
+        self.state = ConversationState()
+
+def parse_mix(specs: list) -> list:
+    # "knowledge_level:engagement_style[=weight]" -> [(spec, weight)]
+    mix = []
+    for spec in specs or [f"{k}:{e}" for k, e in default_profiles]:
+        profile, _, weight = spec.partition("=")
+        parse_profile(profile)
+        mix.append((profile, float(weight or 1)))
+    return mix
+
+def error_label(error) -> str:
+    status = getattr(error, "status_code", None)
+    return str(status) if status is not None else type(error).__name__
+
+class LoadTest:
+    def __init__(self, client, model: str, mix: list, qps: float, duration: float, stop_policy, stream: bool = False,
+                 system_prompt: str = None, max_tokens: int = 1000, max_students: int = None, drain_timeout: float = 60.0, seed: int = 0):
+        self.client = client
+        self.model = model
+        self.mix = mix
+        self.qps = qps
+        self.duration = duration
+        self.stop_policy = stop_policy
+        self.stream = stream
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.max_students = max_students
+        self.drain_timeout = drain_timeout
+        self.rng = random.Random(seed)
+        self.started_perf = None
+        self.records = []
+        self.ready = deque()
+        self.students = 0
+        self.finished_students = 0
+        self.student_errors = Counter()
+        # Arrivals that found no student because --max-students were all busy
+        self.unserved = []
+
+    def build_request(self, student: SimulatedStudent) -> dict:
+        messages = student.messages + [{"role": "user", "content": student.next_message}]
+        if self.system_prompt:
+            messages = [{"role": "system", "content": self.system_prompt}] + messages
+        return dict(model=self.model, messages=messages, temperature=0, max_tokens=self.max_tokens)
+
+    def new_student(self):
+        if self.max_students is not None and self.students >= self.max_students:
+            return None
+        spec = self.rng.choices([spec for spec, _ in self.mix], weights=[weight for _, weight in self.mix])[0]
+        self.students += 1
+        return SimulatedStudent(self.students, spec, os.environ.get("ANTHROPIC_API_KEY"))
+
+    async def send(self, request: dict):
+        # Straight to the endpoint: the limiter's retries and the response cache would hide what is being measured
+        if not self.stream:
+            return llm_backend.parse_response("openai", await llm_backend.sdk_send(self.client, "openai", request)), None
+        assembler = llm_backend.StreamAssembler("openai")
+        async for event in await llm_backend.sdk_send(self.client, "openai", request, stream=True):
+            assembler.feed(event)
+        return assembler.result(), assembler.first_token_at
+
+    async def turn(self, student: SimulatedStudent, scheduled: float):
+        request = self.build_request(student)
+        record = TurnRecord(scheduled=scheduled, finished=0.0, student=student.student_id, profile=student.spec,
+                            turn=student.state.turns + 1, latency=0.0)
+        try:
+            result, first_token_at = await self.send(request)
+        except asyncio.CancelledError:
+            # Still in flight when the drain timeout ran out
+            record.error = "drain_timeout"
+            record.finished = time.perf_counter() - self.started_perf
+            record.latency = record.finished - scheduled
+            self.records.append(record)
+            raise
+        except Exception as error:
+            record.error = error_label(error)
+        else:
+            record.output_tokens = result.usage["output_tokens"]
+            if first_token_at is not None:
+                record.first_token = first_token_at - self.started_perf - scheduled
+        record.finished = time.perf_counter() - self.started_perf
+        record.latency = record.finished - scheduled
+        self.records.append(record)
+        if record.error:
+            # The student sends the same message again on a later arrival
+            self.ready.append(student)
+            return
+
+        student.messages = request["messages"][1 if self.system_prompt else 0:] + [{"role": "assistant", "content": result.text}]
+        student.state.turns += 1
+        student.state.tutor_response = result.text
+        if self.stop_policy.should_stop(student.state):
+            self.finished_students += 1
+            return
+        # The student's think time is its own model call
+        try:
+            student.next_message = await student.simulator.generate_response(result.text)
+        except Exception as error:
+            self.student_errors[error_label(error)] += 1
+            self.finished_students += 1
+            return
+        student.state.student_response = student.next_message
+        self.ready.append(student)
+
+    async def run(self) -> list:
+        self.started_perf = time.perf_counter()
+        tasks = set()
+        scheduled = 0.0
+        while True:
+            scheduled += self.rng.expovariate(self.qps)
+            if scheduled > self.duration:
+                break
+            await asyncio.sleep(max(0.0, scheduled - (time.perf_counter() - self.started_perf)))
+            student = self.ready.popleft() if self.ready else self.new_student()
+            if student is None:
+                self.unserved.append(scheduled)
+                continue
+            task = asyncio.create_task(self.turn(student, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            # Turns still in flight get drain_timeout to finish; the rest are counted as timeouts
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return self.records
+
+def summarize(records: list) -> str:
+    ok = [r for r in records if r.error is None]
+    latencies = [r.latency for r in ok]
+    first_tokens = [r.first_token for r in ok if r.first_token is not None]
+    cells = [f"{len(records):>7}", f"{len(ok):>7}", f"{1 - len(ok) / len(records) if records else 0:>7.1%}"]
+    for value in [percentile(latencies, q) for q in (50, 95, 99)] + [percentile(first_tokens, 50)]:
+        cells.append(f"{value:>8.2f}" if value is not None else f"{'-':>8}")
+    return "".join(cells)
+
+def print_report(test: LoadTest, window: float):
+    records = test.records
+    header = f"{'turns':>7}{'ok':>7}{'errors':>7}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'ttft50':>8}"
+    print(f"\nOver time (turns by completion, {window:g}s windows)")
+    print(f"{'window':>10}{'offered':>8}{'ok/s':>7}" + header)
+    windows = defaultdict(list)
+    offered = Counter(int(r.scheduled // window) for r in records)
+    offered.update(int(t // window) for t in test.unserved)
+    for record in records:
+        windows[int(record.finished // window)].append(record)
+    for index in sorted(set(windows) | set(offered)):
+        completed = sum(1 for r in windows[index] if r.error is None)
+        print(f"{f'{index * window:g}-{(index + 1) * window:g}s':>10}{offered[index] / window:>8.2f}{completed / window:>7.2f}" + summarize(windows[index]))
+
+    print("\nBy profile")
+    print(f"{'profile':<22}" + header)
+    by_profile = defaultdict(list)
+    for record in records:
+        by_profile[record.profile].append(record)
+    for profile, group in sorted(by_profile.items()):
+        print(f"{profile:<22}" + summarize(group))
+
+    elapsed = max((r.finished for r in records), default=test.duration)
+    ok = sum(1 for r in records if r.error is None)
+    print(f"\nTotal{'':<17}" + summarize(records))
+    print(f"Offered {test.qps:g} turns/s for {test.duration:g}s: {len(records) + len(test.unserved)} arrivals, "
+          f"{ok / elapsed:.2f} successful turns/s over {elapsed:.1f}s")
+    errors = Counter(r.error for r in records if r.error)
+    if errors:
+        print("Errors: " + ", ".join(f"{label} {count} ({count / len(records):.1%})" for label, count in errors.most_common()))
+    if test.unserved:
+        print(f"{len(test.unserved)} arrivals found every one of the {test.max_students} students busy (raise --max-students)")
+    print(f"Students: {test.students} joined, {test.finished_students} finished their conversation"
+          + (", student model errors: " + ", ".join(f"{k} {v}" for k, v in test.student_errors.items()) if test.student_errors else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", required=True, help="OpenAI-compatible API root of the tutor, e.g. http://127.0.0.1:8000/v1")
+    parser.add_argument("--model", default="gpt-4-turbo", help="Model name sent with every tutor request")
+    parser.add_argument("--api-key", default=None, help="Key for the tutor endpoint (default: $TUTOR_API_KEY)")
+    parser.add_argument("--no-system-prompt", action="store_true", help="Don't send the tutor system prompt; for endpoints that add their own")
+    parser.add_argument("--qps", type=float, required=True, help="Offered tutor turns per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of arrivals")
+    parser.add_argument("--profile", action="append", dest="profiles", metavar="K:E[=WEIGHT]",
+                        help="knowledge_level:engagement_style and its share of new students, may be repeated (default: batch_runner's profiles, evenly)")
+    parser.add_argument("--max-students", type=int, default=None, help="Cap on concurrent students; arrivals beyond it are reported, not sent")
+    parser.add_argument("--stream", action="store_true", help="Stream tutor replies and report time to first token")
+    parser.add_argument("--reply-tokens", type=int, default=1000, help="max_tokens of tutor requests")
+    parser.add_argument("--window", type=float, default=10.0, help="Seconds per row of the over-time report")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds turns in flight at the end may take before counting as errors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write one JSON line per tutor turn to this file")
+    add_stop_policy_args(parser, interactive=False)
+    rate_limiter.add_rate_limit_args(parser)
+    client_registry.add_client_args(parser)
+    # Every turn in flight needs its own connection, or the client's pool adds queueing to the measured latency
+    parser.set_defaults(http_pool_size=1000)
+    fake_llm.add_fake_llm_args(parser)
+    args = parser.parse_args()
+    rate_limiter.configure_from_args(args)
+    client_registry.configure_from_args(args)
+    fake_backend = fake_llm.configure_from_args(args)
+
+    # Load enviornment for LLM APIs
+    _ = load_dotenv(find_dotenv())
+    api_key = args.api_key or os.environ.get("TUTOR_API_KEY") or "none"
+
+    async def run():
+        client = client_registry.get_client("openai", api_key, is_async=True, base_url=args.base_url)
+        test = LoadTest(client, args.model, parse_mix(args.profiles), args.qps, args.duration, stop_policy_from_args(args),
+                        stream=args.stream, system_prompt=None if args.no_system_prompt else utils.tutor_system_prompt,
+                        max_tokens=args.reply_tokens, max_students=args.max_students, drain_timeout=args.drain_timeout, seed=args.seed)
+        print(f"Offering {args.qps:g} tutor turns/s to {args.base_url} for {args.duration:g}s")
+        await test.run()
+        await client_registry.aclose()
+        return test
+
+    test = asyncio.run(run())
+    print_report(test, args.window)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for record in test.records:
+                f.write(json.dumps(asdict(record)) + "\n")
+    client_registry.print_stats()
+    if fake_backend:
+        print(fake_backend.stats())
+
+if __name__ == "__main__":
+    main()
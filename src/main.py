@@ -1,60 +1,187 @@
 import os
+import argparse
+import uuid
 import xml.etree.ElementTree as ET
 import utils
+import rate_limiter
+import client_registry
+import response_cache
+import fake_llm
+import cassette
+import compaction
+import bert_scorer
+import checkpoint
+import rubric_coverage
 
 from dotenv import load_dotenv, find_dotenv
 from physics_student import PhysicsStudentSimulator, StudentProfile, profile_gen, simp_profile_gen
-from gpt_evaluator import GPTEvaluator, generate_log_row
+from gpt_evaluator import GPTEvaluator, add_scoring_steps, graph_log_row
 from physics_tutor import PhysicsTutorSimulator
+from instrumentation import CallTracer
+from checkpoint import RunProgress
+from eval_graph import EvalGraph
+from results_store import ResultsStore
+from stop_policy import add_stop_policy_args, stop_policy_from_args
 
-def create_LLM_agents(profile):
-    claude_student_simulator = PhysicsStudentSimulator(os.environ.get("ANTHROPIC_API_KEY"), profile, utils.physics_problem, if_simplified=True)
-    gpt_tutor_simulator = PhysicsTutorSimulator(os.environ.get("OPENAI_API_KEY"))
-    gpt_evaluator = GPTEvaluator(os.environ.get("OPENAI_API_KEY"))
+def create_LLM_agents(profile, prompt_cache=False, tracer=None, if_simplified=True):
+    claude_student_simulator = PhysicsStudentSimulator(os.environ.get("ANTHROPIC_API_KEY"), profile, utils.physics_problem, if_simplified=if_simplified, prompt_cache=prompt_cache, tracer=tracer)
+    gpt_tutor_simulator = PhysicsTutorSimulator(os.environ.get("OPENAI_API_KEY"), prompt_cache=prompt_cache, tracer=tracer)
+    gpt_evaluator = GPTEvaluator(os.environ.get("OPENAI_API_KEY"), prompt_cache=prompt_cache, tracer=tracer)
     return claude_student_simulator, gpt_tutor_simulator, gpt_evaluator
 
+def print_stream(label, deltas):
+    # Echo tokens as they arrive and return the assembled text
+    print(label, end="", flush=True)
+    pieces = []
+    for delta in deltas:
+        print(delta, end="", flush=True)
+        pieces.append(delta)
+    print("\n")
+    return "".join(pieces)
+
 def main():
+    parser = argparse.ArgumentParser(description="Simulate one tutor-student conversation.")
+    add_stop_policy_args(parser)
+    parser.add_argument("--prompt-cache", action="store_true", help="Enable provider-side prompt caching")
+    response_cache.add_response_cache_args(parser)
+    rate_limiter.add_rate_limit_args(parser)
+    client_registry.add_client_args(parser)
+    fake_llm.add_fake_llm_args(parser)
+    cassette.add_cassette_args(parser)
+    compaction.add_compaction_args(parser)
+    bert_scorer.add_scoring_args(parser)
+    rubric_coverage.add_coverage_args(parser)
+    parser.add_argument("--trace", default=None, help="Append one JSON line per LLM call to this file")
+    parser.add_argument("--stream", action="store_true", help="Print tutor and student turns token by token")
+    parser.add_argument("--resume", default=None, metavar="RUN_ID", help="Continue a run from its last checkpoint")
+    parser.add_argument("--generate-only", action="store_true", help="Stop after the summaries and queue the run for evaluation")
+    args = parser.parse_args()
+    stop_policy = stop_policy_from_args(args)
+    cache = response_cache.configure_from_args(args)
+    rate_limiter.configure_from_args(args)
+    client_registry.configure_from_args(args)
+    fake_backend = fake_llm.configure_from_args(args)
+    recording = cassette.configure_from_args(args)
+    compaction.configure_from_args(args)
+    bert_scorer.configure_from_args(args)
+    rubric_coverage.configure_from_args(args)
+
     # Load enviornment for LLM APIs
     _ = load_dotenv(find_dotenv())
-    # Randomly create a student profile from sample space
-    #profile = profile_gen()
-    profile = simp_profile_gen(knowledge_level="1", engagement_style="lowMotivation")
+    store = ResultsStore()
+    if args.resume:
+        progress = RunProgress.load(store, args.resume)
+        if progress.stage == checkpoint.DONE:
+            print(f"Run {progress.run_id} is already complete")
+            return
+        if progress.stage == checkpoint.FORKED:
+            # Continuing it in place would change the prefix later branches copy
+            parser.error(f"run {progress.run_id} is a fork trunk; branch it with python batch_runner.py --fork-from {progress.run_id} --profile ...")
+        profile = progress.student_profile()
+    else:
+        # Randomly create a student profile from sample space
+        #profile = profile_gen()
+        profile = simp_profile_gen(knowledge_level="1", engagement_style="lowMotivation")
+        progress = RunProgress.start(uuid.uuid4().hex, profile)
+    print(f"Run {progress.run_id} (continue with --resume {progress.run_id})\n")
 
     # Create Student, Tutor, LLMScore evaluator
-    claude_student_simulator, gpt_tutor_simulator, gpt_evaluator = create_LLM_agents(profile)
+    tracer = CallTracer(session_id=progress.run_id, trace_path=args.trace)
+    claude_student_simulator, gpt_tutor_simulator, gpt_evaluator = create_LLM_agents(profile, prompt_cache=args.prompt_cache, tracer=tracer,
+                                                                                      if_simplified=progress.space == "simplified")
+    progress.restore(gpt_tutor_simulator, claude_student_simulator, tracer)
 
-    student_response = "Can you help me with this question?"
-    print(f"Student: {student_response}\n")
+    student_response = progress.student_response
+    if progress.turns == 0:
+        print(f"Student: {student_response}\n")
 
-    conversation_counter = 0
-    tutor_response_len = 0
-    student_response_len = 0
+    state = progress.conversation_state()
+    tutor_response_len = progress.tutor_response_len
+    student_response_len = progress.student_response_len
+    stop_reason = progress.stop_reason
     try:
-        while True:
-            tutor_response = gpt_tutor_simulator.generate_response(student_response=student_response)
-            # Generate student response
-            student_response = claude_student_simulator.generate_response(tutor_question=tutor_response)
-                
-            print("Tutor Response: ", tutor_response, "\n")
-            print("Student Response:", student_response)
+        while not stop_reason:
+            if args.stream:
+                tutor_response = print_stream("Tutor Response: ", gpt_tutor_simulator.generate_response_stream(student_response=student_response))
+                student_response = print_stream("Student Response: ", claude_student_simulator.generate_response_stream(tutor_question=tutor_response))
+            else:
+                tutor_response = gpt_tutor_simulator.generate_response(student_response=student_response)
+                # Generate student response
+                student_response = claude_student_simulator.generate_response(tutor_question=tutor_response)
+                    
+                print("Tutor Response: ", tutor_response, "\n")
+                print("Student Response:", student_response)
 
 
-            conversation_counter += 1
+            state.turns += 1
+            state.total_tokens = gpt_tutor_simulator.total_tokens + claude_student_simulator.total_tokens
+            state.tutor_response = tutor_response
+            state.student_response = student_response
             tutor_response_len += len(tutor_response)
             student_response_len += len(student_response)
-            if not utils.execution_control():
-                print("Exiting loop...")
-                break
+            stop_reason = stop_policy.should_stop(state)
+            # Checkpoint every completed turn; a crash loses at most the turn in flight
+            progress.record_turn(state, tutor_response_len, student_response_len)
+            progress.stop_reason = stop_reason
+            progress.save(store, gpt_tutor_simulator, claude_student_simulator, tracer)
+        print(f"Exiting loop ({stop_reason})...")
                 
     except KeyboardInterrupt:
+        stop_reason = "interrupted"
         print("\nProgram terminated by user")
+        progress.stop_reason = stop_reason
+        progress.save(store, gpt_tutor_simulator, claude_student_simulator, tracer)
+
+    # Summaries, then scores, as one dependency graph: the two summaries run side by side, and each score starts as soon as its inputs exist
+    def summarize_tutor():
+        if progress.tutor_summary is not None:
+            return progress.tutor_summary
+        return gpt_tutor_simulator.generate_response(student_response="Can you provide a concise summary of the key steps you've given to solve the question?")
+
+    def summarize_student():
+        if progress.student_summary is not None:
+            return progress.student_summary
+        return claude_student_simulator.generate_response(tutor_question="Can you provide a concise summary of the key steps you've learned to solve the question?")
+
+    def checkpoint_summaries(tutor_summary, student_summary):
+        if progress.stage == checkpoint.CONVERSATION:
+            progress.tutor_summary, progress.student_summary = tutor_summary, student_summary
+            progress.stage = checkpoint.SUMMARIZED
+            progress.save(store, gpt_tutor_simulator, claude_student_simulator, tracer)
 
-    tutor_summary = gpt_tutor_simulator.generate_response(student_response="Can you provide a concise summary of the key steps you've given to solve the question?")
-    student_summary = claude_student_simulator.generate_response(tutor_question="Can you provide a concise summary of the key steps you've learned to solve the question?")
-    print("Student Summary: ", student_summary)
-    print("Tutor Summary: ", tutor_summary)
-    row = generate_log_row(profile,gpt_evaluator, gpt_tutor_simulator.get_conversation_history(), tutor_summary, student_summary, conversation_counter, tutor_response_len, student_response_len)
-    utils.write_data(row) # Record the data into a csv file in the data directory
+    graph = EvalGraph()
+    graph.add("tutor_summary", summarize_tutor)
+    graph.add("student_summary", summarize_student)
+    graph.add("checkpoint", checkpoint_summaries, "tutor_summary", "student_summary")
+    if not args.generate_only:
+        transcript = rubric_coverage.transcript_from_history(checkpoint.opening_message, claude_student_simulator.conversation_history, state.turns)
+        add_scoring_steps(graph, gpt_evaluator, transcript=transcript)
+    graph.run()
+    print("Student Summary: ", progress.student_summary)
+    print("Tutor Summary: ", progress.tutor_summary)
+    if args.generate_only:
+        # The summarized checkpoint is the queue entry; BERTScore (and torch) are never loaded in this process
+        print(f"Queued run {progress.run_id} for evaluation (python batch_runner.py --evaluate-pending)")
+    else:
+        row = graph_log_row(profile, gpt_evaluator, gpt_tutor_simulator.get_conversation_history(), graph, state.turns, tutor_response_len, student_response_len, stop_reason)
+        utils.write_data(row, run_id=progress.run_id) # Record the run in the results store in the data directory
+        store.write_coverage(progress.run_id, graph.results["coverage"][0])
+        progress.stage = checkpoint.DONE
+        progress.save(store, gpt_tutor_simulator, claude_student_simulator, tracer)
+        print(graph.report())
+    utils.print_usage_report({
+        "tutor": gpt_tutor_simulator.call_usage,
+        "student": claude_student_simulator.call_usage,
+        "evaluator": gpt_evaluator.call_usage
+    })
+    if cache:
+        print(cache.stats())
+    rate_limiter.print_stats()
+    client_registry.print_stats()
+    if fake_backend:
+        print(fake_backend.stats())
+    if recording:
+        recording.print_report()
 
 if __name__ == "__main__":
     main()
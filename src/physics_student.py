@@ -1,11 +1,14 @@
-import anthropic
 import utils
-import itertools
+import llm_backend
+import client_registry
 import random
 
 from dataclasses import dataclass
 from typing import List
 
+# Shortest prefix claude-3-5-haiku caches; a cache_control breakpoint on a shorter prefix is sent uncached
+min_cacheable_tokens = 2048
+
 @dataclass
 class StudentProfile:
     knowledge_level: str  = None # 1-5
@@ -21,18 +24,27 @@ class StudentProfile:
         return f"{self.knowledge_level}_{self.engagement_style}_{self.confidence}_{self.expressiveness}_{self.pacing}"
 
 class PhysicsStudentSimulator:
-    def __init__(self, api_key: str, student_profile: StudentProfile, physics_problem: str, if_simplified: bool = False):
+    def __init__(self, api_key: str, student_profile: StudentProfile, physics_problem: str, if_simplified: bool = False, history_token_budget: int = None, prompt_cache: bool = False, tracer=None):
         # Model parameters
         self.model = "claude-3-5-haiku-20241022" # Latest model as of 2024-11-21
         self.temperature = 0
         self.max_token = 1000
 
-        self.client = anthropic.Client(api_key=api_key)
+        self.client = self.create_client(api_key)
         self.base_prompt = utils.student_system_prompt if not if_simplified else utils.simplified_system_prompt
-        self.conversation_history = [{"role": "system", "content": self.base_prompt}]
         self.profile = student_profile
         self.physics_problem = physics_problem
         self.if_simplified = if_simplified
+        # Tutor turns are "user" messages and the student's own replies are "assistant" messages
+        self.conversation_history = []
+        # Optional cap on the transcript sent with each call; the oldest exchanges are dropped first
+        self.history_token_budget = history_token_budget
+        self.system_prompt = self.create_system_prompt()
+        self.prompt_cache = prompt_cache
+        self.call_usage = []
+        self.total_tokens = 0
+        # Optional instrumentation.CallTracer shared by the agents of one conversation
+        self.tracer = tracer
         
     
     # Converts a student class to string to feed into the LLM
@@ -61,72 +73,123 @@ class PhysicsStudentSimulator:
         </currentProfile>
         """
 
-    def generate_response(self, tutor_question: str) -> str:
-        """Generate a student response to a physics problem or tutor question."""
-        
-        # Construct the complete prompt
-        profile_xml = self.create_profile_xml(self.profile)
-        self.conversation_history.append({"role":"user", "content": tutor_question})
+    def create_client(self, api_key: str):
+        return client_registry.get_client("anthropic", api_key)
 
-        prompt = f"""
+    def create_system_prompt(self) -> str:
+        # The profile and the problem never change during a conversation, so render them once
+        profile_xml = self.create_profile_xml(self.profile)
+        return f"""{self.base_prompt}
         Student:
         {profile_xml}
 
         Physics Problem:
         {self.physics_problem}
 
-        {self.conversation_history}
-
-        Tutor's Question:
-        {tutor_question}
-
-        Generate a student response that matches the profile configuration defined above.
+        Generate student responses to the tutor that match the profile configuration defined above.
         """
 
-        # Call Claude API
-        response = self.client.messages.create(
+    def trimmed_history(self) -> list:
+        if self.history_token_budget is None:
+            return self.conversation_history
+        messages = self.conversation_history
+        # Drop whole tutor/student exchanges so the transcript still starts with a tutor turn
+        while len(messages) > 1 and sum(utils.estimate_tokens(m["content"]) for m in messages) > self.history_token_budget:
+            messages = messages[2:]
+        return messages
+
+    def build_request(self, tutor_question: str) -> dict:
+        self.conversation_history.append({"role":"user", "content": tutor_question})
+        system = self.system_prompt
+        messages = list(self.trimmed_history())
+        if self.prompt_cache:
+            # A breakpoint after the newest tutor turn, so each call reads the previous call's transcript from the cache
+            # once system prompt and transcript together pass min_cacheable_tokens. The system prompt only gets its own
+            # breakpoint when it is long enough alone: the full prompt is, the simplified one (~400 tokens) never is
+            if utils.estimate_tokens(self.system_prompt) >= min_cacheable_tokens:
+                system = [{"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}]
+            messages[-1] = {"role": "user", "content": [{"type": "text", "text": tutor_question, "cache_control": {"type": "ephemeral"}}]}
+        return dict(
             model=self.model, 
             max_tokens=self.max_token,
             temperature=self.temperature,
-            system=self.base_prompt,
-            messages=[{"role": "user", "content": prompt}]
+            system=system,
+            messages=messages
         )
 
-        self.conversation_history.append({"role": "assistant", "content": response})
-        
-        return f"{response.content[0].text}"
+    def add_response(self, text: str) -> str:
+        self.conversation_history.append({"role": "assistant", "content": text})
+        return text
+
+    def to_state(self) -> dict:
+        # Everything a resumed run needs to continue this conversation
+        return {"conversation_history": self.conversation_history, "total_tokens": self.total_tokens, "call_usage": self.call_usage}
+
+    def load_state(self, state: dict):
+        self.conversation_history = list(state["conversation_history"])
+        self.total_tokens = state["total_tokens"]
+        self.call_usage = list(state["call_usage"])
+
+    def record_usage(self, result):
+        # total_tokens measures conversation size; call_usage only holds calls the provider billed
+        self.total_tokens += result.usage["input_tokens"] + result.usage["output_tokens"]
+        if not result.from_cache:
+            self.call_usage.append(result.usage)
+
+    def record_response(self, result) -> str:
+        self.record_usage(result)
+        return self.add_response(result.text)
+
+    def generate_response(self, tutor_question: str) -> str:
+        """Generate a student response to a physics problem or tutor question."""
+        # Call Claude API
+        result = llm_backend.call_llm(self.client, "anthropic", self.build_request(tutor_question), tracer=self.tracer, agent="student")
+        return self.record_response(result)
+
+    def generate_response_stream(self, tutor_question: str):
+        """Yield the student response as it arrives; the full text lands in the history once the stream ends."""
+        yield from llm_backend.stream_llm(self.client, "anthropic", self.build_request(tutor_question), self.record_response,
+                                          tracer=self.tracer, agent="student")
+
+class AsyncPhysicsStudentSimulator(PhysicsStudentSimulator):
+    def create_client(self, api_key: str):
+        return client_registry.get_client("anthropic", api_key, is_async=True)
+
+    async def generate_response(self, tutor_question: str) -> str:
+        """Generate a student response without blocking the event loop."""
+        result = await llm_backend.acall_llm(self.client, "anthropic", self.build_request(tutor_question), tracer=self.tracer, agent="student")
+        return self.record_response(result)
+
+    async def generate_response_stream(self, tutor_question: str):
+        async for delta in llm_backend.astream_llm(self.client, "anthropic", self.build_request(tutor_question), self.record_response,
+                                                   tracer=self.tracer, agent="student"):
+            yield delta
     
 def style_generate(style, styles):
     return str(style) + "-" + styles[style]
 
-def profile_gen():
-    combinations = list(itertools.product(
-        utils.student_engagement_styles.items(),
-        utils.student_knowledge_levels.items(),
-        utils.student_expressiveness_levels.items(),
-        utils.student_pacing_styles.items(),
-        utils.student_confidence_levels.items()
-    ))
-    
-    (
-        (eng_level, eng_desc),
-        (k_level, k_desc),
-        (exp_level, exp_desc),
-        (pac_level, pac_desc),
-        (conf_level, conf_desc)
-    ) = random.choice(combinations)
-
+def full_profile_gen(knowledge_level, engagement_style, expressiveness, pacing, confidence):
     return StudentProfile(
-            knowledge_level=style_generate(k_level, utils.student_knowledge_levels),
-            engagement_style=style_generate(eng_level, utils.student_engagement_styles),
+            knowledge_level=style_generate(knowledge_level, utils.student_knowledge_levels),
+            engagement_style=style_generate(engagement_style, utils.student_engagement_styles),
             misconceptions=[
                 "Confusing static equilibrium"
             ],
-            confidence=style_generate(conf_level, utils.student_confidence_levels),
-            expressiveness=style_generate(exp_level, utils.student_expressiveness_levels),
-            pacing=style_generate(pac_level, utils.student_pacing_styles)
+            confidence=style_generate(confidence, utils.student_confidence_levels),
+            expressiveness=style_generate(expressiveness, utils.student_expressiveness_levels),
+            pacing=style_generate(pacing, utils.student_pacing_styles)
         )
 
+def profile_gen():
+    # Drawing each factor independently is a uniform draw over the full factorial space; see sweep_planner for designs
+    return full_profile_gen(
+        knowledge_level=random.choice(list(utils.student_knowledge_levels)),
+        engagement_style=random.choice(list(utils.student_engagement_styles)),
+        expressiveness=random.choice(list(utils.student_expressiveness_levels)),
+        pacing=random.choice(list(utils.student_pacing_styles)),
+        confidence=random.choice(list(utils.student_confidence_levels))
+    )
+
 def simp_profile_gen(knowledge_level, engagement_style):
     return StudentProfile(
         knowledge_level=style_generate(knowledge_level, utils.student_knowledge_levels),
@@ -1,32 +1,134 @@
 import utils
-from openai import OpenAI
+import llm_backend
+import compaction
+import client_registry
 
 class PhysicsTutorSimulator:
-    def __init__(self, api_key):
+    def __init__(self, api_key, prompt_cache: bool = False, tracer=None, compaction_policy=None):
         self.model = "gpt-4-turbo"
         self.temperature = 0
         self.max_tokens = 1000
-        self.client = OpenAI(api_key=api_key)
+        self.client = self.create_client(api_key)
         self.base_prompt = utils.tutor_system_prompt
+        # The system prompt stays first and the history is append-only, so every call shares the previous call's prefix
         self.conversation_history = [{"role": "system", "content": self.base_prompt}]
+        self.prompt_cache = prompt_cache
+        self.call_usage = []
+        self.total_tokens = 0
+        # Optional instrumentation.CallTracer shared by the agents of one conversation
+        self.tracer = tracer
+        # Optional compaction.CompactionPolicy; conversation_history stays complete, only requests are compacted
+        self.compaction = compaction_policy or compaction.active_policy
+        self.summary = None
+        self.compacted_through = 1
+        self.compactions = 0
 
-    def generate_response(self, student_response):
+    def create_client(self, api_key):
+        return client_registry.get_client("openai", api_key)
+
+    def request_messages(self):
+        # The full history, or once compacted: the system prompt, the rolling summary and the turns after it
+        if self.summary is None:
+            return self.conversation_history
+        summary = {"role": "system", "content": utils.compacted_history_message(self.summary)}
+        return [self.conversation_history[0], summary] + self.conversation_history[self.compacted_through:]
+
+    def compaction_plan(self):
+        # (summary request, new compacted_through) when the history has outgrown the policy's threshold, else None
+        if self.compaction is None:
+            return None
+        cut = self.compaction.cut(self.conversation_history, self.compacted_through, compaction.message_tokens(self.request_messages()))
+        if cut is None:
+            return None
+        return self.compaction.build_request(self.summary, self.conversation_history[self.compacted_through:cut]), cut
+
+    def apply_compaction(self, result, cut):
+        # Summary calls are billed to the tutor but don't grow the conversation, so total_tokens is left alone
+        if not result.from_cache:
+            self.call_usage.append(result.usage)
+        self.summary = result.text
+        self.compacted_through = cut
+        self.compactions += 1
+
+    def compact(self):
+        plan = self.compaction_plan()
+        if plan:
+            request, cut = plan
+            self.apply_compaction(llm_backend.call_llm(self.client, "openai", request, tracer=self.tracer, agent="tutor_compaction"), cut)
+
+    def build_request(self, student_response):
         # Append the user's message to the conversation history
         self.conversation_history.append({"role": "user", "content": student_response})
-        
-        # Make the API call with the updated conversation history
-        completion = self.client.chat.completions.create(
+        request = dict(
             model=self.model,
-            messages=self.conversation_history,
+            messages=self.request_messages(),
             temperature=self.temperature,
             max_tokens=self.max_tokens
         )
-        
+        if self.prompt_cache:
+            # Route every tutor call to the same cache shard; OpenAI caches prefixes of 1024+ tokens automatically
+            request["prompt_cache_key"] = "physics-tutor"
+        return request
+
+    def record_usage(self, result):
+        # total_tokens measures conversation size; call_usage only holds calls the provider billed
+        self.total_tokens += result.usage["input_tokens"] + result.usage["output_tokens"]
+        if not result.from_cache:
+            self.call_usage.append(result.usage)
+
+    def record_response(self, result):
+        self.record_usage(result)
         # Create a history
-        assistant_response = completion.choices[0].message.content
+        assistant_response = result.text
         self.conversation_history.append({"role": "assistant", "content": assistant_response})
-        
         return assistant_response
+
+    def generate_response(self, student_response):
+        self.compact()
+        # Make the API call with the updated conversation history
+        result = llm_backend.call_llm(self.client, "openai", self.build_request(student_response), tracer=self.tracer, agent="tutor")
+        return self.record_response(result)
     
+    def generate_response_stream(self, student_response):
+        # Yields the reply as it arrives; the full text lands in the history once the stream ends
+        self.compact()
+        yield from llm_backend.stream_llm(self.client, "openai", self.build_request(student_response), self.record_response,
+                                          tracer=self.tracer, agent="tutor")
+
+    def to_state(self) -> dict:
+        # Everything a resumed run needs to continue this conversation
+        return {"conversation_history": self.conversation_history, "total_tokens": self.total_tokens, "call_usage": self.call_usage,
+                "summary": self.summary, "compacted_through": self.compacted_through, "compactions": self.compactions}
+
+    def load_state(self, state: dict):
+        self.conversation_history = list(state["conversation_history"])
+        self.total_tokens = state["total_tokens"]
+        self.call_usage = list(state["call_usage"])
+        # Checkpoints from before compaction existed have none of these
+        self.summary = state.get("summary")
+        self.compacted_through = state.get("compacted_through", 1)
+        self.compactions = state.get("compactions", 0)
+
     def get_conversation_history(self):
-        return self.conversation_history
\ No newline at end of file
+        return self.conversation_history
+
+class AsyncPhysicsTutorSimulator(PhysicsTutorSimulator):
+    def create_client(self, api_key):
+        return client_registry.get_client("openai", api_key, is_async=True)
+
+    async def compact(self):
+        plan = self.compaction_plan()
+        if plan:
+            request, cut = plan
+            self.apply_compaction(await llm_backend.acall_llm(self.client, "openai", request, tracer=self.tracer, agent="tutor_compaction"), cut)
+
+    async def generate_response(self, student_response):
+        await self.compact()
+        result = await llm_backend.acall_llm(self.client, "openai", self.build_request(student_response), tracer=self.tracer, agent="tutor")
+        return self.record_response(result)
+
+    async def generate_response_stream(self, student_response):
+        await self.compact()
+        async for delta in llm_backend.astream_llm(self.client, "openai", self.build_request(student_response), self.record_response,
+                                                   tracer=self.tracer, agent="tutor"):
+            yield delta
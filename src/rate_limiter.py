@@ -0,0 +1,235 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; a reservation may run the bucket negative and waits it out."""
+    def __init__(self, per_minute: float = None):
+        self.per_minute = per_minute
+        self.available = per_minute or 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        # Returns how long the caller has to wait before its reservation is covered
+        if not self.per_minute:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            self.available -= amount
+            if self.available >= 0:
+                return 0.0
+            return -self.available * 60 / self.per_minute
+
+    def adjust(self, amount: float):
+        # Corrects an earlier estimate once the real usage is known
+        if self.per_minute:
+            with self.lock:
+                self.available -= amount
+
+def retryable(error) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets and timeouts from either SDK
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class ProviderLimiter:
+    """
+    Shared by every agent instance talking to one provider.
+
+    Enforces requests/min and tokens/min budgets, caps in-flight calls with an adaptive limit that
+    halves on throttling and creeps back up after successes, and retries 429/5xx responses with
+    jittered exponential backoff.
+    """
+    def __init__(self, provider: str, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 max_concurrency: int = 16, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.in_flight = 0
+        self.successes_since_throttle = 0
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        # Counters
+        self.calls = 0
+        self.retries = 0
+        self.throttled_responses = 0
+        self.throttled_seconds = 0.0
+
+    def try_enter(self) -> bool:
+        with self.lock:
+            if self.in_flight < self.concurrency_limit:
+                self.in_flight += 1
+                return True
+            return False
+
+    def leave(self, throttled: bool, succeeded: bool = True):
+        with self.lock:
+            self.in_flight -= 1
+            if not succeeded and not throttled:
+                return
+            if throttled:
+                self.throttled_responses += 1
+                self.successes_since_throttle = 0
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+            else:
+                self.successes_since_throttle += 1
+                if self.successes_since_throttle >= self.concurrency_limit and self.concurrency_limit < self.max_concurrency:
+                    self.concurrency_limit += 1
+                    self.successes_since_throttle = 0
+
+    def add_throttled(self, seconds: float):
+        with self.lock:
+            self.throttled_seconds += seconds
+
+    def budget_wait(self, estimated_tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def backoff(self, attempt: int, error) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        return delay
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def open(self, send, estimated_tokens: int = 0):
+        # Returns send()'s response once an attempt succeeds; its concurrency permit is still held, see held_call
+        for attempt in range(self.max_retries + 1):
+            wait = self.budget_wait(estimated_tokens)
+            start = time.monotonic()
+            time.sleep(wait)
+            while not self.try_enter():
+                time.sleep(0.05)
+            self.add_throttled(time.monotonic() - start)
+            try:
+                return send()
+            except Exception as error:
+                throttled = retryable(error)
+                self.leave(throttled, succeeded=False)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                delay = self.backoff(attempt, error)
+                self.add_throttled(delay)
+                time.sleep(delay)
+
+    async def aopen(self, send, estimated_tokens: int = 0):
+        for attempt in range(self.max_retries + 1):
+            wait = self.budget_wait(estimated_tokens)
+            start = time.monotonic()
+            await asyncio.sleep(wait)
+            while not self.try_enter():
+                await asyncio.sleep(0.05)
+            self.add_throttled(time.monotonic() - start)
+            try:
+                return await send()
+            except Exception as error:
+                throttled = retryable(error)
+                self.leave(throttled, succeeded=False)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                delay = self.backoff(attempt, error)
+                self.add_throttled(delay)
+                await asyncio.sleep(delay)
+
+    def close(self, error=None):
+        self.leave(isinstance(error, Exception) and retryable(error), succeeded=error is None)
+        if error is None:
+            with self.lock:
+                self.calls += 1
+
+    @contextlib.contextmanager
+    def held_call(self, send, estimated_tokens: int = 0):
+        """
+        The response of send(), retried like call(), with its concurrency permit held until the block
+        exits. Streams are read inside the block, so a call counts as in flight until its stream is
+        exhausted or closed rather than only while it is opened.
+        """
+        response = self.open(send, estimated_tokens)
+        try:
+            yield response
+        except BaseException as error:
+            self.close(error)
+            raise
+        self.close()
+
+    @contextlib.asynccontextmanager
+    async def aheld_call(self, send, estimated_tokens: int = 0):
+        response = await self.aopen(send, estimated_tokens)
+        try:
+            yield response
+        except BaseException as error:
+            self.close(error)
+            raise
+        self.close()
+
+    def call(self, send, estimated_tokens: int = 0):
+        with self.held_call(send, estimated_tokens) as response:
+            return response
+
+    async def acall(self, send, estimated_tokens: int = 0):
+        async with self.aheld_call(send, estimated_tokens) as response:
+            return response
+
+    def stats(self) -> str:
+        return (f"{self.provider} limiter: {self.calls} calls, {self.retries} retries, {self.throttled_responses} throttled responses, "
+                f"{self.throttled_seconds:.1f}s spent throttled, concurrency limit {self.concurrency_limit}/{self.max_concurrency}")
+
+# One limiter per provider for the whole process
+limiters = {}
+_limiters_lock = threading.Lock()
+
+def configure(provider: str, **settings) -> ProviderLimiter:
+    with _limiters_lock:
+        limiters[provider] = ProviderLimiter(provider, **settings)
+        return limiters[provider]
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    with _limiters_lock:
+        if provider not in limiters:
+            limiters[provider] = ProviderLimiter(provider)
+        return limiters[provider]
+
+def print_stats():
+    for limiter in limiters.values():
+        print(limiter.stats())
+
+def add_rate_limit_args(parser):
+    parser.add_argument("--openai-rpm", type=float, default=None, help="OpenAI requests per minute shared by tutor and evaluator")
+    parser.add_argument("--openai-tpm", type=float, default=None, help="OpenAI tokens per minute")
+    parser.add_argument("--anthropic-rpm", type=float, default=None, help="Anthropic requests per minute shared by all students")
+    parser.add_argument("--anthropic-tpm", type=float, default=None, help="Anthropic tokens per minute")
+    parser.add_argument("--max-inflight", type=int, default=16, help="Upper bound on concurrent calls per provider")
+    parser.add_argument("--max-retries", type=int, default=6, help="Retries on 429/5xx before a call fails")
+
+def configure_from_args(args):
+    for provider in ("openai", "anthropic"):
+        configure(
+            provider,
+            requests_per_minute=getattr(args, f"{provider}_rpm"),
+            tokens_per_minute=getattr(args, f"{provider}_tpm"),
+            max_concurrency=args.max_inflight,
+            max_retries=args.max_retries
+        )
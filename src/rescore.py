@@ -0,0 +1,94 @@
+import os
+import argparse
+import asyncio
+import csv
+import sys
+import rate_limiter
+import response_cache
+import cassette
+
+from dotenv import load_dotenv, find_dotenv
+from gpt_evaluator import AsyncGPTEvaluator, GPTEvaluator, read_batch_results
+
+# Score columns in the same order generate_log_row fills them
+score_columns = {
+    'tutor_summary': ['LLM_Precision_Tutor', 'LLM_Recall_Tutor', 'LLM_score_Tutor'],
+    'student_summary': ['LLM_Precision_Student', 'LLM_Recall_Student', 'LLM_score_Student'],
+}
+
+def load_rows(path):
+    # chat_history cells can be far larger than the csv module's default field limit
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def summary_items(rows):
+    # custom_id "<row index>:<summary column>" ties every judgment back to its row
+    return [
+        (f"{index}:{column}", row[column])
+        for index, row in enumerate(rows)
+        for column in score_columns
+        if row.get(column)
+    ]
+
+def write_scores(rows, scores, path):
+    fieldnames = ['row_index', 'student_profile'] + [name for names in score_columns.values() for name in names]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for index, row in enumerate(rows):
+            out = {'row_index': index, 'student_profile': row.get('student_profile')}
+            for column, names in score_columns.items():
+                values = scores.get(f"{index}:{column}") or [None] * len(names)
+                out.update(zip(names, values))
+            writer.writerow(out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored tutor/student summaries with the LLM evaluator.")
+    parser.add_argument("--input", default='../data/cleaned_df.csv', help="CSV with tutor_summary/student_summary columns")
+    parser.add_argument("--output", default='../data/llm_rescored.csv', help="Scores keyed by input row index")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--write-batch", default=None, help="Only write an OpenAI Batch API request file to this path")
+    parser.add_argument("--batch-results", default=None, help="Read scores from a downloaded Batch API output file instead of calling the API")
+    response_cache.add_response_cache_args(parser)
+    rate_limiter.add_rate_limit_args(parser)
+    cassette.add_cassette_args(parser)
+    args = parser.parse_args()
+
+    # Load enviornment for LLM APIs
+    _ = load_dotenv(find_dotenv())
+    cache = response_cache.configure_from_args(args)
+    rate_limiter.configure_from_args(args)
+    recording = cassette.configure_from_args(args)
+    rows = load_rows(args.input)
+    items = summary_items(rows)
+
+    if args.write_batch:
+        GPTEvaluator(os.environ.get("OPENAI_API_KEY")).write_batch_requests(items, args.write_batch)
+        print(f"Wrote {len(items)} requests to {args.write_batch}")
+        return
+
+    if args.batch_results:
+        scores = read_batch_results(args.batch_results)
+    else:
+        evaluator = AsyncGPTEvaluator(os.environ.get("OPENAI_API_KEY"))
+        results = asyncio.run(evaluator.compute_llm_scores_many([summary for _, summary in items], max_concurrency=args.max_concurrency))
+        scores = {}
+        for (custom_id, _), result in zip(items, results):
+            if isinstance(result, BaseException):
+                # Written as empty scores; the row can be rescored on its own later
+                print(f"Judgment {custom_id} failed: {result!r}")
+                result = None
+            scores[custom_id] = result
+
+    write_scores(rows, scores, args.output)
+    missing = sum(1 for custom_id, _ in items if scores.get(custom_id) is None)
+    print(f"Scored {len(items) - missing}/{len(items)} summaries from {len(rows)} rows into {args.output}")
+    if cache:
+        print(cache.stats())
+    rate_limiter.print_stats()
+    if recording:
+        recording.print_report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Cache modes
+READ_THROUGH = "read_through" # Serve hits, store misses
+WRITE_ONLY = "write_only"     # Always call the API, refresh stored responses
+BYPASS = "bypass"             # Neither read nor write
+cache_modes = [READ_THROUGH, WRITE_ONLY, BYPASS]
+
+def normalize_content(content):
+    # Prompt-cache hints (cache_control blocks) don't change the answer, so key on the text only
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content)
+    return content
+
+def request_key(provider: str, request: dict) -> str:
+    payload = {
+        "provider": provider,
+        "model": request["model"],
+        "system": normalize_content(request.get("system")),
+        "messages": [{"role": m["role"], "content": normalize_content(m["content"])} for m in request["messages"]],
+        "temperature": request.get("temperature"),
+        "max_tokens": request.get("max_tokens"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Content-addressed SQLite cache for deterministic (temperature 0) LLM calls.
+
+    Entries older than max_age_days are dropped, and the least recently used entries are evicted
+    once the stored responses exceed max_bytes.
+    """
+    def __init__(self, path: str, mode: str = READ_THROUGH, max_bytes: int = 512 * 1024 * 1024, max_age_days: float = 30):
+        if mode not in cache_modes:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {cache_modes}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                text TEXT,
+                usage TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_used REAL
+            )""")
+        self.connection.commit()
+        self.evict()
+
+    def cacheable(self, request: dict) -> bool:
+        return self.mode != BYPASS and request.get("temperature") == 0
+
+    def lookup(self, provider: str, request: dict):
+        # Returns (text, usage) for a hit, None otherwise
+        if self.mode != READ_THROUGH or not self.cacheable(request):
+            return None
+        key = request_key(provider, request)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT text, usage FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+        return row[0], json.loads(row[1])
+
+    def store(self, provider: str, request: dict, text: str, usage: dict):
+        if not self.cacheable(request):
+            return
+        now = time.time()
+        usage = json.dumps(usage)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (request_key(provider, request), request["model"], text, usage, len(text) + len(usage), now, now)
+            )
+            self.connection.commit()
+            self.writes += 1
+        if self.writes % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # Drop the least recently used entries until the cache fits again
+                freed = 0
+                stale_keys = []
+                for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                    if total - freed <= self.max_bytes:
+                        break
+                    stale_keys.append((key,))
+                    freed += size
+                self.connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+            self.connection.commit()
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"Response cache ({self.mode}): {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {self.writes} writes"
+
+# Process-wide cache used by llm_backend; None disables caching
+active_cache = None
+
+def configure(path: str, mode: str = READ_THROUGH, max_mb: float = 512, max_age_days: float = 30):
+    global active_cache
+    active_cache = ResponseCache(path, mode=mode, max_bytes=int(max_mb * 1024 * 1024), max_age_days=max_age_days)
+    return active_cache
+
+def add_response_cache_args(parser):
+    parser.add_argument("--response-cache", default=None, help="SQLite file for caching temperature-0 responses, e.g. ../data/response_cache.sqlite")
+    parser.add_argument("--response-cache-mode", choices=cache_modes, default=READ_THROUGH)
+    parser.add_argument("--response-cache-max-mb", type=float, default=512)
+    parser.add_argument("--response-cache-max-age-days", type=float, default=30)
+
+def configure_from_args(args):
+    if not args.response_cache:
+        return None
+    return configure(args.response_cache, mode=args.response_cache_mode, max_mb=args.response_cache_max_mb, max_age_days=args.response_cache_max_age_days)
@@ -0,0 +1,245 @@
+import argparse
+import csv
+import json
+import sqlite3
+import time
+import uuid
+import utils
+
+from contextlib import contextmanager
+
+db_path = '../data/results.sqlite'
+
+class ResultsStore:
+    """
+    SQLite (WAL mode) store for simulation results.
+
+    Run-level metrics go into `runs`, one column per entry of utils.headers except chat_history, and
+    the chat history is normalized into `messages` keyed by run_id. `checkpoints` holds the latest
+    resumable state of every run (see checkpoint.RunProgress), `coverage` the per-turn rubric coverage
+    curve of every scored run (see rubric_coverage.py) and `forks` the lineage of runs branched off a
+    shared conversation prefix (see RunProgress.fork). Every write opens its own
+    connection and takes the write lock up front, so many processes can append safely.
+    """
+    def __init__(self, path: str = None):
+        # Read at call time so tools (e.g. benchmarks) can point the whole process at another file
+        self.path = path or db_path
+        self.run_columns = [h for h in utils.headers if h != 'chat_history']
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, created_at REAL)")
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(runs)")}
+            # New headers become new columns; older rows read back as NULL
+            for column in self.run_columns:
+                if column not in existing:
+                    connection.execute(f'ALTER TABLE runs ADD COLUMN "{column}"')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    run_id TEXT,
+                    position INTEGER,
+                    role TEXT,
+                    content TEXT,
+                    PRIMARY KEY (run_id, position)
+                )""")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    run_id TEXT PRIMARY KEY,
+                    stage TEXT,
+                    updated_at REAL,
+                    state TEXT
+                )""")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS coverage (
+                    run_id TEXT,
+                    turn INTEGER,
+                    speaker TEXT,
+                    question TEXT,
+                    similarity REAL,
+                    speaker_coverage REAL,
+                    coverage REAL,
+                    PRIMARY KEY (run_id, turn, speaker, question)
+                )""")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS forks (
+                    run_id TEXT PRIMARY KEY,
+                    parent_run_id TEXT,
+                    fork_turn INTEGER,
+                    created_at REAL
+                )""")
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA busy_timeout = 60000")
+        # WAL lets readers (exports, analysis) run while a simulation is writing
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def write_row(self, row, run_id: str = None) -> str:
+        """Stores one log row laid out like utils.headers and returns its run_id."""
+        run_id = run_id or uuid.uuid4().hex
+        values = dict(zip(utils.headers, row))
+        chat_history = values.pop('chat_history', None) or []
+        columns = ", ".join(f'"{c}"' for c in self.run_columns)
+        placeholders = ", ".join("?" for _ in self.run_columns)
+        with self.connect() as connection:
+            # A resumed run may be written again if it crashed right after its first write
+            connection.execute("DELETE FROM messages WHERE run_id = ?", (run_id,))
+            connection.execute(
+                f"INSERT OR REPLACE INTO runs (run_id, created_at, {columns}) VALUES (?, ?, {placeholders})",
+                [run_id, time.time()] + [values.get(c) for c in self.run_columns]
+            )
+            connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?)",
+                [(run_id, position, m["role"], m["content"]) for position, m in enumerate(chat_history)]
+            )
+        return run_id
+
+    def write_coverage(self, run_id: str, points):
+        # points as returned by rubric_coverage.score_transcript; replaces the run's earlier curve
+        with self.connect() as connection:
+            connection.execute("DELETE FROM coverage WHERE run_id = ?", (run_id,))
+            connection.executemany("INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?)", [(run_id, *point) for point in points])
+
+    def read_coverage(self, run_id: str = None) -> dict:
+        # run_id -> coverage points in turn order, for one run or all of them
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            query = ("SELECT run_id, turn, speaker, question, similarity, speaker_coverage, coverage FROM coverage"
+                     + (" WHERE run_id = ?" if run_id else "")
+                     + " ORDER BY run_id, turn, speaker = 'student', question")
+            curves = {}
+            for record in connection.execute(query, (run_id,) if run_id else ()):
+                curves.setdefault(record[0], []).append(tuple(record[1:]))
+            return curves
+        finally:
+            connection.close()
+
+    def save_checkpoint(self, run_id: str, stage: str, state: dict):
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                (run_id, stage, time.time(), json.dumps(state))
+            )
+
+    def load_checkpoint(self, run_id: str):
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            record = connection.execute("SELECT state FROM checkpoints WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            connection.close()
+        return json.loads(record[0]) if record else None
+
+    def unfinished_runs(self, stage: str = None):
+        # (run_id, stage, updated_at) of every run that hasn't written its row yet, optionally only those at `stage`;
+        # fork trunks are only ever branched from, so they aren't listed unless asked for
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            if stage:
+                return connection.execute(
+                    "SELECT run_id, stage, updated_at FROM checkpoints WHERE stage = ? ORDER BY updated_at", (stage,)
+                ).fetchall()
+            return connection.execute(
+                "SELECT run_id, stage, updated_at FROM checkpoints WHERE stage NOT IN ('done', 'forked') ORDER BY updated_at"
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def record_fork(self, run_id: str, parent_run_id: str, fork_turn: int):
+        with self.connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO forks VALUES (?, ?, ?, ?)", (run_id, parent_run_id, fork_turn, time.time()))
+
+    def lineage(self, run_id: str) -> list:
+        # (run_id, fork_turn) from the root run down to run_id; the root's fork_turn is None
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            chain = [(run_id, None)]
+            while True:
+                parent = connection.execute("SELECT parent_run_id, fork_turn FROM forks WHERE run_id = ?", (chain[-1][0],)).fetchone()
+                if parent is None:
+                    break
+                chain[-1] = (chain[-1][0], parent[1])
+                chain.append((parent[0], None))
+            return chain[::-1]
+        finally:
+            connection.close()
+
+    def branches(self, parent_run_id: str) -> list:
+        # (run_id, fork_turn) of every run forked directly from parent_run_id
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            return connection.execute(
+                "SELECT run_id, fork_turn FROM forks WHERE parent_run_id = ? ORDER BY created_at", (parent_run_id,)
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def completed_counts(self) -> dict:
+        # Finished runs per student_profile, i.e. per sweep cell
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            return dict(connection.execute('SELECT "student_profile", COUNT(*) FROM runs GROUP BY "student_profile"').fetchall())
+        finally:
+            connection.close()
+
+    def read_rows(self):
+        # Yields (run_id, row) with rows laid out like utils.headers
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            columns = ", ".join(f'"{c}"' for c in self.run_columns)
+            for record in connection.execute(f"SELECT run_id, {columns} FROM runs ORDER BY created_at").fetchall():
+                run_id, values = record[0], dict(zip(self.run_columns, record[1:]))
+                values['chat_history'] = [
+                    {"role": role, "content": content}
+                    for role, content in connection.execute("SELECT role, content FROM messages WHERE run_id = ? ORDER BY position", (run_id,))
+                ]
+                yield run_id, [values.get(h) for h in utils.headers]
+        finally:
+            connection.close()
+
+    def export_csv(self, path: str = utils.csv_file_path) -> int:
+        """Writes every run as a CSV matching utils.headers (chat_history as a Python list repr, as before)."""
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(utils.headers)
+            for _, row in self.read_rows():
+                writer.writerow(row)
+                count += 1
+        return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the results store for CSV consumers.")
+    parser.add_argument("--db", default=db_path)
+    parser.add_argument("--output", default=utils.csv_file_path)
+    parser.add_argument("--unfinished", action="store_true", help="List runs that can be continued with --resume instead of exporting")
+    parser.add_argument("--lineage", default=None, metavar="RUN_ID", help="Show the runs a run was forked from and the branches forked from it")
+    args = parser.parse_args()
+    if args.lineage:
+        store = ResultsStore(args.db)
+        for depth, (run_id, fork_turn) in enumerate(store.lineage(args.lineage)):
+            print("  " * depth + run_id + (f" (forked at turn {fork_turn})" if fork_turn is not None else ""))
+
+        def print_branches(run_id, depth):
+            for branch_id, fork_turn in store.branches(run_id):
+                print("  " * depth + f"{branch_id} (forked at turn {fork_turn})")
+                print_branches(branch_id, depth + 1)
+
+        print_branches(args.lineage, len(store.lineage(args.lineage)))
+        return
+    if args.unfinished:
+        for run_id, stage, updated_at in ResultsStore(args.db).unfinished_runs():
+            print(f"{run_id}\t{stage}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated_at))}")
+        return
+    count = ResultsStore(args.db).export_csv(args.output)
+    print(f"Exported {count} runs to {args.output}")
+
+if __name__ == "__main__":
+    main()
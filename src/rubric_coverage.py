@@ -0,0 +1,153 @@
+import argparse
+import utils
+
+from collections import defaultdict
+
+# Columns appended to utils.headers, in this order
+coverage_columns = ['Q1_coverage_turn', 'Q2_coverage_turn', 'Q3_coverage_turn', 'stalled_turns']
+# Conversation coverage at which a question counts as covered (--coverage-threshold). Scores are raw BERTScore
+# recall (no baseline rescaling), so the right value depends on the model. 0.75 is a provisional default that has
+# not been validated against labelled conversations; the curves are stored unthresholded, so calibrate by comparing
+# `python rubric_coverage.py --threshold T` for a few values with hand-labelled transcripts, then pass the best as --coverage-threshold.
+default_threshold = 0.75
+active_threshold = default_threshold
+# A turn that doesn't raise any question's coverage by at least this much counts as stalled
+min_gain = 0.01
+
+def transcript_from_history(opening: str, student_history: list, turns: int) -> list:
+    """(turn, speaker, text) of the opening message and every tutor/student turn, without the summary exchange."""
+    # The student's history is [tutor, student, tutor, student, ...], one pair per turn
+    transcript = [(0, "student", opening)]
+    for index, message in enumerate(student_history[:2 * turns]):
+        transcript.append((index // 2 + 1, "tutor" if message["role"] == "user" else "student", message["content"]))
+    return transcript
+
+class CoverageTracker:
+    """
+    Post-hoc per-turn rubric coverage of one conversation.
+
+    Coverage is computed from the finished transcript in the evaluation graph, not while the session
+    runs, so generation (and --generate-only) never loads the scoring model.
+
+    Every message is embedded once and matched token by token against the cached embeddings of the
+    "Correct answer" passages (utils.rubric_answers, via BERTScorer.reference_stats). A question's
+    coverage is the BERTScore recall of its answer against everything said so far: each answer token
+    keeps the best cosine similarity any message token has reached, weighted as bert_score does without
+    idf. Coverage is tracked for the whole conversation and per speaker.
+    """
+    def __init__(self, scorer, references: dict = None):
+        self.scorer = scorer
+        self.references = {}
+        for question, text in (references or utils.rubric_answers).items():
+            embedding, mask, idf = scorer.reference_stats(text)
+            # The cached tensors are shared with summary scoring, so they are normalized out of place
+            weights = (idf[0] * mask[0]).float()
+            self.references[question] = (embedding[0] / embedding[0].norm(dim=-1, keepdim=True), weights / weights.sum())
+        # (speaker, question) -> best similarity reached by each answer token; speaker None is the whole conversation
+        self.best = {}
+        self.points = []
+
+    def add(self, turn: int, speaker: str, embedding, mask) -> list:
+        """
+        Folds one embedded message into the coverage.
+
+        Returns:
+        list: One (turn, speaker, question, similarity, speaker_coverage, coverage) point per question, where
+              similarity is the message's own recall of the answer.
+        """
+        import torch
+        tokens = embedding[mask.bool()]
+        tokens = tokens / tokens.norm(dim=-1, keepdim=True)
+        points = []
+        for question, (reference, weights) in self.references.items():
+            similarity = (reference @ tokens.T).max(dim=1).values
+            for key in ((speaker, question), (None, question)):
+                best = self.best.get(key)
+                self.best[key] = similarity if best is None else torch.maximum(best, similarity)
+            points.append((
+                turn, speaker, question,
+                round(float((similarity * weights).sum()), 4),
+                round(float((self.best[(speaker, question)] * weights).sum()), 4),
+                round(float((self.best[(None, question)] * weights).sum()), 4)
+            ))
+        self.points.extend(points)
+        return points
+
+    def add_messages(self, transcript: list) -> list:
+        # Messages are embedded in the scorer's batches, in order, each once
+        import torch
+        with torch.no_grad():
+            for start in range(0, len(transcript), self.scorer.batch_size):
+                batch = transcript[start:start + self.scorer.batch_size]
+                embeddings, masks, _ = self.scorer.embed([text for _, _, text in batch])
+                for (turn, speaker, _), embedding, mask in zip(batch, embeddings, masks):
+                    self.add(turn, speaker, embedding, mask)
+        return self.points
+
+def summarize(points: list, threshold: float = None) -> list:
+    """Values for coverage_columns: the first turn each question is covered, and the turns that covered nothing new."""
+    threshold = active_threshold if threshold is None else threshold
+    covered = {}
+    gains = defaultdict(float)
+    last = {}
+    for turn, speaker, question, similarity, speaker_coverage, coverage in points:
+        gains[turn] = max(gains[turn], coverage - last.get(question, 0.0))
+        last[question] = coverage
+        if coverage >= threshold and question not in covered:
+            covered[question] = turn
+    stalled = sum(1 for turn, gain in gains.items() if turn > 0 and gain < min_gain)
+    return [covered.get(question) for question in ("Q1", "Q2", "Q3")] + [stalled]
+
+def score_transcript(scorer, transcript: list, threshold: float = None):
+    """Returns (coverage points, values for coverage_columns) of one conversation."""
+    points = CoverageTracker(scorer).add_messages(transcript)
+    return points, summarize(points, threshold)
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+def configure(coverage_threshold: float = default_threshold) -> float:
+    global active_threshold
+    active_threshold = coverage_threshold
+    return active_threshold
+
+def add_coverage_args(parser):
+    parser.add_argument("--coverage-threshold", type=float, default=default_threshold,
+                        help="Coverage at which a rubric question counts as covered in the *_coverage_turn columns (see rubric_coverage.py)")
+
+def configure_from_args(args):
+    return configure(args.coverage_threshold)
+
+def main():
+    # Reads the stored curves only; no model is loaded
+    import results_store
+    parser = argparse.ArgumentParser(description="Turns to rubric coverage by profile, from the post-hoc coverage curves in the results store.")
+    parser.add_argument("--db", default=results_store.db_path)
+    parser.add_argument("--threshold", type=float, default=default_threshold, help="Re-threshold the stored curves, e.g. to calibrate --coverage-threshold")
+    args = parser.parse_args()
+
+    store = results_store.ResultsStore(args.db)
+    curves = store.read_coverage()
+    groups = defaultdict(list)
+    for run_id, row in store.read_rows():
+        if run_id in curves:
+            values = dict(zip(utils.headers, row))
+            groups[(values['knowledge_level'], values['engagement_level'])].append((summarize(curves[run_id], args.threshold), values))
+
+    print(f"Coverage threshold {args.threshold}; turns are means over the runs that covered the question (covered share in brackets)")
+    print(f"{'knowledge':<10}{'engagement':<16}{'runs':>5}{'Q1':>12}{'Q2':>12}{'Q3':>12}{'stalled':>9}{'turns':>7}{'cost $':>9}")
+    for (knowledge_level, engagement_style), runs in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        cells = []
+        for index in range(3):
+            turns = [summary[index] for summary, _ in runs]
+            covered = [t for t in turns if t is not None]
+            cells.append(f"{mean(covered) or 0:.1f} ({len(covered) / len(turns):.0%})" if covered else "- (0%)")
+        stalled = mean(summary[3] for summary, _ in runs)
+        length = mean(values['conversation_counter'] for _, values in runs)
+        cost = mean(values['estimated_cost_usd'] for _, values in runs)
+        print(f"{str(knowledge_level)[:9]:<10}{str(engagement_style)[:15]:<16}{len(runs):>5}{cells[0]:>12}{cells[1]:>12}{cells[2]:>12}"
+              f"{stalled:>9.1f}{length:>7.1f}{cost if cost is not None else float('nan'):>9.4f}")
+
+if __name__ == "__main__":
+    main()
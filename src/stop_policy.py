@@ -0,0 +1,124 @@
+import re
+import time
+import utils
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+@dataclass
+class ConversationState:
+    turns: int = 0
+    total_tokens: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    tutor_response: str = ""
+    student_response: str = ""
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+class StopPolicy:
+    """Decides after every tutor-student exchange whether the conversation should end."""
+    def should_stop(self, state: ConversationState) -> Optional[str]:
+        # Return a short stop reason, or None to keep going
+        return None
+
+class MaxTurns(StopPolicy):
+    def __init__(self, max_turns: int):
+        self.max_turns = max_turns
+
+    def should_stop(self, state):
+        if state.turns >= self.max_turns:
+            return "max_turns"
+        return None
+
+class MaxTotalTokens(StopPolicy):
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+
+    def should_stop(self, state):
+        if state.total_tokens >= self.max_tokens:
+            return "max_tokens"
+        return None
+
+class SessionTimeout(StopPolicy):
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+
+    def should_stop(self, state):
+        if state.elapsed() >= self.timeout_seconds:
+            return "timeout"
+        return None
+
+# Phrases the tutor uses once it has summarized progress and handed the plan back to the student
+# ("After all questions: ... conclude the conversation" in utils.tutor_system_prompt)
+wrap_up_patterns = [
+    r"\bcreate (?:a|your|your own) (?:problem[- ]solving )?plan\b",
+    r"\b(?:use|apply) (?:these|your|this) (?:answers|steps|approach|insights)\b.*\b(?:plan|similar problems?)\b",
+    r"\bgood luck\b",
+    r"\bfeel free to (?:reach out|come back|ask)\b",
+    r"\bhappy (?:studying|learning|problem[- ]solving)\b",
+    r"\byou'?ve (?:now )?(?:completed|covered|worked through) all\b",
+]
+
+class TutorWrapUp(StopPolicy):
+    def __init__(self, patterns: List[str] = None, min_turns: int = 3):
+        self.patterns = [re.compile(p, re.IGNORECASE) for p in (patterns or wrap_up_patterns)]
+        # The opening turns can mention "plan" while the tutor is still introducing Q1
+        self.min_turns = min_turns
+
+    def should_stop(self, state):
+        if state.turns < self.min_turns:
+            return None
+        if any(p.search(state.tutor_response) for p in self.patterns):
+            return "tutor_wrap_up"
+        return None
+
+class ManualControl(StopPolicy):
+    # The original keyboard prompt: Enter continues, 'z' stops
+    def should_stop(self, state):
+        if not utils.execution_control():
+            return "user"
+        return None
+
+class AnyOf(StopPolicy):
+    def __init__(self, policies: List[StopPolicy]):
+        self.policies = policies
+
+    def should_stop(self, state):
+        for policy in self.policies:
+            reason = policy.should_stop(state)
+            if reason:
+                return reason
+        return None
+
+def build_stop_policy(max_turns: int = None, max_tokens: int = None, timeout: float = None, detect_wrap_up: bool = True, interactive: bool = False) -> StopPolicy:
+    policies = []
+    if detect_wrap_up:
+        policies.append(TutorWrapUp())
+    if max_turns:
+        policies.append(MaxTurns(max_turns))
+    if max_tokens:
+        policies.append(MaxTotalTokens(max_tokens))
+    if timeout:
+        policies.append(SessionTimeout(timeout))
+    # Ask the operator last so automatic limits still apply in interactive runs
+    if interactive:
+        policies.append(ManualControl())
+    return AnyOf(policies)
+
+def add_stop_policy_args(parser, interactive: bool = True):
+    parser.add_argument("--max-turns", type=int, default=20, help="Stop after this many tutor-student exchanges")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Stop once tutor and student calls used this many tokens")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-session wall-clock limit in seconds")
+    parser.add_argument("--no-wrap-up-detection", action="store_true", help="Keep going after the tutor concludes the conversation")
+    if interactive:
+        parser.add_argument("--interactive", action="store_true", help="Also prompt for Enter/'z' after every turn")
+
+def stop_policy_from_args(args) -> StopPolicy:
+    return build_stop_policy(
+        max_turns=args.max_turns,
+        max_tokens=args.max_tokens,
+        timeout=args.timeout,
+        detect_wrap_up=not args.no_wrap_up_detection,
+        interactive=getattr(args, "interactive", False)
+    )
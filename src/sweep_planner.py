@@ -0,0 +1,160 @@
+import argparse
+import itertools
+import json
+import math
+import random
+import utils
+import results_store
+
+from dataclasses import dataclass
+from physics_student import StudentProfile, full_profile_gen, simp_profile_gen
+
+class FactorSpace:
+    """
+    A factorial space of student profiles: named factors, each with a list of levels, and the
+    profile generator the levels are passed to. Cells are {factor: level} dicts and are never
+    materialized as a whole; designs walk or sample the space by index.
+    """
+    def __init__(self, name: str, factors: dict, build):
+        self.name = name
+        self.factors = factors
+        self.build = build
+
+    @property
+    def size(self) -> int:
+        return math.prod(len(levels) for levels in self.factors.values())
+
+    def cell_at(self, index: int) -> dict:
+        # Mixed-radix decode, last factor varying fastest (the itertools.product order)
+        cell = {}
+        for factor, levels in reversed(list(self.factors.items())):
+            index, position = divmod(index, len(levels))
+            cell[factor] = levels[position]
+        return {factor: cell[factor] for factor in self.factors}
+
+    def profile(self, cell: dict) -> StudentProfile:
+        return self.build(**cell)
+
+spaces = {
+    # Every combination profile_gen draws from, 13 x 5 x 5 x 5 x 5 cells
+    "full": FactorSpace("full", {
+        "engagement_style": list(utils.student_engagement_styles),
+        "knowledge_level": list(utils.student_knowledge_levels),
+        "expressiveness": list(utils.student_expressiveness_levels),
+        "pacing": list(utils.student_pacing_styles),
+        "confidence": list(utils.student_confidence_levels),
+    }, full_profile_gen),
+    # The simplified prompt used by main.py and batch_runner.py; only styles with traits are valid
+    "simplified": FactorSpace("simplified", {
+        "knowledge_level": list(utils.student_knowledge_levels),
+        "engagement_style": list(utils.student_traits),
+    }, simp_profile_gen),
+}
+
+def full_factorial(space: FactorSpace):
+    factors = list(space.factors)
+    for levels in itertools.product(*space.factors.values()):
+        yield dict(zip(factors, levels))
+
+def random_cells(space: FactorSpace, samples: int, rng: random.Random):
+    # Distinct cells, uniformly at random; range() keeps the sample lazy
+    for index in rng.sample(range(space.size), min(samples, space.size)):
+        yield space.cell_at(index)
+
+def stratified(space: FactorSpace, samples: int, rng: random.Random, strata=("knowledge_level",)):
+    """Splits `samples` evenly across every combination of the `strata` factors and samples the other factors at random within each."""
+    strata_cells = list(full_factorial(FactorSpace(space.name, {f: space.factors[f] for f in strata}, None)))
+    within = FactorSpace(space.name, {f: levels for f, levels in space.factors.items() if f not in strata}, None)
+    # Strata that get the remainder are picked at random so no level is always favoured
+    extra = set(rng.sample(range(len(strata_cells)), samples % len(strata_cells)))
+    for position, fixed in enumerate(strata_cells):
+        count = samples // len(strata_cells) + (position in extra)
+        for cell in random_cells(within, count, rng):
+            yield {factor: {**fixed, **cell}[factor] for factor in space.factors}
+
+def latin_hypercube(space: FactorSpace, samples: int, rng: random.Random):
+    """
+    Every factor's levels appear equally often (within one) across the samples, paired at random.
+
+    Each factor's column is dealt in blocks of its levels, each block a fresh shuffle, so every level
+    appears once per block; the last block is cut short when the samples don't divide evenly.
+    """
+    columns = {}
+    for factor, levels in space.factors.items():
+        column = []
+        while len(column) < samples:
+            column += rng.sample(levels, len(levels))
+        columns[factor] = column[:samples]
+    for i in range(samples):
+        yield {factor: column[i] for factor, column in columns.items()}
+
+designs = {
+    "full": full_factorial,
+    "random": random_cells,
+    "stratified": stratified,
+    "lhs": latin_hypercube,
+}
+
+@dataclass
+class Job:
+    space: str
+    cell: dict
+
+    def profile(self) -> StudentProfile:
+        return spaces[self.space].profile(self.cell)
+
+def plan(space: FactorSpace, cells, runs_per_cell: int = 1, completed: dict = None):
+    """
+    Yields one Job per run still needed: `runs_per_cell` runs for every cell the design produced,
+    minus runs already in `completed` (student_profile -> count, see ResultsStore.completed_counts).
+    A cell produced twice (e.g. by lhs) asks for twice the runs.
+    """
+    remaining = dict(completed or {})
+    for cell in cells:
+        key = str(space.profile(cell))
+        done = min(remaining.get(key, 0), runs_per_cell)
+        remaining[key] = remaining.get(key, 0) - done
+        for _ in range(runs_per_cell - done):
+            yield Job(space.name, cell)
+
+def write_jobs(jobs, path: str) -> int:
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for job in jobs:
+            f.write(json.dumps({"space": job.space, "cell": job.cell}) + "\n")
+            count += 1
+    return count
+
+def read_jobs(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [Job(**json.loads(line)) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a profile sweep and write the runs still missing as a job list for batch_runner.py --jobs.")
+    parser.add_argument("--space", choices=spaces, default="simplified")
+    parser.add_argument("--design", choices=designs, default="full")
+    parser.add_argument("--samples", type=int, default=None, help="Cells to draw for random, stratified and lhs designs")
+    parser.add_argument("--strata", nargs="+", default=["knowledge_level"], help="Factors to stratify on")
+    parser.add_argument("--runs-per-cell", type=int, default=1, help="Completed runs wanted per cell")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--db", default=results_store.db_path, help="Results store whose completed runs are skipped")
+    parser.add_argument("--output", default='../data/jobs.jsonl')
+    args = parser.parse_args()
+
+    space = spaces[args.space]
+    rng = random.Random(args.seed)
+    if args.design == "full":
+        cells = full_factorial(space)
+    elif args.samples is None:
+        parser.error(f"--design {args.design} needs --samples")
+    elif args.design == "stratified":
+        cells = stratified(space, args.samples, rng, strata=args.strata)
+    else:
+        cells = designs[args.design](space, args.samples, rng)
+
+    completed = results_store.ResultsStore(args.db).completed_counts()
+    count = write_jobs(plan(space, cells, args.runs_per_cell, completed), args.output)
+    print(f"Wrote {count} jobs for the {args.design} design over the {args.space} space ({space.size} cells) to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,532 @@
+"""
+Serves the Socratic tutor to live students over HTTP, one AsyncPhysicsTutorSimulator per session.
+
+    POST   /sessions                   -> {"session_id"}
+    POST   /sessions/<id>/messages     {"message": "..."} -> {"reply", "turn", "latency", "stop_reason"}
+                                       with ?stream=1 or Accept: text/event-stream, the reply is sent as SSE
+                                       "delta" events followed by a "done" event carrying the same fields
+    GET    /sessions/<id>              -> session metrics and messages
+    DELETE /sessions/<id>
+    GET    /metrics                    -> server-wide counters and turn latency percentiles
+    POST   /v1/chat/completions        OpenAI-compatible and stateless: the caller sends the whole conversation
+                                       (its system messages are replaced by the tutor prompt), e.g. for load_test.py
+    GET    /healthz
+
+Run from src/: python tutor_server.py [--port 8000] [--fake-llm] [--max-sessions 1000] [--idle-timeout 900]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import uuid
+import rate_limiter
+import client_registry
+import fake_llm
+import compaction
+
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from dotenv import load_dotenv, find_dotenv
+from physics_tutor import AsyncPhysicsTutorSimulator
+from instrumentation import CallTracer, percentile
+from stop_policy import ConversationState, add_stop_policy_args, stop_policy_from_args
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+def rounded(seconds):
+    return None if seconds is None else round(seconds, 3)
+
+class TutorSession:
+    """One student's conversation with its own tutor, plus the latency of every turn it has taken."""
+    def __init__(self, session_id: str, tutor: AsyncPhysicsTutorSimulator, tracer: CallTracer):
+        self.session_id = session_id
+        self.tutor = tutor
+        self.tracer = tracer
+        self.state = ConversationState()
+        # A session takes one turn at a time; a second message while a reply is in flight is refused, not queued
+        self.lock = asyncio.Lock()
+        self.created_at = self.last_active = time.monotonic()
+        self.stop_reason = None
+        self.turn_latencies = []
+        self.first_token_latencies = []
+
+    def idle_for(self, now: float) -> float:
+        return 0.0 if self.lock.locked() else now - self.last_active
+
+    def record_turn(self, message: str, reply: str, latency: float, first_token: float = None):
+        self.state.turns += 1
+        self.state.total_tokens = self.tutor.total_tokens
+        self.state.student_response = message
+        self.state.tutor_response = reply
+        self.turn_latencies.append(latency)
+        if first_token is not None:
+            self.first_token_latencies.append(first_token)
+        self.last_active = time.monotonic()
+
+    def metrics(self) -> dict:
+        billed = [r for r in self.tracer.records if not r.from_cache and r.error is None]
+        return {
+            "session_id": self.session_id,
+            "turns": self.state.turns,
+            "stop_reason": self.stop_reason,
+            "age": round(time.monotonic() - self.created_at, 3),
+            "idle": round(self.idle_for(time.monotonic()), 3),
+            "turn_latency_p50": rounded(percentile(self.turn_latencies, 50)),
+            "turn_latency_p95": rounded(percentile(self.turn_latencies, 95)),
+            "first_token_p50": rounded(percentile(self.first_token_latencies, 50)),
+            "llm_calls": len(billed),
+            "input_tokens": sum(r.input_tokens for r in billed),
+            "output_tokens": sum(r.output_tokens for r in billed),
+            "cost_usd": round(sum(r.cost for r in billed), 6),
+            "compactions": self.tutor.compactions
+        }
+
+class SessionStore:
+    """
+    Live sessions in least-recently-used order.
+
+    Sessions idle for idle_timeout seconds are dropped by sweep(). When max_sessions are live, a new
+    session takes the place of the least recently used idle one; if every session has a turn in flight,
+    creation is refused.
+    """
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 900.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()
+        # Counters
+        self.created = 0
+        self.closed = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    def add(self, session: TutorSession):
+        if len(self.sessions) >= self.max_sessions:
+            victim = next((s for s in self.sessions.values() if not s.lock.locked()), None)
+            if victim is None:
+                raise HTTPError(503, "Session limit reached", {"Retry-After": "5"})
+            del self.sessions[victim.session_id]
+            self.evicted_capacity += 1
+        self.sessions[session.session_id] = session
+        self.created += 1
+
+    def get(self, session_id: str) -> TutorSession:
+        if session_id not in self.sessions:
+            raise HTTPError(404, f"No session {session_id}")
+        self.sessions.move_to_end(session_id)
+        return self.sessions[session_id]
+
+    def remove(self, session_id: str):
+        if self.sessions.pop(session_id, None) is None:
+            raise HTTPError(404, f"No session {session_id}")
+        self.closed += 1
+
+    def evict_idle(self, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        expired = [s.session_id for s in self.sessions.values() if s.idle_for(now) > self.idle_timeout]
+        for session_id in expired:
+            del self.sessions[session_id]
+        self.evicted_idle += len(expired)
+        return len(expired)
+
+    async def sweep(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+class AdmissionGate:
+    """
+    Backpressure on tutor turns.
+
+    Turns run at most as many at a time as the OpenAI limiter currently allows, so when the provider
+    throttles and the limiter halves its concurrency, the server admits fewer turns too. Up to max_queue
+    more turns wait, each for at most queue_timeout seconds; the rest get a 503 with Retry-After instead
+    of piling onto the saturated upstream.
+    """
+    def __init__(self, max_queue: int = 64, queue_timeout: float = 30.0):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # Counters
+        self.admitted = 0
+        self.rejected = 0
+        self.queued_seconds = 0.0
+
+    def capacity(self) -> int:
+        return rate_limiter.get_limiter("openai").concurrency_limit
+
+    def reject(self, message: str):
+        self.rejected += 1
+        return HTTPError(503, message, {"Retry-After": str(max(1, round(self.queue_timeout / 4)))})
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.active >= self.capacity() and self.waiting >= self.max_queue:
+            raise self.reject("Tutor is saturated, try again shortly")
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            # Polled like rate_limiter's in-flight cap, which can grow back without notice
+            while self.active >= self.capacity():
+                if time.monotonic() - start > self.queue_timeout:
+                    raise self.reject("Timed out waiting for the tutor")
+                await asyncio.sleep(0.02)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        self.queued_seconds += time.monotonic() - start
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+class TutorServer:
+    def __init__(self, store: SessionStore, gate: AdmissionGate, stop_policy, api_key: str = None, prompt_cache: bool = False,
+                 trace_path: str = None, max_message_chars: int = 4000):
+        self.store = store
+        self.gate = gate
+        self.stop_policy = stop_policy
+        self.api_key = api_key
+        self.prompt_cache = prompt_cache
+        self.trace_path = trace_path
+        self.max_message_chars = max_message_chars
+        self.started_at = time.monotonic()
+        # Survive session eviction
+        self.turns = 0
+        self.failed_turns = 0
+        self.turn_latencies = deque(maxlen=10000)
+        self.first_token_latencies = deque(maxlen=10000)
+
+    def create_session(self) -> TutorSession:
+        session_id = uuid.uuid4().hex
+        tracer = CallTracer(session_id=session_id, trace_path=self.trace_path)
+        session = TutorSession(session_id, AsyncPhysicsTutorSimulator(self.api_key, prompt_cache=self.prompt_cache, tracer=tracer), tracer)
+        self.store.add(session)
+        return session
+
+    def stateless_session(self, messages: list) -> TutorSession:
+        # A throwaway tutor for /v1/chat/completions, holding the conversation the caller sent
+        session_id = uuid.uuid4().hex
+        tracer = CallTracer(session_id=session_id, trace_path=self.trace_path)
+        tutor = AsyncPhysicsTutorSimulator(self.api_key, prompt_cache=self.prompt_cache, tracer=tracer)
+        # Without a session to keep it in, a rolling summary would be rewritten on every call
+        tutor.compaction = None
+        tutor.conversation_history += messages
+        return TutorSession(session_id, tutor, tracer)
+
+    async def take_turn(self, session: TutorSession, message: str, on_delta=None) -> dict:
+        """Answers one student message; with on_delta, the reply is streamed through it as it arrives."""
+        if session.stop_reason:
+            raise HTTPError(409, f"Session has ended ({session.stop_reason})")
+        if session.lock.locked():
+            raise HTTPError(409, "A reply is already in progress for this session")
+        async with session.lock, self.gate.slot():
+            history = session.tutor.conversation_history
+            before = len(history)
+            start = time.perf_counter()
+            first_token = None
+            try:
+                if on_delta is None:
+                    reply = await session.tutor.generate_response(message)
+                else:
+                    async for delta in session.tutor.generate_response_stream(message):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        await on_delta(delta)
+                    reply = history[-1]["content"]
+            except BaseException:
+                # A failed or abandoned turn leaves no half exchange behind, so the student can send the message again
+                del history[before:]
+                self.failed_turns += 1
+                raise
+            latency = time.perf_counter() - start
+        session.record_turn(message, reply, latency, first_token)
+        session.stop_reason = self.stop_policy.should_stop(session.state)
+        self.turns += 1
+        self.turn_latencies.append(latency)
+        if first_token is not None:
+            self.first_token_latencies.append(first_token)
+        return {"session_id": session.session_id, "turn": session.state.turns, "reply": reply, "latency": round(latency, 3),
+                "stop_reason": session.stop_reason}
+
+    def metrics(self) -> dict:
+        limiter = rate_limiter.get_limiter("openai")
+        return {
+            "uptime": round(time.monotonic() - self.started_at, 1),
+            "sessions": {"live": len(self.store.sessions), "created": self.store.created, "closed": self.store.closed,
+                         "evicted_idle": self.store.evicted_idle, "evicted_capacity": self.store.evicted_capacity},
+            "turns": {"completed": self.turns, "failed": self.failed_turns, "in_flight": self.gate.active, "queued": self.gate.waiting,
+                      "rejected": self.gate.rejected, "capacity": self.gate.capacity(),
+                      "queue_wait_avg": round(self.gate.queued_seconds / self.gate.admitted, 3) if self.gate.admitted else None},
+            "turn_latency": {f"p{q}": rounded(percentile(self.turn_latencies, q)) for q in (50, 95, 99)},
+            "first_token_latency": {f"p{q}": rounded(percentile(self.first_token_latencies, q)) for q in (50, 95, 99)},
+            "upstream": limiter.stats()
+        }
+
+    def parse_message(self, body: bytes) -> str:
+        try:
+            message = json.loads(body or b"{}").get("message")
+        except (ValueError, AttributeError):
+            raise HTTPError(400, "Body must be a JSON object")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "Missing \"message\"")
+        if len(message) > self.max_message_chars:
+            raise HTTPError(413, f"Messages are limited to {self.max_message_chars} characters")
+        return message
+
+    def parse_chat_request(self, body: bytes):
+        # (stream, conversation without system messages) of a chat completion request ending in the student's message
+        try:
+            request = json.loads(body or b"{}")
+            messages = [{"role": m["role"], "content": m["content"]} for m in request["messages"] if m["role"] != "system"]
+        except (ValueError, KeyError, TypeError):
+            raise HTTPError(400, "Body must be a chat completion request with \"messages\"")
+        if not messages or messages[-1]["role"] != "user" or not all(isinstance(m["content"], str) for m in messages):
+            raise HTTPError(400, "Messages must be text and end with the student's")
+        if len(messages[-1]["content"]) > self.max_message_chars:
+            raise HTTPError(413, f"Messages are limited to {self.max_message_chars} characters")
+        return bool(request.get("stream")), messages
+
+    async def route(self, method: str, path: str, query: dict, headers: dict, body: bytes, writer):
+        # Returns (status, payload), or None once an SSE response has been written
+        parts = [p for p in path.split("/") if p]
+        if parts == ["healthz"] and method == "GET":
+            return 200, {"ok": True}
+        if parts == ["metrics"] and method == "GET":
+            return 200, self.metrics()
+        if parts == ["sessions"] and method == "POST":
+            return 201, {"session_id": self.create_session().session_id}
+        if len(parts) == 2 and parts[0] == "sessions":
+            if method == "GET":
+                session = self.store.get(parts[1])
+                return 200, {**session.metrics(), "messages": session.tutor.conversation_history[1:]}
+            if method == "DELETE":
+                self.store.remove(parts[1])
+                return 200, {"closed": parts[1]}
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages" and method == "POST":
+            session = self.store.get(parts[1])
+            message = self.parse_message(body)
+            if query.get("stream", ["0"])[0] in ("1", "true") or "text/event-stream" in headers.get("accept", ""):
+                await self.stream_turn(session, message, writer, SessionEvents())
+                return None
+            return 200, await self.take_turn(session, message)
+        if parts == ["v1", "chat", "completions"] and method == "POST":
+            stream, messages = self.parse_chat_request(body)
+            session = self.stateless_session(messages[:-1])
+            events = ChatCompletionEvents(session.tutor.model)
+            if stream:
+                await self.stream_turn(session, messages[-1]["content"], writer, events)
+                return None
+            return 200, events.completion(await self.take_turn(session, messages[-1]["content"]), session)
+        raise HTTPError(404, f"No route for {method} {path}")
+
+    async def stream_turn(self, session: TutorSession, message: str, writer, events):
+        started = False
+
+        async def send_delta(delta):
+            nonlocal started
+            # Headers go out with the first token, so a turn refused before that still gets a normal error response
+            if not started:
+                writer.write(response_head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Connection": "close"}))
+                started = True
+            writer.write(events.delta(delta))
+            await writer.drain()
+
+        try:
+            result = await self.take_turn(session, message, on_delta=send_delta)
+        except ConnectionError:
+            raise
+        except Exception as error:
+            if not started:
+                raise
+            writer.write(events.error(error))
+            await writer.drain()
+            return
+        if not started:
+            writer.write(response_head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Connection": "close"}))
+        writer.write(events.done(result, session))
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as error:
+                    write_json(writer, error.status, {"error": str(error)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                url = urlsplit(target)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    response = await self.route(method, url.path, parse_qs(url.query), headers, body, writer)
+                except HTTPError as error:
+                    response = error.status, {"error": str(error)}, error.headers
+                except Exception as error:
+                    # Upstream failures after the limiter's retries; throttling is the student's cue to retry later
+                    if rate_limiter.retryable(error):
+                        response = 503, {"error": repr(error)}, {"Retry-After": str(max(1, round(rate_limiter.retry_after(error) or 1)))}
+                    else:
+                        response = 502, {"error": repr(error)}
+                if response is None:
+                    break
+                status, payload, *extra = response
+                write_json(writer, status, payload, extra[0] if extra else None, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+max_body_bytes = 1 << 20
+
+async def read_request(reader):
+    # (method, target, lowercased headers, body) of the next HTTP/1.1 request, or None when the client is done
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > max_body_bytes:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+def response_head(status: int, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def write_json(writer, status: int, payload: dict, headers: dict = None, keep_alive: bool = True):
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json", "Content-Length": len(body), "Connection": "keep-alive" if keep_alive else "close", **(headers or {})}
+    writer.write(response_head(status, headers) + body)
+
+def sse_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+def sse_data(data) -> bytes:
+    return f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode("utf-8")
+
+class SessionEvents:
+    # Stream of /sessions/<id>/messages
+    def delta(self, text: str) -> bytes:
+        return sse_event("delta", {"delta": text})
+
+    def done(self, result: dict, session: TutorSession) -> bytes:
+        return sse_event("done", result)
+
+    def error(self, error) -> bytes:
+        return sse_event("error", {"error": repr(error)})
+
+class ChatCompletionEvents:
+    """Responses of /v1/chat/completions in OpenAI's chat.completion and chat.completion.chunk shapes."""
+    def __init__(self, model: str):
+        self.id = f"chatcmpl-{uuid.uuid4().hex}"
+        self.model = model
+        self.created = int(time.time())
+
+    def usage(self, session: TutorSession) -> dict:
+        usage = session.tutor.call_usage[-1] if session.tutor.call_usage else {"input_tokens": 0, "output_tokens": 0}
+        return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["input_tokens"] + usage["output_tokens"]}
+
+    def completion(self, result: dict, session: TutorSession) -> dict:
+        return {"id": self.id, "object": "chat.completion", "created": self.created, "model": self.model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": result["reply"]}, "finish_reason": "stop"}],
+                "usage": self.usage(session)}
+
+    def chunk(self, delta: dict, finish_reason: str = None, usage: dict = None) -> dict:
+        return {"id": self.id, "object": "chat.completion.chunk", "created": self.created, "model": self.model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], "usage": usage}
+
+    def delta(self, text: str) -> bytes:
+        return sse_data(self.chunk({"content": text}))
+
+    def done(self, result: dict, session: TutorSession) -> bytes:
+        return sse_data(self.chunk({}, "stop", self.usage(session))) + sse_data("[DONE]")
+
+    def error(self, error) -> bytes:
+        return sse_data({"error": {"message": repr(error)}})
+
+async def serve(server: TutorServer, host: str, port: int):
+    listener = await asyncio.start_server(server.handle, host, port)
+    sweeper = asyncio.create_task(server.store.sweep(min(30.0, server.store.idle_timeout / 4)))
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    print(f"Tutor server listening on http://{host}:{port}")
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        sweeper.cancel()
+        await client_registry.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the tutor to many concurrent students over HTTP and SSE.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-sessions", type=int, default=1000, help="Live sessions; the least recently used idle one makes room for a new one")
+    parser.add_argument("--idle-timeout", type=float, default=900.0, help="Seconds without a message before a session is dropped")
+    parser.add_argument("--max-queue", type=int, default=64, help="Turns that may wait for the saturated upstream before new ones get a 503")
+    parser.add_argument("--queue-timeout", type=float, default=30.0, help="Seconds a turn may wait for the upstream")
+    parser.add_argument("--max-message-chars", type=int, default=4000, help="Longest accepted student message")
+    add_stop_policy_args(parser, interactive=False)
+    parser.add_argument("--prompt-cache", action="store_true", help="Enable provider-side prompt caching")
+    rate_limiter.add_rate_limit_args(parser)
+    client_registry.add_client_args(parser)
+    fake_llm.add_fake_llm_args(parser)
+    compaction.add_compaction_args(parser)
+    parser.add_argument("--trace", default=None, help="Append one JSON line per LLM call to this file")
+    args = parser.parse_args()
+    rate_limiter.configure_from_args(args)
+    client_registry.configure_from_args(args)
+    fake_backend = fake_llm.configure_from_args(args)
+    compaction.configure_from_args(args)
+
+    # Load enviornment for LLM APIs
+    _ = load_dotenv(find_dotenv())
+    server = TutorServer(
+        SessionStore(max_sessions=args.max_sessions, idle_timeout=args.idle_timeout),
+        AdmissionGate(max_queue=args.max_queue, queue_timeout=args.queue_timeout),
+        stop_policy_from_args(args),
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        prompt_cache=args.prompt_cache,
+        trace_path=args.trace,
+        max_message_chars=args.max_message_chars
+    )
+    asyncio.run(serve(server, args.host, args.port))
+    print(json.dumps(server.metrics(), indent=2))
+    client_registry.print_stats()
+    if fake_backend:
+        print(fake_backend.stats())
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,4 @@
 import re
-import csv
-import os
 
 simplified_system_prompt = """
 <studentConfig>
@@ -372,6 +370,12 @@ question_summary_prompt = """
     and piles. The number of piles is provided, allowing even distribution of weight.
 """
 
+# The "Correct answer" passages of tutor_system_prompt by question; rubric_coverage.py tracks them turn by turn
+rubric_answers = {
+    question: " ".join(answer.replace(" {technical term}", "").split())
+    for question, answer in re.findall(r"\*\*Correct answer to (Q\d)\*\* (.*?)\n\n", tutor_system_prompt, re.S)
+}
+
 physics_problem = """
     The Millennium Tower in San Francisco is sinking. Estimate the friction force required from each pile to prevent the tower from sinking. The tower is 605 feet tall, has a base of 20,000 square feet, and weighs about 7 tons per square foot. The tower sits on a 10-ft thick concrete slab, which is in-turn supported by 950 friction piles.The friction piles are pounded into the bay sand but not long enough to touch bedrock. The piles are square, each slide measuring 14 inches, and have a length of 80 feet.
     """
@@ -413,6 +417,40 @@ def generate_LLM_evaluator_prompt(tutor_summary):
     """
     return LLM_evaluator_prompt
 
+# Rolling summary that replaces the tutor's older turns once its history is compacted (see compaction.py)
+tutor_compaction_prompt = """
+    You keep the running notes of a physics tutoring session. The tutor asks three predefined questions in order:
+    Q1: What physics knowledge would help solve the problem and how is it connected to the key features of the problem?
+    Q2: What information is needed for solving the problem?
+    Q3: How can all required information be obtained?
+
+    You get the previous notes (if any) and the next part of the transcript. Write updated notes of at most 200 words
+    from which the tutor can continue the session without the transcript, in this format:
+
+    Progress: which of Q1, Q2, Q3 have been asked, which the student has answered satisfactorily, and which is in progress.
+    Student: what the student has said or got right so far, and their misconceptions or confusions.
+    Hints given: hints and technical terms the tutor has already provided.
+    Tutor turns: the total number of tutor messages covered by the notes.
+
+    Only use what is in the previous notes and the transcript.
+    """
+
+def generate_tutor_compaction_prompt(previous_summary, messages):
+    transcript = "\n".join(f"{'Tutor' if m['role'] == 'assistant' else 'Student'}: {m['content']}" for m in messages)
+    return f"""
+    Previous notes:
+    '''
+    {previous_summary or "None yet, this is the start of the session."}
+    '''
+    Next part of the transcript:
+    '''
+    {transcript}
+    '''
+    """
+
+def compacted_history_message(summary):
+    return f"Notes on the earlier part of this session (the most recent messages follow verbatim):\n{summary}"
+
 def extract_scores(response):
     """
     Extracts Recall, Precision, and F1 Score from the given response text.
@@ -445,6 +483,55 @@ def extract_scores(response):
         f1_score
     ]
 
+def estimate_tokens(text):
+    # Rough count for budgeting and reports: about four characters per token for English text
+    return (len(text) + 3) // 4
+
+def extract_usage(response):
+    """
+    Normalizes OpenAI and Anthropic usage blocks.
+
+    Returns:
+    dict: input_tokens (including cached ones), output_tokens, cached_tokens (prompt-cache hits)
+          and cache_write_tokens (Anthropic cache writes).
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0}
+    if getattr(usage, "prompt_tokens", None) is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input_tokens": usage.prompt_tokens,
+            "output_tokens": usage.completion_tokens or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+            "cache_write_tokens": 0
+        }
+    # Anthropic's input_tokens only counts the tokens after the last cache breakpoint
+    cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+    written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+    return {
+        "input_tokens": (usage.input_tokens or 0) + cached + written,
+        "output_tokens": usage.output_tokens or 0,
+        "cached_tokens": cached,
+        "cache_write_tokens": written
+    }
+
+def summarize_usage(call_usage):
+    # Totals over the per-call usage dicts kept by each simulator
+    totals = {"calls": len(call_usage), "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0}
+    for usage in call_usage:
+        for key in ("input_tokens", "output_tokens", "cached_tokens", "cache_write_tokens"):
+            totals[key] += usage[key]
+    totals["cache_hit_rate"] = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+    return totals
+
+def print_usage_report(usage_by_agent):
+    # usage_by_agent maps an agent name to its list of per-call usage dicts
+    for name, call_usage in usage_by_agent.items():
+        totals = summarize_usage(call_usage)
+        print(f"{name}: {totals['calls']} calls, {totals['input_tokens']} input tokens "
+              f"({totals['cached_tokens']} cached, {totals['cache_hit_rate']:.0%}), {totals['output_tokens']} output tokens")
+
 def execution_control():
     # Handle user input and return whether to continue the loop
     user_input = input().lower()  # Convert to lowercase for case-insensitive comparison
@@ -466,14 +553,21 @@ headers = [
     'LLM_Precision_Tutor', 'LLM_Recall_Tutor','LLM_score_Tutor', 
     'BERT_Precision_Tutor', 'BERT_Recall_Tutor', 'BERT_score_Tutor',
     'LLM_Precision_Student', 'LLM_Recall_Student','LLM_score_Student', 
-    'BERT_Precision_Student', 'BERT_Recall_Student', 'BERT_score_Student'
+    'BERT_Precision_Student', 'BERT_Recall_Student', 'BERT_score_Student',
+    # Columns added since go after the original ones, so positional readers of older CSVs keep working
+    # Why the conversation ended, see stop_policy.py
+    'stop_reason',
+    # BERTScore runtime and model the BERT_* columns came from, e.g. torch:microsoft/deberta-xlarge-mnli
+    'bert_model',
+    # Per-conversation call metrics, see instrumentation.metric_columns
+    'api_calls', 'api_wall_time', 'api_ttft_avg', 'input_tokens', 'output_tokens', 'cached_tokens', 'estimated_cost_usd',
+    # Wall time of the end-of-run evaluation graph (summaries and scores) in seconds, see eval_graph.py
+    'evaluation_time',
+    # First turn each rubric answer was covered and turns that covered nothing new, see rubric_coverage.coverage_columns
+    'Q1_coverage_turn', 'Q2_coverage_turn', 'Q3_coverage_turn', 'stalled_turns'
 ]
 
-def write_data(data):
-    file_exists = os.path.exists(csv_file_path)
-
-    with open(csv_file_path, mode='a', newline='', encoding='utf-8') as csv_file:
-        writer = csv.writer(csv_file)
-        if not file_exists:
-            writer.writerow(headers)
-        writer.writerow(data)
\ No newline at end of file
+def write_data(data, run_id=None):
+    # Runs are stored in the SQLite results store; `python results_store.py` exports csv_file_path for CSV consumers
+    import results_store # results_store reads headers from this module
+    return results_store.ResultsStore().write_row(data, run_id=run_id)
@@ -0,0 +1,45 @@
+import os
+import sys
+import pytest
+
+# The modules live flat in src/ and import each other by name, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import llm_backend
+import response_cache
+import rate_limiter
+import compaction
+import results_store
+import fake_llm
+import rubric_coverage
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    # configure_* calls set module-level state; none of it leaks between tests, and nothing is written to data/
+    monkeypatch.setattr(llm_backend, "active_backend", None)
+    monkeypatch.setattr(response_cache, "active_cache", None)
+    monkeypatch.setattr(rate_limiter, "limiters", {})
+    monkeypatch.setattr(compaction, "active_policy", None)
+    monkeypatch.setattr(rubric_coverage, "active_threshold", rubric_coverage.default_threshold)
+    monkeypatch.setattr(results_store, "db_path", str(tmp_path / "results.sqlite"))
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """The offline fake LLM, fast enough for tests; replies and failures are deterministic."""
+    backend = fake_llm.FakeLLMBackend(fake_llm.FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=4))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    return backend
+
+@pytest.fixture
+def log_row():
+    """A complete log row as build_log_row lays it out, with text that needs CSV quoting."""
+    import batch_runner
+    from gpt_evaluator import build_log_row
+    profile = batch_runner.parse_profile("1:lowMotivation")
+    chat_history = [{"role": "system", "content": "tutor"}, {"role": "user", "content": "Can you help me?"},
+                    {"role": "assistant", "content": "Sure, with commas, \"quotes\"\nand newlines."}]
+    return build_log_row(profile, chat_history, "tutor summary", "student summary", 4, 400, 200, "tutor_wrap_up",
+                         (0.81, 0.82, 0.83), (0.71, 0.72, 0.73), (0.9, 0.8, 0.85), (0.6, 0.5, 0.55),
+                         call_metrics=[9, 12.5, 0.4, 1000, 200, 0, 0.02], evaluation_time=3.21, coverage_summary=[1, 2, None, 0])
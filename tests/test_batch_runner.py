@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+import llm_backend
+import batch_runner
+import checkpoint
+import sweep_planner
+
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+from results_store import ResultsStore
+from sweep_planner import Job, spaces
+
+class RecordingBackend(FakeLLMBackend):
+    """The fake backend, keeping every request it answers."""
+    def __init__(self, config):
+        super().__init__(config)
+        self.requests = []
+
+    async def asend(self, client, provider, request, stream=False):
+        self.requests.append((provider, request))
+        return await super().asend(client, provider, request, stream)
+
+def run_jobs(monkeypatch, jobs):
+    backend = RecordingBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=4))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    results = asyncio.run(batch_runner.run_batch([], jobs=jobs, evaluate=False))
+    assert not [r for r in results if isinstance(r, BaseException)]
+    return [request["system"] for provider, request in backend.requests if provider == "anthropic"]
+
+def test_full_space_job_renders_every_factor(monkeypatch):
+    job = Job("full", spaces["full"].cell_at(1234))
+    systems = run_jobs(monkeypatch, [job])
+    assert systems
+    profile = job.profile()
+    for system in systems:
+        text = system if isinstance(system, str) else "".join(block["text"] for block in system)
+        assert "<traits>None</traits>" not in text
+        for value in (profile.confidence, profile.expressiveness, profile.pacing, profile.knowledge_level, profile.engagement_style):
+            assert value in text
+
+def test_simplified_job_keeps_the_simplified_prompt(monkeypatch):
+    job = Job("simplified", spaces["simplified"].cell_at(3))
+    systems = run_jobs(monkeypatch, [job])
+    text = systems[0] if isinstance(systems[0], str) else "".join(block["text"] for block in systems[0])
+    assert f"<traits>{job.profile().traits}</traits>" in text
+
+def test_job_space_is_checkpointed(monkeypatch):
+    run_jobs(monkeypatch, [Job("full", spaces["full"].cell_at(0))])
+    store = ResultsStore()
+    [(run_id, stage, _)] = store.unfinished_runs()
+    assert stage == checkpoint.SUMMARIZED
+    assert checkpoint.RunProgress.load(store, run_id).space == "full"
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr("sys.argv", ["batch_runner.py", *argv])
+    batch_runner.main()
+
+@pytest.mark.parametrize("argv, message", [
+    (["--fork-at", "2", "--resume", "abc"], "needs at least one --profile"),
+    (["--fork-at", "2", "--jobs", "jobs.jsonl"], "--jobs can't be forked"),
+    (["--fork-from", "abc", "--jobs", "jobs.jsonl"], "--jobs can't be forked"),
+])
+def test_fork_argument_errors(monkeypatch, tmp_path, capsys, argv, message):
+    monkeypatch.chdir(tmp_path)
+    sweep_planner.write_jobs([Job("simplified", spaces["simplified"].cell_at(0))], "jobs.jsonl")
+    with pytest.raises(SystemExit) as exit:
+        run_main(monkeypatch, "--fake-llm", *argv)
+    assert exit.value.code == 2
+    assert message in capsys.readouterr().err
+
+def test_run_batch_refuses_to_fork_jobs():
+    trunk = checkpoint.RunProgress.start("trunk", batch_runner.parse_profile("1:lowMotivation"))
+    with pytest.raises(ValueError):
+        asyncio.run(batch_runner.run_batch([], trunk=trunk, jobs=[Job("simplified", spaces["simplified"].cell_at(0))]))
+
+def test_generate_only_reports_usage(fake_backend):
+    usage = {"tutor": [], "student": [], "evaluator": []}
+    results = asyncio.run(batch_runner.run_batch([batch_runner.parse_profile("1:lowMotivation")], usage=usage, evaluate=False))
+    assert results == [None]
+    # Every turn and both summaries were billed; nothing was evaluated
+    turns = checkpoint.RunProgress.load(ResultsStore(), ResultsStore().unfinished_runs()[0][0]).turns
+    assert len(usage["tutor"]) == len(usage["student"]) == turns + 1
+    assert usage["evaluator"] == []
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+import cassette
+import llm_backend
+
+from cassette import CassetteMiss
+
+requests = {
+    "openai": {"model": "gpt-4-turbo", "messages": [{"role": "system", "content": "You are a tutor."},
+                                                    {"role": "user", "content": "Can you help me?"}], "max_tokens": 100, "temperature": 0},
+    "anthropic": {"model": "claude-3-5-haiku-20241022", "system": "You are a student.",
+                  "messages": [{"role": "user", "content": "What forces act on a pile?"}], "max_tokens": 100, "temperature": 0},
+}
+
+def call(provider, mode, request=None):
+    request = request or requests[provider]
+    results = []
+    if mode == "sync":
+        results.append(llm_backend.call_llm(None, provider, request))
+    elif mode == "async":
+        results.append(asyncio.run(llm_backend.acall_llm(None, provider, request)))
+    elif mode == "stream":
+        text = "".join(llm_backend.stream_llm(None, provider, request, results.append))
+        assert text == results[0].text
+    else:
+        async def consume():
+            return "".join([delta async for delta in llm_backend.astream_llm(None, provider, request, results.append)])
+        assert asyncio.run(consume()) == results[0].text
+    return results[0].text, results[0].usage
+
+modes = ["sync", "async", "stream", "astream"]
+
+def tagged(provider, mode):
+    request = {**requests[provider], "messages": [dict(m) for m in requests[provider]["messages"]]}
+    request["messages"][-1]["content"] += f" ({mode})"
+    return request
+
+@pytest.fixture
+def recorded(tmp_path, fake_backend):
+    path = str(tmp_path / "calls.jsonl")
+    recorder = cassette.configure(path, cassette.RECORD)
+    # Each mode and provider is recorded under a request of its own
+    originals = {(provider, mode): call(provider, mode, tagged(provider, mode)) for provider in requests for mode in modes}
+    assert recorder.recorded == len(originals)
+    return path, originals
+
+@pytest.mark.parametrize("provider", list(requests))
+@pytest.mark.parametrize("mode", modes)
+def test_replay_serves_the_recording(monkeypatch, recorded, fake_backend, provider, mode):
+    path, originals = recorded
+    monkeypatch.setattr(llm_backend, "active_backend", None)
+    player = cassette.configure(path, cassette.REPLAY)
+    calls = fake_backend.calls
+    assert call(provider, mode, tagged(provider, mode)) == originals[(provider, mode)]
+    assert fake_backend.calls == calls and player.replayed == 1
+
+def test_replay_is_independent_of_the_mode_recorded(monkeypatch, recorded):
+    # A non-streamed recording can be replayed as a stream and vice versa
+    path, originals = recorded
+    monkeypatch.setattr(llm_backend, "active_backend", None)
+    cassette.configure(path, cassette.REPLAY)
+    assert call("anthropic", "astream", tagged("anthropic", "sync")) == originals[("anthropic", "sync")]
+    assert call("openai", "sync", tagged("openai", "stream")) == originals[("openai", "stream")]
+
+def test_unrecorded_request_names_the_first_difference(monkeypatch, recorded):
+    path, _ = recorded
+    monkeypatch.setattr(llm_backend, "active_backend", None)
+    player = cassette.configure(path, cassette.REPLAY)
+    request = tagged("openai", "sync")
+    request["messages"][-1]["content"] = "Can you help me with Q2?"
+    with pytest.raises(CassetteMiss) as miss:
+        call("openai", "sync", request)
+    message = str(miss.value)
+    assert "gpt-4-turbo request with 2 messages" in message
+    assert "shares the first 1 messages" in message and "'Can you help me with Q2?'" in message
+    assert player.unmatched == [message]
+
+def test_unrecorded_model_is_reported(monkeypatch, recorded):
+    path, _ = recorded
+    monkeypatch.setattr(llm_backend, "active_backend", None)
+    cassette.configure(path, cassette.REPLAY)
+    with pytest.raises(CassetteMiss, match="nothing was recorded for anthropic claude-3-opus"):
+        call("anthropic", "sync", {**requests["anthropic"], "model": "claude-3-opus"})
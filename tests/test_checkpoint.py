@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+import batch_runner
+import checkpoint
+import llm_backend
+
+from checkpoint import RunProgress
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+from results_store import ResultsStore
+from stop_policy import build_stop_policy
+
+config = FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=5)
+profile = batch_runner.parse_profile("2:highMotivation")
+
+class Killed(Exception):
+    pass
+
+class KilledAfter(FakeLLMBackend):
+    """Dies on its `calls`-th request, like a process killed mid-conversation."""
+    def __init__(self, config, calls):
+        super().__init__(config)
+        self.limit = calls
+
+    async def asend(self, client, provider, request, stream=False):
+        if self.calls + 1 >= self.limit:
+            raise Killed()
+        return await super().asend(client, provider, request, stream)
+
+def run(monkeypatch, progress, backend, **kwargs):
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    return asyncio.run(batch_runner.run_session(progress, build_stop_policy(), evaluate=False, **kwargs))
+
+def transcript(progress):
+    return progress.tutor_state["conversation_history"], progress.student_state["conversation_history"]
+
+def test_killed_run_resumes_to_the_same_transcript(monkeypatch):
+    store = ResultsStore()
+    reference = RunProgress.start("reference", profile)
+    run(monkeypatch, reference, FakeLLMBackend(config))
+
+    killed = RunProgress.start("killed", profile)
+    with pytest.raises(Killed):
+        # Two turns and the third tutor reply, then the student call dies
+        run(monkeypatch, killed, KilledAfter(config, calls=6))
+    saved = RunProgress.load(store, "killed")
+    assert (saved.stage, saved.turns) == (checkpoint.CONVERSATION, 2)
+
+    run(monkeypatch, saved, FakeLLMBackend(config))
+    resumed = RunProgress.load(store, "killed")
+    assert resumed.stage == checkpoint.SUMMARIZED
+    assert (resumed.turns, resumed.stop_reason) == (reference.turns, reference.stop_reason)
+    assert transcript(resumed) == transcript(reference)
+    assert (resumed.tutor_summary, resumed.student_summary) == (reference.tutor_summary, reference.student_summary)
+
+def test_fork_records_parent_and_turn():
+    trunk = RunProgress.start("trunk", profile)
+    trunk.turns = 3
+    trunk.tutor_state = {"conversation_history": [{"role": "system", "content": "tutor"}], "call_usage": [{"input_tokens": 5}]}
+    trunk.call_records = [{"agent": "tutor"}]
+    branch = trunk.fork("branch", batch_runner.parse_profile("1:lowMotivation"))
+    assert (branch.parent_run_id, branch.fork_turn, branch.turns) == ("trunk", 3, 3)
+    assert branch.profile["engagement_style"] != trunk.profile["engagement_style"]
+    assert branch.tutor_state["conversation_history"] == trunk.tutor_state["conversation_history"]
+    # The shared turns were billed to the trunk
+    assert branch.call_records == [] and branch.tutor_state["call_usage"] == []
+    assert trunk.tutor_state["call_usage"] == [{"input_tokens": 5}]
+
+def test_forked_batch_records_lineage(monkeypatch):
+    monkeypatch.setattr(llm_backend, "active_backend", FakeLLMBackend(config))
+    trunk = RunProgress.start("trunk", profile)
+    profiles = [batch_runner.parse_profile("1:lowMotivation"), batch_runner.parse_profile("3:dontCare")]
+    results = asyncio.run(batch_runner.run_batch(profiles, trunk=trunk, fork_at=2, evaluate=False))
+    assert results == [None, None]
+
+    store = ResultsStore()
+    assert RunProgress.load(store, "trunk").stage == checkpoint.FORKED
+    branches = store.branches("trunk")
+    assert [fork_turn for _, fork_turn in branches] == [2, 2]
+    for run_id, _ in branches:
+        branch = RunProgress.load(store, run_id)
+        assert (branch.parent_run_id, branch.fork_turn) == ("trunk", 2)
+        assert branch.stage == checkpoint.SUMMARIZED and branch.turns > 2
+        assert store.lineage(run_id) == [("trunk", None), (run_id, 2)]
+
+def test_fork_trunks_cannot_be_resumed(monkeypatch, capsys):
+    import main
+    store = ResultsStore()
+    trunk = RunProgress.start("trunk", profile)
+    trunk.stage = checkpoint.FORKED
+    store.save_checkpoint(trunk.run_id, trunk.stage, trunk.__dict__)
+    with pytest.raises(ValueError):
+        asyncio.run(batch_runner.run_batch([], resume=["trunk"]))
+    for module, argv in ((main, ["main.py", "--fake-llm", "--resume", "trunk"]),
+                         (batch_runner, ["batch_runner.py", "--fake-llm", "--resume", "trunk"])):
+        monkeypatch.setattr("sys.argv", argv)
+        with pytest.raises(SystemExit):
+            module.main()
+        assert "--fork-from trunk" in capsys.readouterr().err
+    assert RunProgress.load(store, "trunk").turns == 0
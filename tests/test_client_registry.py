@@ -0,0 +1,51 @@
+import asyncio
+import weakref
+import pytest
+import client_registry
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(client_registry, "_clients", {})
+    monkeypatch.setattr(client_registry, "_async_clients", weakref.WeakKeyDictionary())
+    monkeypatch.setattr(client_registry, "connection_stats",
+                        {provider: client_registry.ConnectionStats(provider) for provider in ("openai", "anthropic")})
+    monkeypatch.setattr(client_registry, "settings", client_registry.PoolSettings())
+
+def test_one_shared_client_per_provider_and_key():
+    openai = client_registry.get_client("openai", "key")
+    anthropic = client_registry.get_client("anthropic", "key")
+    assert client_registry.get_client("openai", "key") is openai
+    assert client_registry.get_client("anthropic", "key") is anthropic
+    assert openai is not anthropic
+    assert client_registry.get_client("openai", "other key") is not openai
+    assert client_registry.get_client("openai", "key", base_url="http://localhost:8000/v1") is not openai
+    assert client_registry.connection_stats["openai"].pools == 3
+    assert client_registry.connection_stats["anthropic"].pools == 1
+
+def test_pool_settings_reach_the_http_client():
+    client_registry.configure(max_connections=4, max_keepalive=2, timeout=9.0)
+    pool = client_registry.get_client("openai", "key")._client._transport._pool
+    assert (pool._max_connections, pool._max_keepalive_connections) == (4, 2)
+    assert client_registry.get_client("openai", "key").max_retries == 0
+
+def test_close_releases_the_pools():
+    openai = client_registry.get_client("openai", "key")
+    anthropic = client_registry.get_client("anthropic", "key")
+    client_registry.close()
+    assert client_registry._clients == {}
+    assert openai._client.is_closed and anthropic._client.is_closed
+    assert client_registry.get_client("openai", "key") is not openai
+
+def test_async_clients_are_shared_per_event_loop():
+    async def clients():
+        first = client_registry.get_client("openai", "key", is_async=True)
+        assert client_registry.get_client("openai", "key", is_async=True) is first
+        assert client_registry.get_client("openai", "key") is not first
+        await client_registry.aclose()
+        assert first._client.is_closed
+        return first
+
+    first = asyncio.run(clients())
+    second = asyncio.run(clients())
+    assert second is not first
+    assert len(client_registry._async_clients) == 0
@@ -0,0 +1,74 @@
+import utils
+import llm_backend
+
+from compaction import CompactionPolicy
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+from physics_tutor import PhysicsTutorSimulator
+
+class RecordingBackend(FakeLLMBackend):
+    def __init__(self, config):
+        super().__init__(config)
+        self.requests = []
+
+    def send(self, client, provider, request, stream=False):
+        self.requests.append(request)
+        return super().send(client, provider, request, stream)
+
+def history(exchanges):
+    # The tutor's history when compaction is considered: [system, student, tutor, student, tutor, ...]
+    messages = [{"role": "system", "content": "system"}]
+    for turn in range(exchanges):
+        messages += [{"role": "user", "content": f"student {turn}"}, {"role": "assistant", "content": f"tutor {turn}"}]
+    return messages
+
+def test_no_cut_below_the_threshold():
+    policy = CompactionPolicy(threshold_tokens=1000, keep_turns=2)
+    assert policy.cut(history(10), 1, view_tokens=1000) is None
+
+def test_cut_keeps_the_last_turns():
+    policy = CompactionPolicy(threshold_tokens=100, keep_turns=2)
+    messages = history(6)
+    cut = policy.cut(messages, 1, view_tokens=101)
+    assert cut == len(messages) - 4
+    # The kept tail starts at a student turn, so it reads as whole exchanges
+    assert messages[cut]["role"] == "user"
+
+def test_cut_waits_for_keep_turns_new_exchanges():
+    policy = CompactionPolicy(threshold_tokens=100, keep_turns=2)
+    messages = history(6)
+    first = policy.cut(messages, 1, view_tokens=101)
+    # One more exchange isn't enough to fold again, two are
+    assert policy.cut(history(7), first, view_tokens=101) is None
+    assert policy.cut(history(8), first, view_tokens=101) == first + 4
+
+def test_compacted_requests_keep_the_system_prompt_and_recent_turns(monkeypatch):
+    backend = RecordingBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=100))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    policy = CompactionPolicy(threshold_tokens=utils.estimate_tokens(utils.tutor_system_prompt) + 200, keep_turns=2)
+    tutor = PhysicsTutorSimulator("test", compaction_policy=policy)
+    for turn in range(12):
+        tutor.generate_response(f"Student message {turn}")
+
+    assert tutor.compactions >= 2
+    # The logged history is never compacted
+    assert len(tutor.conversation_history) == 1 + 2 * 12
+    summaries = [r for r in backend.requests if r["model"] == policy.model]
+    assert len(summaries) == tutor.compactions
+    assert "None yet" in summaries[0]["messages"][1]["content"]
+    # Each summary call folds the previous notes forward
+    assert tutor.summary != summaries[-1]["messages"][1]["content"] and "Progress:" in summaries[-1]["messages"][1]["content"]
+
+    last = backend.requests[-1]["messages"]
+    assert last[0] == {"role": "system", "content": utils.tutor_system_prompt}
+    assert last[1] == {"role": "system", "content": utils.compacted_history_message(tutor.summary)}
+    # Everything after the summary is the history verbatim: at least keep_turns whole exchanges, then the new student turn
+    tail = tutor.conversation_history[tutor.compacted_through:-1]
+    assert last[2:] == tail
+    assert len(tail) >= 2 * policy.keep_turns + 1 and tail[0]["role"] == "user"
+    assert last[-1] == {"role": "user", "content": "Student message 11"}
+
+def test_summary_is_inserted_only_when_compacted(monkeypatch, fake_backend):
+    tutor = PhysicsTutorSimulator("test", compaction_policy=CompactionPolicy(threshold_tokens=10 ** 6))
+    for turn in range(3):
+        tutor.generate_response(f"Student message {turn}")
+    assert tutor.compactions == 0 and tutor.request_messages() == tutor.conversation_history
@@ -0,0 +1,54 @@
+import asyncio
+import llm_backend
+import utils
+
+from fake_llm import FakeLLMBackend, FakeLLMConfig, wrap_up_reply
+
+config = FakeLLMConfig(latency_ms=1, latency_sigma=0.0)
+
+def request(content, model="gpt-4-turbo"):
+    return {"model": model, "messages": [{"role": "system", "content": "You are a tutor."}, {"role": "user", "content": content}],
+            "max_tokens": 50, "temperature": 0}
+
+def reply(backend, provider, request_):
+    return llm_backend.parse_response(provider, backend.send(None, provider, request_))
+
+def test_same_request_same_reply_and_usage():
+    first = reply(FakeLLMBackend(config), "openai", request("What is the net force?"))
+    again = reply(FakeLLMBackend(config), "openai", request("What is the net force?"))
+    assert first == again and first.text
+    assert first.usage == {"input_tokens": llm_backend.estimate_request_tokens(request("What is the net force?")) - 50,
+                           "output_tokens": utils.estimate_tokens(first.text), "cached_tokens": 0, "cache_write_tokens": 0}
+    low, high = config.output_tokens
+    # The filler overshoots the drawn length by at most one 12-word chunk
+    assert low <= first.usage["output_tokens"] <= high + 20
+
+def test_reply_follows_the_request_and_seed():
+    backend = FakeLLMBackend(config)
+    base = reply(backend, "openai", request("What is the net force?"))
+    assert reply(backend, "openai", request("Why is it zero?")).text != base.text
+    assert reply(backend, "openai", request("What is the net force?", model="gpt-4o")).text != base.text
+    reseeded = FakeLLMBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0, seed=1))
+    assert reply(reseeded, "openai", request("What is the net force?")).text != base.text
+
+def test_sync_and_async_replies_agree():
+    backend = FakeLLMBackend(config)
+    sync = reply(backend, "anthropic", request("hello"))
+    async_ = llm_backend.parse_response("anthropic", asyncio.run(backend.asend(None, "anthropic", request("hello"))))
+    assert sync == async_
+    assert backend.calls == 2
+
+def test_streamed_reply_matches_the_plain_one(fake_backend):
+    plain = llm_backend.call_llm(None, "openai", request("hello"))
+    results = []
+    streamed = "".join(llm_backend.stream_llm(None, "openai", request("hello"), results.append))
+    assert streamed == plain.text
+    assert results[0].text == plain.text and results[0].usage == plain.usage
+
+def test_tutor_wraps_up_on_schedule():
+    backend = FakeLLMBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=3))
+    messages = [{"role": "system", "content": "You are a tutor."}, {"role": "user", "content": "hi"}]
+    for turn in range(3):
+        text = reply(backend, "openai", {"model": "gpt-4-turbo", "messages": messages, "max_tokens": 50}).text
+        assert (text == wrap_up_reply) == (turn == 2)
+        messages += [{"role": "assistant", "content": text}, {"role": "user", "content": f"student {turn}"}]
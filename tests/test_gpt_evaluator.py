@@ -0,0 +1,56 @@
+import csv
+import utils
+
+legacy_csv = "data/student_tutor_sim(legacy).csv"
+
+def test_log_row_matches_headers(log_row):
+    values = dict(zip(utils.headers, log_row))
+    assert len(log_row) == len(utils.headers)
+    assert values['conversation_counter'] == 4
+    assert values['tutor_response_avg'] == 100 and values['student_response_avg'] == 50
+    assert values['BERT_score_Student'] == 0.73 and values['stop_reason'] == "tutor_wrap_up"
+    assert values['Q2_coverage_turn'] == 2 and values['stalled_turns'] == 0
+
+def test_original_columns_keep_their_positions():
+    # Positional readers of CSVs written before the new columns still find every original column
+    with open(legacy_csv, newline='', encoding='utf-8') as f:
+        legacy_headers = next(csv.reader(f))
+    assert utils.headers[:len(legacy_headers)] == legacy_headers
+
+def test_prompt_cache_keeps_the_judge_prompt():
+    from gpt_evaluator import GPTEvaluator
+    plain = GPTEvaluator("test").build_request("A summary.")
+    cached = GPTEvaluator("test", prompt_cache=True).build_request("A summary.")
+    assert cached.pop("prompt_cache_key") == "gpt-evaluator"
+    assert cached == plain
+    assert plain["messages"][1]["content"] == utils.generate_LLM_evaluator_prompt("A summary.")
+
+def test_sync_graph_never_runs_two_scorer_steps_at_once(monkeypatch, fake_backend):
+    import threading
+    import time
+    import gpt_evaluator
+    from eval_graph import EvalGraph
+
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def on_scorer(result):
+        # Stands in for a forward pass of the shared BERTScorer
+        def step(*args):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            return result
+        return step
+
+    monkeypatch.setattr(gpt_evaluator, "compute_bert_scores_batch", on_scorer([(0.1, 0.2, 0.3)] * 2))
+    monkeypatch.setattr(gpt_evaluator, "compute_rubric_coverage", on_scorer(([], [None, None, None, 0])))
+    graph = EvalGraph().add("tutor_summary", lambda: "Tutor summary.").add("student_summary", lambda: "Student summary.")
+    gpt_evaluator.add_scoring_steps(graph, gpt_evaluator.GPTEvaluator("test"), transcript=[(0, "student", "Hi")])
+    graph.run()
+    assert graph.results["bert"] == [(0.1, 0.2, 0.3)] * 2 and graph.results["coverage"][1] == [None, None, None, 0]
+    assert max(peak) == 1
@@ -0,0 +1,59 @@
+import json
+import time
+import pytest
+
+from instrumentation import CallTracer, estimate_cost, metric_columns, percentile
+
+def usage(input_tokens=0, output_tokens=0, cached_tokens=0, cache_write_tokens=0):
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "cached_tokens": cached_tokens,
+            "cache_write_tokens": cache_write_tokens}
+
+def started(seconds_ago=0.0):
+    return time.time() - seconds_ago, time.perf_counter() - seconds_ago
+
+def test_uncached_input_and_output_pricing():
+    # gpt-4o: $2.50 in, $10.00 out per million tokens
+    assert estimate_cost("gpt-4o", usage(1_000_000, 100_000)) == pytest.approx(2.50 + 1.00)
+
+def test_cached_and_cache_write_tokens_have_their_own_prices():
+    # claude-3-5-sonnet: $3.00 in, $0.30 cached, $3.75 cache write; both are part of input_tokens
+    cost = estimate_cost("claude-3-5-sonnet-20241022", usage(1_000_000, 0, cached_tokens=600_000, cache_write_tokens=300_000))
+    assert cost == pytest.approx(0.1 * 3.00 + 0.6 * 0.30 + 0.3 * 3.75)
+    # OpenAI discounts cached input and charges no premium for writing it
+    assert estimate_cost("gpt-4o", usage(1_000_000, 0, cached_tokens=1_000_000)) == pytest.approx(1.25)
+
+def test_unknown_models_cost_nothing():
+    assert estimate_cost("some-new-model", usage(1_000_000, 1_000_000)) == 0.0
+
+def test_summary_counts_only_billed_calls():
+    tracer = CallTracer("session")
+    tracer.record("tutor", "openai", "gpt-4o", started(0.2), usage=usage(1000, 100, cached_tokens=500))
+    tracer.record("student", "anthropic", "claude-3-5-sonnet-20241022", started(0.4), first_token_at=time.perf_counter() - 0.3,
+                  usage=usage(2000, 200, cache_write_tokens=1000))
+    hit = tracer.record("tutor", "openai", "gpt-4o", started(), usage=usage(1000, 100), from_cache=True)
+    tracer.record("tutor", "openai", "gpt-4o", started(5.0), error="RateLimitError")
+    assert hit.cost == 0.0
+
+    calls, wall_time, ttft, input_tokens, output_tokens, cached_tokens, cost = tracer.summary()
+    assert len(tracer.summary()) == len(metric_columns)
+    assert (calls, input_tokens, output_tokens, cached_tokens) == (2, 3000, 300, 500)
+    assert wall_time == pytest.approx(0.6, abs=0.05)
+    assert ttft == pytest.approx((0.2 + 0.1) / 2, abs=0.05)
+    assert cost == pytest.approx(sum(r.cost for r in tracer.records[:2]), abs=1e-6)
+
+def test_summary_of_no_calls():
+    assert CallTracer().summary() == [0, 0, None, 0, 0, 0, 0]
+
+def test_records_are_mirrored_to_the_trace(tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    tracer = CallTracer("session", str(trace_path))
+    tracer.record("tutor", "openai", "gpt-4o", started(), usage=usage(10, 2))
+    tracer.record("student", "anthropic", "claude-3-5-haiku-20241022", started(), error="APIConnectionError")
+    lines = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert [(line["session_id"], line["agent"], line["error"]) for line in lines] == [
+        ("session", "tutor", None), ("session", "student", "APIConnectionError")]
+
+def test_percentile_is_nearest_rank():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 3
+    assert percentile(list(range(1, 101)), 99) == 100
@@ -0,0 +1,55 @@
+import asyncio
+import llm_backend
+import rate_limiter
+
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+
+def request(content):
+    return {"model": "gpt-4-turbo", "messages": [{"role": "user", "content": content}], "max_tokens": 50, "temperature": 0}
+
+def test_concurrent_streams_never_exceed_the_limit(monkeypatch):
+    # Streams last far longer than it takes to open them, so permits given back at open would let all six run at once
+    config = FakeLLMConfig(latency_ms=300, latency_sigma=0.0, ttft_fraction=0.05, stream_chunks=8)
+    monkeypatch.setattr(llm_backend, "active_backend", FakeLLMBackend(config))
+    limiter = rate_limiter.configure("openai", max_concurrency=2)
+    streaming = 0
+    peak = 0
+
+    async def consume(i):
+        nonlocal streaming, peak
+        results = []
+        started = False
+        async for delta in llm_backend.astream_llm(None, "openai", request(f"question {i}"), results.append):
+            if not started:
+                started = True
+                streaming += 1
+                peak = max(peak, streaming)
+            assert limiter.in_flight <= 2
+        streaming -= 1
+        return results[0]
+
+    async def run():
+        return await asyncio.gather(*[consume(i) for i in range(6)])
+
+    results = asyncio.run(run())
+    assert all(result.text for result in results)
+    assert peak == 2
+    assert limiter.in_flight == 0 and limiter.calls == 6
+
+def test_sync_stream_holds_its_permit_until_exhausted(fake_backend):
+    limiter = rate_limiter.get_limiter("openai")
+    results = []
+    stream = llm_backend.stream_llm(None, "openai", request("hello"), results.append)
+    next(stream)
+    assert limiter.in_flight == 1
+    assert "".join(stream)
+    assert limiter.in_flight == 0 and limiter.calls == 1 and results
+
+def test_closing_a_stream_early_releases_its_permit(fake_backend):
+    limiter = rate_limiter.get_limiter("anthropic")
+    stream = llm_backend.stream_llm(None, "anthropic", {"model": "claude", "system": "s", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 50}, print)
+    next(stream)
+    assert limiter.in_flight == 1
+    stream.close()
+    # An abandoned stream is neither a success nor throttling, so the adaptive limit is untouched
+    assert limiter.in_flight == 0 and limiter.calls == 0 and limiter.concurrency_limit == limiter.max_concurrency
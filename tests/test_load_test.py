@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+import utils
+import client_registry
+import llm_backend
+import rate_limiter
+
+from collections import Counter
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+from stop_policy import build_stop_policy
+from tutor_server import TutorServer, SessionStore, AdmissionGate
+from load_test import LoadTest, TurnRecord, parse_mix, print_report, summarize
+
+mix = ["1:lowMotivation=3", "5:highMotivation=1"]
+
+def tutor_server(max_queue=64):
+    return TutorServer(SessionStore(), AdmissionGate(max_queue=max_queue, queue_timeout=5.0), build_stop_policy(), api_key="test")
+
+def run_load_test(server, qps, duration, **settings):
+    # Students on the fake backend against the tutor server on a local port, which answers from the fake backend too
+    async def main():
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            client = client_registry.get_client("openai", "none", is_async=True, base_url=f"http://127.0.0.1:{port}/v1")
+            test = LoadTest(client, "gpt-4-turbo", parse_mix(mix), qps, duration, build_stop_policy(),
+                            system_prompt=utils.tutor_system_prompt, **settings)
+            await test.run()
+            await client_registry.aclose()
+        return test
+    return asyncio.run(main())
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    backend = FakeLLMBackend(FakeLLMConfig(latency_ms=300, latency_sigma=0.0))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    return backend
+
+@pytest.mark.parametrize("stream", [False, True], ids=["plain", "stream"])
+def test_every_arrival_is_one_tutor_turn(fake_backend, stream):
+    server = tutor_server()
+    test = run_load_test(server, qps=40, duration=1.0, stream=stream, max_students=3)
+    records = test.records
+    arrivals = len(records) + len(test.unserved)
+    # Poisson arrivals at 40/s for 1s
+    assert 15 <= arrivals <= 70
+    assert all(0 < scheduled <= 1.0 for scheduled in [r.scheduled for r in records] + test.unserved)
+    assert [r.error for r in records] == [None] * len(records)
+    # Each request reached the server as one stateless turn
+    assert server.turns == len(records) and server.failed_turns == 0 and not server.store.sessions
+    assert all(r.latency >= 0 and r.finished >= r.scheduled and r.output_tokens > 0 for r in records)
+    assert all((r.first_token is not None) == stream for r in records)
+    assert test.students <= 3 and {r.profile for r in records} <= {"1:lowMotivation", "5:highMotivation"}
+    # Students count their turns and leave when the tutor wraps up, after wrap_up_after turns
+    for student in range(1, test.students + 1):
+        turns = [r.turn for r in records if r.student == student]
+        assert turns == list(range(1, len(turns) + 1)) and len(turns) <= fake_backend.config.wrap_up_after
+    assert test.finished_students == sum(1 for s in range(1, test.students + 1)
+                                         if sum(r.student == s for r in records) == fake_backend.config.wrap_up_after)
+
+def test_refused_turns_are_counted_and_retried(slow_backend):
+    # One turn at a time and no queue: the server turns away every arrival while a turn is in flight
+    rate_limiter.configure("openai", max_concurrency=1)
+    server = tutor_server(max_queue=0)
+    test = run_load_test(server, qps=20, duration=1.0)
+    errors = Counter(r.error for r in test.records)
+    assert errors["503"] == server.gate.rejected > 0
+    assert errors[None] == server.turns > 0
+    assert set(errors) == {None, "503"} and not test.unserved
+    # A refused student sends the same turn again on a later arrival
+    for record in test.records:
+        if record.error:
+            retries = [r for r in test.records if r.student == record.student and r.scheduled > record.scheduled]
+            assert not retries or retries[0].turn == record.turn
+
+def test_turns_still_in_flight_after_the_drain_timeout_are_errors(slow_backend):
+    server = tutor_server()
+    test = run_load_test(server, qps=20, duration=0.2, drain_timeout=0.01)
+    assert test.records and all(r.error == "drain_timeout" for r in test.records)
+    assert test.students == len(test.records) and test.finished_students == 0
+    # Cut off before any reply could arrive
+    assert all(r.latency < slow_backend.config.latency_ms / 1000 for r in test.records)
+
+def test_connection_failures_are_labelled():
+    async def main():
+        client = client_registry.get_client("openai", "none", is_async=True, base_url="http://127.0.0.1:9/v1")
+        test = LoadTest(client, "gpt-4-turbo", parse_mix(mix), 20, 0.3, build_stop_policy())
+        await test.run()
+        await client_registry.aclose()
+        return test
+    test = asyncio.run(main())
+    assert test.records and {r.error for r in test.records} == {"APIConnectionError"}
+    # Failed turns are retried, so no student gets past its opening message
+    assert {r.turn for r in test.records} == {1} and test.students < len(test.records)
+
+def record(scheduled, finished, student, profile, turn, first_token=None, error=None):
+    return TurnRecord(scheduled, finished, student, profile, turn, latency=round(finished - scheduled, 3),
+                      first_token=first_token, output_tokens=10, error=error)
+
+def test_report_fields(capsys):
+    test = LoadTest(None, "gpt-4-turbo", parse_mix(mix), qps=2, duration=2.0, stop_policy=build_stop_policy(), max_students=2)
+    test.records = [record(0.1, 0.5, 1, "1:lowMotivation", 1, first_token=0.1),
+                    record(0.6, 1.2, 2, "5:highMotivation", 1, error="503"),
+                    record(1.1, 1.4, 1, "1:lowMotivation", 2, first_token=0.05)]
+    test.unserved = [1.5]
+    test.students, test.finished_students = 2, 1
+    test.student_errors["RateLimitError"] += 1
+    print_report(test, 1.0)
+    lines = capsys.readouterr().out.splitlines()
+    rows = {line.split()[0]: line.split()[1:] for line in lines if line.strip()}
+    # window: offered/s, ok/s, turns, ok, errors, p50, p95, p99, ttft50
+    assert rows["0-1s"] == ["2.00", "1.00", "1", "1", "0.0%", "0.40", "0.40", "0.40", "0.10"]
+    assert rows["1-2s"] == ["2.00", "1.00", "2", "1", "50.0%", "0.30", "0.30", "0.30", "0.05"]
+    assert rows["1:lowMotivation"] == ["2", "2", "0.0%", "0.40", "0.40", "0.40", "0.10"]
+    assert rows["5:highMotivation"] == ["1", "0", "100.0%", "-", "-", "-", "-"]
+    assert rows["Total"] == ["3", "2", "33.3%", "0.40", "0.40", "0.40", "0.10"]
+    assert "Offered 2 turns/s for 2s: 4 arrivals, 1.43 successful turns/s over 1.4s" in lines
+    assert "Errors: 503 1 (33.3%)" in lines
+    assert "1 arrivals found every one of the 2 students busy (raise --max-students)" in lines
+    assert "Students: 2 joined, 1 finished their conversation, student model errors: RateLimitError 1" in lines
+
+def test_summary_of_no_turns():
+    assert summarize([]).split() == ["0", "0", "0.0%", "-", "-", "-", "-"]
+
+def test_profile_mix():
+    assert parse_mix(mix) == [("1:lowMotivation", 3.0), ("5:highMotivation", 1.0)]
+    with pytest.raises(KeyError):
+        parse_mix(["1:curious"])
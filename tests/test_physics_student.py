@@ -0,0 +1,19 @@
+import utils
+
+from physics_student import PhysicsStudentSimulator, simp_profile_gen, full_profile_gen
+from sweep_planner import spaces
+
+def student(profile, if_simplified):
+    return PhysicsStudentSimulator("test", profile, utils.physics_problem, if_simplified=if_simplified, prompt_cache=True)
+
+def test_short_system_prompt_gets_no_breakpoint_of_its_own():
+    simplified = student(simp_profile_gen(knowledge_level="1", engagement_style="lowMotivation"), True)
+    request = simplified.build_request("What forces act on the tower?")
+    assert request["system"] == simplified.system_prompt
+    assert request["messages"][-1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+def test_long_system_prompt_is_cached_on_its_own():
+    full = student(full_profile_gen(**spaces["full"].cell_at(0)), False)
+    request = full.build_request("What forces act on the tower?")
+    assert request["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert request["system"][0]["text"] == full.system_prompt
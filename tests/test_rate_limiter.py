@@ -0,0 +1,68 @@
+import llm_backend
+import rate_limiter
+
+from fake_llm import FakeLLMBackend, FakeLLMConfig, FakeRateLimitError
+
+class FlakySend:
+    """send() for ProviderLimiter.call: fails with a 429 the first `failures` times."""
+    def __init__(self, failures: int, retry_after: float = 0.01):
+        self.failures = failures
+        self.retry_after = retry_after
+        self.attempts = 0
+
+    def __call__(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise FakeRateLimitError(self.retry_after)
+        return "ok"
+
+def test_429_is_retried_and_halves_the_concurrency_limit():
+    limiter = rate_limiter.ProviderLimiter("openai", max_concurrency=8)
+    send = FlakySend(failures=2)
+    assert limiter.call(send) == "ok"
+    assert send.attempts == 3
+    assert (limiter.retries, limiter.throttled_responses, limiter.calls) == (2, 2, 1)
+    assert limiter.concurrency_limit == 2
+    assert limiter.in_flight == 0
+    # retry-after is honoured, so the wait is what the provider asked for
+    assert limiter.throttled_seconds >= 0.02
+
+def test_limit_creeps_back_after_successes():
+    limiter = rate_limiter.ProviderLimiter("openai", max_concurrency=4)
+    limiter.call(FlakySend(failures=1))
+    assert limiter.concurrency_limit == 2
+    for _ in range(2):
+        limiter.call(FlakySend(failures=0))
+    assert limiter.concurrency_limit == 3
+
+def test_retries_give_up_after_max_retries():
+    limiter = rate_limiter.ProviderLimiter("openai", max_retries=1)
+    send = FlakySend(failures=5)
+    try:
+        limiter.call(send)
+    except FakeRateLimitError:
+        pass
+    else:
+        raise AssertionError("the 429 should have been raised")
+    assert send.attempts == 2 and limiter.calls == 0 and limiter.in_flight == 0
+
+def test_other_errors_are_not_retried():
+    limiter = rate_limiter.ProviderLimiter("openai", max_concurrency=4)
+
+    def send():
+        raise ValueError("bad request")
+    try:
+        limiter.call(send)
+    except ValueError:
+        pass
+    assert limiter.retries == 0 and limiter.concurrency_limit == 4
+
+def test_fake_backend_429s_go_through_the_shared_limiter(monkeypatch):
+    # Every attempt of this request is throttled until the seeded draws let one through
+    backend = FakeLLMBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0, error_rate=0.5, retry_after=0.001, seed=3))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    limiter = rate_limiter.configure("openai", max_concurrency=16, max_retries=20)
+    for i in range(10):
+        llm_backend.call_llm(None, "openai", {"model": "gpt-4-turbo", "messages": [{"role": "user", "content": f"q{i}"}], "max_tokens": 20, "temperature": 0})
+    assert backend.injected_errors == limiter.retries == limiter.throttled_responses > 0
+    assert limiter.calls == 10
@@ -0,0 +1,30 @@
+import csv
+import llm_backend
+import rescore
+
+from fake_llm import FakeLLMBackend, FakeLLMConfig
+
+class RejectingBackend(FakeLLMBackend):
+    """Fails every judgment of a summary containing "REJECT" with an error that isn't retried."""
+    async def asend(self, client, provider, request, stream=False):
+        if "REJECT" in request["messages"][-1]["content"]:
+            raise ValueError("invalid request")
+        return await super().asend(client, provider, request, stream)
+
+def test_failed_judgments_leave_the_other_scores(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(llm_backend, "active_backend", RejectingBackend(FakeLLMConfig(latency_ms=1, latency_sigma=0.0)))
+    source, output = tmp_path / "summaries.csv", tmp_path / "scores.csv"
+    with open(source, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["student_profile", "tutor_summary", "student_summary"])
+        writer.writeheader()
+        writer.writerow({"student_profile": "a", "tutor_summary": "Forces balance.", "student_summary": "REJECT"})
+        writer.writerow({"student_profile": "b", "tutor_summary": "Friction per pile.", "student_summary": "Weight over piles."})
+    monkeypatch.setattr("sys.argv", ["rescore.py", "--input", str(source), "--output", str(output)])
+    rescore.main()
+
+    out = capsys.readouterr().out
+    assert "Judgment 0:student_summary failed: ValueError('invalid request')" in out
+    assert "Scored 3/4 summaries" in out
+    rows = list(csv.DictReader(open(output, encoding="utf-8")))
+    assert rows[0]["LLM_score_Tutor"] and not rows[0]["LLM_score_Student"]
+    assert rows[1]["LLM_score_Tutor"] and rows[1]["LLM_score_Student"]
@@ -0,0 +1,73 @@
+import copy
+import pytest
+import llm_backend
+import response_cache
+
+from response_cache import ResponseCache
+
+base = {
+    "model": "claude-3-5-sonnet-20240620",
+    "system": "You are a student.",
+    "messages": [{"role": "user", "content": "What is the net force?"}, {"role": "assistant", "content": "Zero."},
+                 {"role": "user", "content": "Why?"}],
+    "temperature": 0,
+    "max_tokens": 1000,
+}
+usage = {"input_tokens": 10, "output_tokens": 2, "cached_tokens": 0, "cache_write_tokens": 0}
+
+def changed(path, value):
+    request = copy.deepcopy(base)
+    target = request
+    for step in path[:-1]:
+        target = target[step]
+    target[path[-1]] = value
+    return request
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.store("anthropic", base, "Equilibrium.", usage)
+    return cache
+
+def test_identical_request_hits(cache):
+    assert cache.lookup("anthropic", copy.deepcopy(base)) == ("Equilibrium.", usage)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+def test_prompt_cache_hints_do_not_change_the_key(cache):
+    request = changed(("system",), [{"type": "text", "text": "You are a student.", "cache_control": {"type": "ephemeral"}}])
+    assert cache.lookup("anthropic", request) == ("Equilibrium.", usage)
+
+@pytest.mark.parametrize("provider, request_", [
+    ("openai", base),
+    ("anthropic", changed(("model",), "claude-3-haiku-20240307")),
+    ("anthropic", changed(("system",), "You are a tutor.")),
+    ("anthropic", changed(("messages", 2, "content"), "Why not?")),
+    ("anthropic", changed(("messages", 1, "role"), "user")),
+    ("anthropic", changed(("messages",), base["messages"][:1])),
+    ("anthropic", changed(("max_tokens",), 500)),
+], ids=["provider", "model", "system", "content", "role", "history", "max_tokens"])
+def test_each_key_field_misses(cache, provider, request_):
+    assert cache.lookup(provider, request_) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+def test_sampled_requests_are_never_cached(cache):
+    request = changed(("temperature",), 0.7)
+    cache.store("anthropic", request, "Maybe.", usage)
+    assert cache.lookup("anthropic", request) is None
+    assert cache.writes == 1
+
+def test_write_only_refreshes_without_serving(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path).store("anthropic", base, "Old.", usage)
+    refresh = ResponseCache(path, mode=response_cache.WRITE_ONLY)
+    assert refresh.lookup("anthropic", base) is None
+    refresh.store("anthropic", base, "New.", usage)
+    assert ResponseCache(path).lookup("anthropic", base)[0] == "New."
+
+def test_call_llm_serves_repeats_from_the_cache(tmp_path, fake_backend):
+    response_cache.configure(str(tmp_path / "cache.sqlite"))
+    first = llm_backend.call_llm(None, "anthropic", base)
+    second = llm_backend.call_llm(None, "anthropic", copy.deepcopy(base))
+    assert not first.from_cache and second.from_cache
+    assert second.text == first.text
+    assert fake_backend.calls == 1
@@ -0,0 +1,22 @@
+import csv
+import sys
+import utils
+
+from results_store import ResultsStore
+
+def test_row_round_trips_through_the_store(log_row):
+    store = ResultsStore()
+    run_id = store.write_row(log_row, run_id="run")
+    assert list(store.read_rows()) == [(run_id, log_row)]
+
+def test_row_round_trips_through_the_csv_export(tmp_path, log_row):
+    store = ResultsStore()
+    store.write_row(log_row)
+    path = str(tmp_path / "export.csv")
+    assert store.export_csv(path) == 1
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline='', encoding='utf-8') as f:
+        header, exported = list(csv.reader(f))
+    assert header == utils.headers
+    # CSV cells are text; chat_history is written as its Python repr, as before
+    assert exported == ["" if value is None else str(value) for value in log_row]
@@ -0,0 +1,23 @@
+import argparse
+import rubric_coverage
+
+# (turn, speaker, question, similarity, speaker_coverage, coverage)
+points = [
+    (0, "student", "Q1", 0.5, 0.5, 0.5), (0, "student", "Q2", 0.4, 0.4, 0.4), (0, "student", "Q3", 0.3, 0.3, 0.3),
+    (1, "tutor", "Q1", 0.8, 0.8, 0.8), (1, "tutor", "Q2", 0.6, 0.6, 0.6), (1, "tutor", "Q3", 0.3, 0.3, 0.3),
+    (2, "tutor", "Q1", 0.5, 0.8, 0.8), (2, "tutor", "Q2", 0.5, 0.6, 0.6), (2, "tutor", "Q3", 0.3, 0.3, 0.3),
+    (3, "student", "Q1", 0.9, 0.9, 0.9), (3, "student", "Q2", 0.7, 0.7, 0.7), (3, "student", "Q3", 0.2, 0.3, 0.3),
+]
+
+def test_summarize_uses_the_configured_threshold():
+    assert rubric_coverage.summarize(points) == [1, None, None, 1]
+    rubric_coverage.configure(0.55)
+    assert rubric_coverage.summarize(points) == [1, 1, None, 1]
+    # An explicit threshold, as the report's --threshold passes, wins over the configured one
+    assert rubric_coverage.summarize(points, 0.85) == [3, None, None, 1]
+
+def test_coverage_threshold_option():
+    parser = argparse.ArgumentParser()
+    rubric_coverage.add_coverage_args(parser)
+    assert rubric_coverage.configure_from_args(parser.parse_args(["--coverage-threshold", "0.6"])) == 0.6
+    assert rubric_coverage.active_threshold == 0.6
@@ -0,0 +1,34 @@
+import asyncio
+import batch_runner
+import fake_llm
+
+from checkpoint import RunProgress
+from stop_policy import ConversationState, TutorWrapUp, MaxTurns, build_stop_policy
+
+def state(turns, tutor_response):
+    return ConversationState(turns=turns, tutor_response=tutor_response)
+
+def test_wrap_up_fires_only_after_min_turns():
+    policy = TutorWrapUp(min_turns=3)
+    assert policy.should_stop(state(1, fake_llm.wrap_up_reply)) is None
+    assert policy.should_stop(state(2, fake_llm.wrap_up_reply)) is None
+    assert policy.should_stop(state(3, fake_llm.wrap_up_reply)) == "tutor_wrap_up"
+
+def test_wrap_up_needs_the_phrase():
+    policy = TutorWrapUp(min_turns=3)
+    assert policy.should_stop(state(5, "Let's plan the free body diagram. What forces act on the ladder?")) is None
+    assert policy.should_stop(state(5, "Happy problem-solving!")) == "tutor_wrap_up"
+
+def test_first_policy_to_fire_names_the_reason():
+    policy = build_stop_policy(max_turns=4)
+    assert policy.should_stop(state(4, "Good luck!")) == "tutor_wrap_up"
+    assert policy.should_stop(state(4, "Next question?")) == "max_turns"
+    assert MaxTurns(4).should_stop(state(3, "")) is None
+
+def test_session_runs_to_min_turns_when_the_tutor_wraps_up_early(monkeypatch):
+    # The fake tutor says goodbye from its second turn on; the opening turns are protected
+    backend = fake_llm.FakeLLMBackend(fake_llm.FakeLLMConfig(latency_ms=1, latency_sigma=0.0, wrap_up_after=2))
+    monkeypatch.setattr("llm_backend.active_backend", backend)
+    progress = RunProgress.start("early", batch_runner.parse_profile("1:lowMotivation"))
+    asyncio.run(batch_runner.run_session(progress, build_stop_policy(), evaluate=False))
+    assert (progress.turns, progress.stop_reason) == (3, "tutor_wrap_up")
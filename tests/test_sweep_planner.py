@@ -0,0 +1,107 @@
+import random
+import utils
+import pytest
+import sweep_planner
+
+from collections import Counter
+from dataclasses import fields
+from physics_student import StudentProfile, profile_gen, style_generate
+from sweep_planner import spaces, full_factorial, random_cells, stratified, latin_hypercube, plan, Job
+
+simplified = spaces["simplified"]
+full = spaces["full"]
+
+def key(cell):
+    return tuple(sorted(cell.items()))
+
+def test_cell_at_follows_the_full_factorial_order():
+    assert [simplified.cell_at(i) for i in range(simplified.size)] == list(full_factorial(simplified))
+    assert full.cell_at(full.size - 1) == {factor: levels[-1] for factor, levels in full.factors.items()}
+
+@pytest.mark.parametrize("space", [simplified, full], ids=lambda s: s.name)
+def test_full_factorial_covers_every_cell_once(space):
+    cells = [key(cell) for cell in full_factorial(space)]
+    assert len(cells) == len(set(cells)) == space.size
+
+def test_random_cells_are_distinct_and_seeded():
+    cells = [key(c) for c in random_cells(full, 200, random.Random(1))]
+    assert len(cells) == len(set(cells)) == 200
+    assert cells == [key(c) for c in random_cells(full, 200, random.Random(1))]
+    # Asking for more than the space holds returns the whole space
+    assert len({key(c) for c in random_cells(simplified, 1000, random.Random(1))}) == simplified.size
+
+@pytest.mark.parametrize("samples", [25, 27])
+def test_stratified_splits_samples_evenly_across_strata(samples):
+    cells = list(stratified(full, samples, random.Random(2)))
+    assert len(cells) == samples
+    counts = Counter(cell["knowledge_level"] for cell in cells)
+    assert set(counts) == set(full.factors["knowledge_level"])
+    assert max(counts.values()) - min(counts.values()) <= 1
+    # Cells are complete and keep the space's factor order
+    assert all(list(cell) == list(full.factors) for cell in cells)
+
+def test_stratified_on_two_factors():
+    cells = list(stratified(full, 13 * 5 * 2, random.Random(3), strata=("knowledge_level", "engagement_style")))
+    counts = Counter((c["knowledge_level"], c["engagement_style"]) for c in cells)
+    assert len(counts) == 13 * 5 and set(counts.values()) == {2}
+
+def test_latin_hypercube_hits_every_level_once_per_block():
+    # 65 samples are 13 blocks of the 5 knowledge levels and 5 blocks of the 13 engagement styles
+    cells = list(latin_hypercube(full, 65, random.Random(4)))
+    for factor, levels in full.factors.items():
+        column = [cell[factor] for cell in cells]
+        for start in range(0, 65, len(levels)):
+            assert sorted(column[start:start + len(levels)]) == sorted(levels)
+
+def test_latin_hypercube_pairs_levels_at_random():
+    cells = [key(c) for c in latin_hypercube(full, 65, random.Random(4))]
+    assert len(set(cells)) > 60
+
+@pytest.mark.parametrize("samples", [1, 7, 12, 31])
+def test_latin_hypercube_is_balanced_within_one(samples):
+    cells = list(latin_hypercube(full, samples, random.Random(samples)))
+    assert len(cells) == samples
+    for factor, levels in full.factors.items():
+        counts = Counter(cell[factor] for cell in cells)
+        assert max(counts.values()) - min(counts.get(level, 0) for level in levels) <= 1
+        assert max(counts.values()) == -(-samples // len(levels))
+
+def test_plan_skips_completed_runs():
+    cells = list(full_factorial(simplified))[:3]
+    done = str(simplified.profile(cells[0]))
+    partly = str(simplified.profile(cells[1]))
+    jobs = list(plan(simplified, cells, runs_per_cell=2, completed={done: 5, partly: 1}))
+    assert Counter(key(job.cell) for job in jobs) == {key(cells[1]): 1, key(cells[2]): 2}
+    assert all(job.space == "simplified" for job in jobs)
+
+def test_plan_asks_again_for_a_cell_produced_twice():
+    cell = simplified.cell_at(0)
+    jobs = list(plan(simplified, [cell, cell], completed={str(simplified.profile(cell)): 1}))
+    assert len(jobs) == 1
+
+def test_jobs_round_trip(tmp_path):
+    jobs = [Job("full", full.cell_at(7)), Job("simplified", simplified.cell_at(8))]
+    path = str(tmp_path / "jobs.jsonl")
+    assert sweep_planner.write_jobs(iter(jobs), path) == 2
+    assert sweep_planner.read_jobs(path) == jobs
+
+def test_profile_gen_keeps_its_shape():
+    random.seed(5)
+    profile = profile_gen()
+    assert isinstance(profile, StudentProfile)
+    assert [f.name for f in fields(profile)] == ["knowledge_level", "engagement_style", "misconceptions", "confidence", "expressiveness", "pacing", "traits"]
+    assert profile.misconceptions == ["Confusing static equilibrium"]
+    assert profile.traits is None
+    for name, levels in [("knowledge_level", utils.student_knowledge_levels), ("engagement_style", utils.student_engagement_styles),
+                         ("confidence", utils.student_confidence_levels), ("expressiveness", utils.student_expressiveness_levels),
+                         ("pacing", utils.student_pacing_styles)]:
+        assert getattr(profile, name) in {style_generate(level, levels) for level in levels}
+    # Same rendering as the full space's profile of the same cell
+    cell = {factor: next(level for level in levels if style_generate(level, getattr(utils, source)) == getattr(profile, factor))
+            for factor, levels, source in [
+                ("engagement_style", full.factors["engagement_style"], "student_engagement_styles"),
+                ("knowledge_level", full.factors["knowledge_level"], "student_knowledge_levels"),
+                ("expressiveness", full.factors["expressiveness"], "student_expressiveness_levels"),
+                ("pacing", full.factors["pacing"], "student_pacing_styles"),
+                ("confidence", full.factors["confidence"], "student_confidence_levels")]}
+    assert full.profile(cell) == profile
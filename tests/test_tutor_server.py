@@ -0,0 +1,214 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+import client_registry
+import llm_backend
+import rate_limiter
+
+from contextlib import asynccontextmanager
+from fake_llm import FakeLLMBackend, FakeLLMConfig, wrap_up_reply
+from stop_policy import build_stop_policy
+from tutor_server import TutorServer, SessionStore, AdmissionGate, HTTPError
+
+def tutor_server(max_sessions=10, idle_timeout=60.0, max_queue=8, queue_timeout=5.0):
+    return TutorServer(SessionStore(max_sessions=max_sessions, idle_timeout=idle_timeout),
+                       AdmissionGate(max_queue=max_queue, queue_timeout=queue_timeout), build_stop_policy(), api_key="test")
+
+@asynccontextmanager
+async def serving(server):
+    # The server on an ephemeral local port, with a client pointed at it
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        async with listener, httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+            yield client
+    finally:
+        await client_registry.aclose()
+
+def run(server, scenario):
+    async def main():
+        async with serving(server) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+def sse_events(text):
+    # (event, data) pairs; data-only events are named "message" as in the SSE spec
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        data = fields["data"]
+        events.append((fields.get("event", "message"), data if data == "[DONE]" else json.loads(data)))
+    return events
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    # Replies slow enough for a second request to arrive while the first is in flight
+    backend = FakeLLMBackend(FakeLLMConfig(latency_ms=300, latency_sigma=0.0))
+    monkeypatch.setattr(llm_backend, "active_backend", backend)
+    return backend
+
+def test_session_turns_until_the_tutor_wraps_up(fake_backend):
+    async def scenario(client):
+        created = await client.post("/sessions")
+        assert created.status_code == 201
+        session_id = created.json()["session_id"]
+        results = []
+        for turn in range(fake_backend.config.wrap_up_after):
+            response = await client.post(f"/sessions/{session_id}/messages", json={"message": f"Student message {turn}"})
+            assert response.status_code == 200
+            results.append(response.json())
+        ended = await client.post(f"/sessions/{session_id}/messages", json={"message": "One more?"})
+        session = (await client.get(f"/sessions/{session_id}")).json()
+        closed = await client.delete(f"/sessions/{session_id}")
+        gone = await client.get(f"/sessions/{session_id}")
+        return results, ended, session, closed, gone
+
+    results, ended, session, closed, gone = run(tutor_server(), scenario)
+    assert [r["turn"] for r in results] == [1, 2, 3, 4]
+    assert [r["stop_reason"] for r in results] == [None, None, None, "tutor_wrap_up"]
+    assert results[-1]["reply"] == wrap_up_reply and all(r["reply"] and r["latency"] >= 0 for r in results)
+    assert ended.status_code == 409 and "tutor_wrap_up" in ended.json()["error"]
+    assert session["turns"] == 4 and session["llm_calls"] == 4 and session["input_tokens"] > 0
+    assert [m["role"] for m in session["messages"]] == ["user", "assistant"] * 4
+    assert session["messages"][-1]["content"] == wrap_up_reply
+    assert closed.status_code == 200 and gone.status_code == 404
+
+def test_streamed_turn_ends_with_a_done_event(fake_backend):
+    async def scenario(client):
+        session_id = (await client.post("/sessions")).json()["session_id"]
+        streamed = await client.post(f"/sessions/{session_id}/messages?stream=1", json={"message": "Can you help me?"})
+        by_header = await client.post(f"/sessions/{session_id}/messages", json={"message": "What next?"},
+                                      headers={"Accept": "text/event-stream"})
+        session = (await client.get(f"/sessions/{session_id}")).json()
+        return streamed, by_header, session
+
+    streamed, by_header, session = run(tutor_server(), scenario)
+    assert streamed.status_code == 200 and streamed.headers["content-type"] == "text/event-stream"
+    events = sse_events(streamed.text)
+    names = [name for name, _ in events]
+    assert names == ["delta"] * (len(events) - 1) + ["done"] and len(events) > 2
+    done = events[-1][1]
+    assert done["turn"] == 1 and done["stop_reason"] is None
+    assert "".join(data["delta"] for _, data in events[:-1]) == done["reply"]
+    assert sse_events(by_header.text)[-1][1]["turn"] == 2
+    assert session["messages"][1] == {"role": "assistant", "content": done["reply"]}
+    assert session["first_token_p50"] is not None
+
+def test_a_second_message_during_a_turn_is_refused(slow_backend):
+    async def scenario(client):
+        session_id = (await client.post("/sessions")).json()["session_id"]
+        first = asyncio.create_task(client.post(f"/sessions/{session_id}/messages", json={"message": "first"}))
+        await asyncio.sleep(0.1)
+        second = await client.post(f"/sessions/{session_id}/messages", json={"message": "second"})
+        return await first, second, (await client.get(f"/sessions/{session_id}")).json()
+
+    first, second, session = run(tutor_server(), scenario)
+    assert first.status_code == 200 and first.json()["turn"] == 1
+    assert second.status_code == 409
+    # The refused message never reached the tutor
+    assert [m["content"] for m in session["messages"] if m["role"] == "user"] == ["first"]
+
+@pytest.mark.parametrize("max_queue, message", [(0, "saturated"), (1, "Timed out")], ids=["queue_full", "queue_timeout"])
+def test_turns_beyond_the_gate_get_a_503(slow_backend, max_queue, message):
+    rate_limiter.configure("openai", max_concurrency=1)
+
+    async def scenario(client):
+        sessions = [(await client.post("/sessions")).json()["session_id"] for _ in range(2)]
+        first = asyncio.create_task(client.post(f"/sessions/{sessions[0]}/messages", json={"message": "first"}))
+        await asyncio.sleep(0.1)
+        second = await client.post(f"/sessions/{sessions[1]}/messages", json={"message": "second"})
+        return await first, second, (await client.get("/metrics")).json()
+
+    first, second, metrics = run(tutor_server(max_queue=max_queue, queue_timeout=0.05), scenario)
+    assert first.status_code == 200
+    assert second.status_code == 503 and message in second.json()["error"] and int(second.headers["retry-after"]) >= 1
+    assert metrics["turns"]["rejected"] == 1 and metrics["turns"]["completed"] == 1 and metrics["turns"]["capacity"] == 1
+
+def test_idle_sessions_are_evicted():
+    server = tutor_server(idle_timeout=60.0)
+    stale, fresh = server.create_session(), server.create_session()
+    stale.last_active -= 120
+    assert server.store.evict_idle() == 1
+    assert list(server.store.sessions) == [fresh.session_id] and server.store.evicted_idle == 1
+    with pytest.raises(HTTPError) as error:
+        server.store.get(stale.session_id)
+    assert error.value.status == 404
+
+def test_a_session_with_a_turn_in_flight_is_never_idle():
+    async def scenario():
+        server = tutor_server(idle_timeout=60.0)
+        session = server.create_session()
+        async with session.lock:
+            assert server.store.evict_idle(time.monotonic() + 3600) == 0
+        assert server.store.evict_idle(time.monotonic() + 3600) == 1
+    asyncio.run(scenario())
+
+def test_least_recently_used_idle_session_makes_room():
+    async def scenario():
+        server = tutor_server(max_sessions=2)
+        first, second = server.create_session(), server.create_session()
+        server.store.get(first.session_id)
+        third = server.create_session()
+        assert list(server.store.sessions) == [first.session_id, third.session_id]
+        assert server.store.evicted_capacity == 1
+        # With every session mid-turn there is nothing to evict
+        async with first.lock, third.lock:
+            with pytest.raises(HTTPError) as error:
+                server.create_session()
+        assert error.value.status == 503 and error.value.headers["Retry-After"]
+        assert server.store.created == 3
+    asyncio.run(scenario())
+
+def chat_request(stream=False):
+    return {"model": "tutor", "stream": stream, "messages": [
+        {"role": "system", "content": "Replaced by the tutor prompt"}, {"role": "user", "content": "Can you help me?"},
+        {"role": "assistant", "content": "Sure, what is the question?"}, {"role": "user", "content": "What is the net force?"}]}
+
+def test_chat_completions(fake_backend):
+    async def scenario(client):
+        plain = await client.post("/v1/chat/completions", json=chat_request())
+        streamed = await client.post("/v1/chat/completions", json=chat_request(stream=True))
+        invalid = await client.post("/v1/chat/completions", json={"messages": [{"role": "assistant", "content": "Hi"}]})
+        return plain, streamed, invalid, (await client.get("/metrics")).json()
+
+    plain, streamed, invalid, metrics = run(tutor_server(), scenario)
+    completion = plain.json()
+    assert plain.status_code == 200 and completion["object"] == "chat.completion"
+    assert completion["choices"][0]["message"]["role"] == "assistant" and completion["choices"][0]["finish_reason"] == "stop"
+    usage = completion["usage"]
+    assert usage["prompt_tokens"] > 0 and usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+    events = [data for _, data in sse_events(streamed.text)]
+    assert events[-1] == "[DONE]"
+    chunks, final = events[:-2], events[-2]
+    assert all(chunk["object"] == "chat.completion.chunk" and chunk["choices"][0]["finish_reason"] is None for chunk in chunks)
+    # The same conversation gets the same reply, streamed or not
+    assert "".join(chunk["choices"][0]["delta"]["content"] for chunk in chunks) == completion["choices"][0]["message"]["content"]
+    assert final["choices"][0]["finish_reason"] == "stop" and final["usage"] == usage
+
+    assert invalid.status_code == 400
+    # Stateless: no session is kept
+    assert metrics["sessions"]["live"] == 0 and metrics["turns"]["completed"] == 2
+
+def test_metrics(fake_backend):
+    async def scenario(client):
+        session_id = (await client.post("/sessions")).json()["session_id"]
+        for turn in range(2):
+            await client.post(f"/sessions/{session_id}/messages", json={"message": f"Student message {turn}"})
+        await client.post(f"/sessions/{session_id}/messages?stream=1", json={"message": "Streamed"})
+        await client.post("/sessions")
+        await client.delete(f"/sessions/{session_id}")
+        missing = await client.post("/sessions/unknown/messages", json={"message": "hi"})
+        return missing, (await client.get("/metrics")).json()
+
+    missing, metrics = run(tutor_server(), scenario)
+    assert missing.status_code == 404
+    assert metrics["sessions"] == {"live": 1, "created": 2, "closed": 1, "evicted_idle": 0, "evicted_capacity": 0}
+    turns = metrics["turns"]
+    assert (turns["completed"], turns["failed"], turns["in_flight"], turns["queued"], turns["rejected"]) == (3, 0, 0, 0, 0)
+    assert turns["queue_wait_avg"] is not None
+    assert all(metrics["turn_latency"][p] is not None for p in ("p50", "p95", "p99"))
+    assert metrics["first_token_latency"]["p50"] is not None
+    assert metrics["upstream"].startswith("openai limiter: 3 calls")